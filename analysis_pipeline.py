@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+from repo_analyzer import analyze_repo
+from github_gateway import GitHubGateway
+from contribution_store import sync_repository_async
+from heatmap import generate_visual_attributes, generate_heatmap_json
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AnalysisPipeline:
+    """The steps of one user's analysis, shared by `LLMInference` and the offline benchmark.
+
+    Subclasses set `model`, `tokenizer`, `scheduler` (the micro-batch scheduler over the
+    inference backend), `result_store` and `contribution_store`, and implement
+    `_github()` to return the `AsyncGitHubClient` to query with.
+    """
+
+    def _github(self):
+        raise NotImplementedError
+
+    async def _contributions(self, username: str, repo_name: str, head_oid: str) -> Dict[str, Any]:
+        """Sync the repository's new commits and PRs, then read the stored daily commit counts."""
+        await sync_repository_async(self._github(), self.contribution_store, username, repo_name, head_oid=head_oid)
+        return self.contribution_store.structured_data(username, repo_name, contribution_types=("commit",))
+
+    async def _readme_summary(self, username: str, readme_content: Optional[str]) -> Dict[str, Any]:
+        """Structured README data, cached by the README's blob hash in the result store."""
+        from readme_extraction import readme_extraction
+
+        # Off the event loop; its prompt is batched with the insight stages' prompts
+        readme = await asyncio.to_thread(
+            readme_extraction, self.model, self.tokenizer, username, None,
+            readme_content=readme_content or "", llm=self.scheduler, store=self.result_store
+        )
+        return readme.dict()
+
+    async def _analyze_gateway(self, username: str, gateway: GitHubGateway, mode: str = "chained", check_cache: bool = True) -> Dict[str, Any]:
+        github_token = self._github().github_token
+        user_profile = gateway.user_profile()
+        repo_info = gateway.repo_info()
+
+        if check_cache:
+            cached = self.result_store.get(username, repo_info["name"], repo_info["head_oid"], mode)
+            if cached is not None:
+                cached["user_profile"] = user_profile
+                return cached
+
+        # Analyze repo and README off the event loop; their prompts are batched with other inputs'
+        repo_analysis, readme_summary = await asyncio.gather(
+            asyncio.to_thread(
+                analyze_repo, username, github_token, self.model, self.tokenizer,
+                repo_data=gateway.repo_metrics(), llm=self.scheduler, mode=mode
+            ),
+            self._readme_summary(username, gateway.readme())
+        )
+
+        # Process contributions for heatmap
+        processed_contributions = await self._contributions(username, repo_info["name"], repo_info["head_oid"])
+        insights = generate_visual_attributes(processed_contributions)
+        heatmap_json = generate_heatmap_json(processed_contributions, insights)
+
+        final_output = {
+            "user_profile": user_profile,
+            "repo_analysis": repo_analysis,
+            "heatmap_data": heatmap_json,
+            "readme_analysis": gateway.readme(),
+            "readme_summary": readme_summary
+        }
+        self.result_store.put(username, repo_info["name"], repo_info["head_oid"], mode, final_output)
+        self.result_store.put_profile(username, user_profile)
+        return final_output
@@ -0,0 +1,264 @@
+from typing import Dict, Any, List, Optional
+import os
+import json
+import logging
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from repo_analyzer import ANALYSIS_MODES
+from contribution_rollup import RESOLUTIONS, parse_day
+from github_gateway import chunk_usernames
+from repo_selection import SORT_KEYS
+from github_client import AsyncGitHubClient
+from github_scheduler import RateLimitExceeded, get_token_pool
+from result_store import fetch_head_async
+from job_store import JobStore, QueueFullError
+from heatmap import fetch_structured_contributions_async, generate_heatmap_json, generate_visual_attributes
+from telemetry import METRICS, log_payload, published_snapshots, render_prometheus
+
+# The web tier only relays requests to the GPU class, so nothing here may import
+# torch, transformers or outlines; import_time_check.py guards this.
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_USERS = 100
+# Each selected repository is a full analysis, so one request may ask for only so many
+MAX_TOP_REPOS = 20
+# Distinguishes this web container's series from the others' in /metrics
+WEB_INSTANCE = os.getenv("MODAL_TASK_ID", f"web-{os.getpid()}")
+
+class BatchAnalyzeRequest(BaseModel):
+    usernames: List[str]
+    # "fused" runs all insight tiers in one generation, for throughput-bound jobs
+    mode: str = "chained"
+
+class JobSubmission(BaseModel):
+    username: str
+    mode: str = "chained"
+    # Receives the finished job as a JSON POST
+    callback_url: Optional[str] = None
+
+def format_stream_event(event: Dict[str, Any], format: str) -> str:
+    if format == "sse":
+        return f"event: {event['section']}\ndata: {json.dumps(event['data'])}\n\n"
+    return json.dumps(event) + "\n"
+
+def check_mode(mode: str) -> None:
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(ANALYSIS_MODES)}")
+
+def check_sort_by(sort_by: str) -> None:
+    if sort_by not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {sorted(SORT_KEYS)}")
+
+def rate_limited(e: RateLimitExceeded) -> HTTPException:
+    # GitHub's budget is spent, not our service broken: tell clients when to come back
+    return HTTPException(
+        status_code=429,
+        detail=f"GitHub rate limit reached: {str(e)}",
+        headers={"Retry-After": str(max(1, int(e.retry_after)))}
+    )
+
+def create_app(llm, job_dict, metrics_dict=None) -> FastAPI:
+    """Build the API around a handle to the `LLMInference` class and the shared dicts.
+
+    `metrics_dict` holds the inference containers' published metrics for `/metrics`.
+    """
+    app = FastAPI()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.get("/api/analyze")
+    async def analyze_endpoint(username: str, mode: str = "chained"):
+        check_mode(mode)
+        try:
+            # Use the llm instance to call analyze_repos
+            structured_output = await llm.analyze_repos.remote.aio(username, mode=mode)
+            log_payload(logger, "API response", structured_output)
+            return structured_output
+        except RateLimitExceeded as e:
+            raise rate_limited(e)
+        except Exception as e:
+            logger.error(f"Failed to analyze repos: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to analyze repos: {str(e)}")
+
+    @app.get("/api/heatmap")
+    async def heatmap_endpoint(
+        username: str,
+        start: Optional[str] = Query(None, alias="from"),
+        end: Optional[str] = Query(None, alias="to"),
+        resolution: str = "day",
+        repo: Optional[str] = None
+    ):
+        if resolution not in RESOLUTIONS:
+            raise HTTPException(status_code=400, detail=f"resolution must be one of {list(RESOLUTIONS)}")
+        try:
+            for date in (start, end):
+                if date:
+                    parse_day(date)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            return await llm.contribution_heatmap.remote.aio(username, start=start, end=end, resolution=resolution, repo=repo)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    @app.get("/api/heatmap/history")
+    async def heatmap_history_endpoint(
+        username: str,
+        repo: str,
+        start: Optional[str] = Query(None, alias="from"),
+        end: Optional[str] = Query(None, alias="to"),
+        max_pages: Optional[int] = Query(None, ge=1),
+        max_cost: Optional[int] = Query(None, ge=1)
+    ):
+        """Heatmap of the repository's full commit and merged PR history, streamed from GitHub.
+
+        The stored counts behind /api/heatmap start from a repository's latest page of
+        history; this covers all of it, unless `max_pages` or `max_cost` cut it short.
+        """
+        try:
+            for date in (start, end):
+                if date:
+                    parse_day(date)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            async with AsyncGitHubClient(pool=get_token_pool()) as client:
+                structured_data = await fetch_structured_contributions_async(
+                    username, repo, client, since=start, until=end, max_pages=max_pages, max_cost=max_cost
+                )
+        except RateLimitExceeded as e:
+            raise rate_limited(e)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return generate_heatmap_json(structured_data, generate_visual_attributes(structured_data))
+
+    @app.post("/api/jobs", status_code=202)
+    async def submit_job_endpoint(submission: JobSubmission):
+        check_mode(submission.mode)
+        try:
+            # The job is identified by the repository HEAD, so retries reuse finished work
+            async with AsyncGitHubClient(pool=get_token_pool()) as client:
+                head = await fetch_head_async(client, submission.username, with_profile=False)
+        except RateLimitExceeded as e:
+            raise rate_limited(e)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+        # modal.Dict calls block, so the job store runs off the event loop
+        jobs = JobStore(job_dict)
+        try:
+            job, created = await run_in_threadpool(
+                jobs.submit,
+                submission.username, head["repo"], head["head_oid"], submission.mode,
+                callback_url=submission.callback_url
+            )
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=f"Too many pending jobs: {str(e)}")
+
+        if created:
+            await llm.run_job.spawn.aio(job["id"])
+        return jobs.public_view(job)
+
+    @app.get("/api/jobs/{job_id}")
+    async def get_job_endpoint(job_id: str):
+        jobs = JobStore(job_dict)
+        job = await run_in_threadpool(jobs.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        # A job whose worker was lost goes back on the queue the next time it is polled
+        job, requeued = await run_in_threadpool(jobs.recover, job)
+        if requeued:
+            await llm.run_job.spawn.aio(job["id"])
+        return jobs.public_view(job)
+
+    @app.get("/api/analyze/stream")
+    async def analyze_stream_endpoint(username: str, mode: str = "chained", format: str = "ndjson"):
+        check_mode(mode)
+        if format not in ("ndjson", "sse"):
+            raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+
+        async def events():
+            try:
+                async for event in llm.analyze_repos_stream.remote_gen.aio(username, mode=mode):
+                    yield format_stream_event(event, format)
+                yield format_stream_event({"section": "done", "data": None}, format)
+            except RateLimitExceeded as e:
+                logger.warning(f"Stream stopped by the GitHub rate limit: {str(e)}")
+                yield format_stream_event({"section": "error", "data": {"detail": str(e), "retry_after": e.retry_after}}, format)
+            except Exception as e:
+                # Headers are already sent, so failures are reported in-band
+                logger.error(f"Failed to stream analysis: {str(e)}")
+                yield format_stream_event({"section": "error", "data": {"detail": str(e)}}, format)
+
+        media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+        return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.post("/api/analyze/batch")
+    async def analyze_batch_endpoint(batch: BatchAnalyzeRequest):
+        check_mode(batch.mode)
+        # Deduplicate while keeping the caller's order
+        usernames = list(dict.fromkeys(batch.usernames))
+        if not usernames:
+            raise HTTPException(status_code=400, detail="At least one username is required")
+        if len(usernames) > MAX_BATCH_USERS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_USERS} usernames per batch")
+
+        # Each chunk is one aliased GraphQL query; chunks fan out across containers
+        chunks = chunk_usernames(usernames)
+        results: Dict[str, Dict[str, Any]] = {}
+        chunk_outputs = [output async for output in llm.analyze_batch.map.aio(chunks, kwargs={"mode": batch.mode}, return_exceptions=True)]
+        for chunk, chunk_results in zip(chunks, chunk_outputs):
+            if isinstance(chunk_results, Exception):
+                logger.error(f"Failed to analyze batch chunk {chunk}: {str(chunk_results)}")
+                chunk_results = {username: {"status": "error", "error": str(chunk_results)} for username in chunk}
+            results.update(chunk_results)
+        return {username: results[username] for username in usernames}
+
+    @app.get("/api/analyze/repos")
+    async def analyze_user_repos_endpoint(
+        username: str,
+        top_n: int = Query(5, ge=1, le=MAX_TOP_REPOS),
+        sort_by: str = "stars",
+        include_archived: bool = False,
+        include_forks: bool = False,
+        mode: str = "chained"
+    ):
+        check_mode(mode)
+        check_sort_by(sort_by)
+        try:
+            return await llm.analyze_user_repos.remote.aio(
+                username, top_n=top_n, sort_by=sort_by,
+                include_archived=include_archived, include_forks=include_forks, mode=mode
+            )
+        except RateLimitExceeded as e:
+            raise rate_limited(e)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.error(f"Failed to analyze repos: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to analyze repos: {str(e)}")
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_endpoint():
+        # This container's own metrics, plus the latest each inference container published
+        sources = [({"process": "web", "instance": WEB_INSTANCE}, METRICS.snapshot())]
+        if metrics_dict is not None:
+            try:
+                sources += [({"process": "inference", "instance": instance}, snapshot) for instance, snapshot in await run_in_threadpool(published_snapshots, metrics_dict)]
+            except Exception as e:
+                logger.warning(f"Failed to read published metrics: {str(e)}")
+        return PlainTextResponse(render_prometheus(sources), media_type="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from telemetry import record_generation
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 25
+
+class MicroBatchScheduler:
+    """Coalesce concurrent constrained generations into padded batches.
+
+    Callers on any thread `submit` a prompt for a schema and block until its result is
+    ready. A single worker thread owns the model: it waits up to `max_wait_ms` after the
+    first pending prompt for more prompts of the same schema to arrive, then runs up to
+    `max_batch_size` of them as one batch and hands each caller its own result.
+    """
+
+    def __init__(
+        self,
+        registry,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        # Anything with `get(schema) -> generator`, normally a GeneratorRegistry
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Token counts for the metrics; about four characters per token without a tokenizer
+        self.count_tokens = count_tokens or (lambda text: (len(text) + 3) // 4)
+        # Pending prompts per schema, oldest schema first
+        self._pending: "OrderedDict[Type[BaseModel], List[Tuple[str, Future, float]]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="micro-batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, schema: Type[BaseModel], prompt: str) -> BaseModel:
+        future: Future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("MicroBatchScheduler has been stopped")
+            self._pending.setdefault(schema, []).append((prompt, future, time.monotonic()))
+            self._condition.notify()
+        return future.result()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _next_batch(self) -> Optional[Tuple[Type[BaseModel], List[Tuple[str, Future, float]]]]:
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+            if not self._pending:
+                return None
+
+            # Serve the schema whose oldest prompt has waited longest, once it has either
+            # filled a batch or used up its wait window
+            schema, queue = next(iter(self._pending.items()))
+            deadline = queue[0][2] + self.max_wait
+            while len(queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch, rest = queue[:self.max_batch_size], queue[self.max_batch_size:]
+            if rest:
+                self._pending[schema] = rest
+                self._pending.move_to_end(schema)
+            else:
+                del self._pending[schema]
+            return schema, batch
+
+    def _run(self) -> None:
+        while True:
+            next_batch = self._next_batch()
+            if next_batch is None:
+                return
+            schema, batch = next_batch
+            prompts = [prompt for prompt, _, _ in batch]
+            try:
+                generator = self.registry.get(schema)
+                started = time.monotonic()
+                results = generator(prompts)
+                elapsed = time.monotonic() - started
+                logger.info(f"Generated {schema.__name__} batch of {len(prompts)} in {elapsed:.2f}s")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+            # Counted after the callers are released, so tokenizing adds no latency
+            try:
+                record_generation(
+                    schema.__name__,
+                    sum(self.count_tokens(prompt) for prompt in prompts),
+                    sum(self.count_tokens(result.model_dump_json()) for result in results),
+                    len(prompts),
+                    elapsed
+                )
+            except Exception as e:
+                logger.warning(f"Failed to record generation metrics: {str(e)}")
@@ -0,0 +1,221 @@
+"""Throughput of the inference backends on the analysis workload.
+
+Runs `analyze_repo` for a fixed set of synthetic repositories through the
+micro-batch scheduler, as `LLMInference` does, and reports analyses, prompts and
+generated tokens per second at each concurrency level:
+
+    python -m benchmarks.backends --backend stub                         # harness only, no model
+    python -m benchmarks.backends --backend llamacpp --gguf model.gguf --tune-threads --output cpu.json
+    modal run main.py::benchmark_inference_backend > gpu.json            # the A10G path
+    INFERENCE_BACKEND=llamacpp modal run main.py::benchmark_inference_backend > cpu.json
+    python -m benchmarks.backends --compare gpu.json cpu.json
+
+The GPU path can only be measured where it runs, hence the Modal entry point; the
+comparison reads the JSON reports the runs write.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+from pydantic import BaseModel
+
+from benchmarks.fake_github import SyntheticGitHub
+from benchmarks.stub_model import StubRegistry
+from inference_backend import InferenceBackend, available_cpus
+
+DEFAULT_REPOS = 8
+DEFAULT_CONCURRENCY = (1, 4, 8)
+BENCH_TOKEN = "benchmark-token"
+
+class StubBackend(InferenceBackend):
+    """The stub model behind the backend interface, for checking the harness itself."""
+
+    name = "stub"
+    max_batch_size = 8
+
+    def __init__(self):
+        self.registry = StubRegistry()
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        return self.registry.get(schema)
+
+class CountingBackend(InferenceBackend):
+    """Wraps a backend to count the prompts, batches and generated tokens that go through it."""
+
+    def __init__(self, backend: InferenceBackend):
+        self.backend = backend
+        self.name = backend.name
+        self.max_batch_size = backend.max_batch_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.batches = 0
+        self.prompts = 0
+        self.completion_tokens = 0
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        generator = self.backend.get(schema)
+
+        def generate(prompts):
+            results = generator(prompts)
+            outputs = [results] if isinstance(prompts, str) else results
+            tokens = sum(self.backend.count_tokens(output.model_dump_json()) for output in outputs)
+            with self._lock:
+                self.batches += 1
+                self.prompts += len(outputs)
+                self.completion_tokens += tokens
+            return results
+        return generate
+
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+
+    def describe(self) -> Dict[str, Any]:
+        return self.backend.describe()
+
+def workload(repos: int) -> List[Dict[str, Any]]:
+    """Repository and derived metrics for `repos` synthetic users, the same on every run."""
+    from github_gateway import build_repo_metrics
+    from repo_analyzer import compute_derived_metrics
+
+    synthetic = SyntheticGitHub()
+    metrics = [build_repo_metrics(synthetic.repository(f"bench-backend-{i}", with_history=False)) for i in range(repos)]
+    return [{**row, **derived} for row, derived in zip(metrics, compute_derived_metrics(metrics))]
+
+def bench_backend(
+    backend: InferenceBackend,
+    repos: int = DEFAULT_REPOS,
+    concurrency_levels: Sequence[int] = DEFAULT_CONCURRENCY,
+    modes: Optional[Sequence[str]] = None
+) -> Dict[str, Dict[str, Any]]:
+    from batching import MicroBatchScheduler
+    from repo_analyzer import analyze_repo, ANALYSIS_MODES
+
+    counting = CountingBackend(backend)
+    repo_data = workload(repos)
+    results = {}
+    for mode in modes or ANALYSIS_MODES:
+        for concurrency in concurrency_levels:
+            batched = backend.max_batch_size > 1
+            scheduler = MicroBatchScheduler(
+                counting,
+                max_batch_size=min(concurrency, backend.max_batch_size),
+                max_wait_ms=25 if batched else 0,
+                count_tokens=backend.count_tokens
+            )
+            counting.reset()
+            try:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(concurrency) as pool:
+                    list(pool.map(
+                        lambda data: analyze_repo(data["repo_name"], BENCH_TOKEN, None, None, repo_data=data, llm=scheduler, mode=mode),
+                        repo_data
+                    ))
+                seconds = time.perf_counter() - started
+            finally:
+                scheduler.stop()
+            results[f"{mode}[concurrency={concurrency}]"] = {
+                "seconds": round(seconds, 3),
+                "analyses_per_second": round(repos / seconds, 3),
+                "prompts_per_second": round(counting.prompts / seconds, 3),
+                "tokens_per_second": round(counting.completion_tokens / seconds, 1),
+                "mean_batch_size": round(counting.prompts / counting.batches, 2) if counting.batches else 0
+            }
+            print(f"{backend.name:<14} {mode}[concurrency={concurrency}]: {results[f'{mode}[concurrency={concurrency}]']}", file=sys.stderr)
+    return results
+
+def tune_backend_threads(backend: InferenceBackend) -> Optional[Dict[str, Any]]:
+    """Pick llama.cpp's decode thread count on a surface-insights prompt; None for other backends."""
+    from inference_backend import LlamaCppBackend, tune_threads
+    from repo_analyzer import SurfaceInsights, build_stage_prompt, SURFACE_INSTRUCTION
+
+    if not isinstance(backend, LlamaCppBackend):
+        return None
+    return tune_threads(backend, SurfaceInsights, [build_stage_prompt(workload(1)[0], [], SURFACE_INSTRUCTION)])
+
+def run(
+    backend: InferenceBackend,
+    repos: int = DEFAULT_REPOS,
+    concurrency_levels: Sequence[int] = DEFAULT_CONCURRENCY,
+    modes: Optional[Sequence[str]] = None,
+    tune: bool = False
+) -> Dict[str, Any]:
+    """The full report for one backend: thread tuning when asked, then the throughput runs."""
+    threads = tune_backend_threads(backend) if tune else None
+    results = bench_backend(backend, repos, concurrency_levels, modes)
+    return {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": available_cpus()},
+        "backend": backend.describe(),
+        "thread_tuning": threads,
+        "repos": repos,
+        "results": results
+    }
+
+def compare(reports: List[Dict[str, Any]]) -> None:
+    """Print tokens and analyses per second of each report side by side, relative to the first."""
+    names = [report["backend"]["backend"] for report in reports]
+    print(f"{'run':<24}" + "".join(f"{name + ' tok/s':>20}{'analyses/s':>12}" for name in names) + f"{'vs first':>10}")
+    for key, first in reports[0]["results"].items():
+        line = f"{key:<24}"
+        for report in reports:
+            result = report["results"].get(key)
+            if result is None:
+                line += f"{'-':>20}{'-':>12}"
+                continue
+            line += f"{result['tokens_per_second']:>20}{result['analyses_per_second']:>12}"
+        last = reports[-1]["results"].get(key)
+        if last is not None and first["tokens_per_second"]:
+            line += f"{last['tokens_per_second'] / first['tokens_per_second']:>10.2f}x"
+        print(line)
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("stub", "llamacpp"), default="stub", help="The GPU backend runs through main.py::benchmark_inference_backend")
+    parser.add_argument("--gguf", help="GGUF file for the llamacpp backend; downloaded to --cache-dir when omitted")
+    parser.add_argument("--cache-dir", default="model_cache")
+    parser.add_argument("--threads", type=int, help="llama.cpp decode threads (default: inference_backend.default_threads)")
+    parser.add_argument("--tune-threads", action="store_true", help="Sweep decode thread counts first and keep the fastest")
+    parser.add_argument("--repos", type=int, default=DEFAULT_REPOS)
+    parser.add_argument("--concurrency", type=_int_list, default=list(DEFAULT_CONCURRENCY))
+    parser.add_argument("--mode", action="append", help="Analysis modes to run (default: all)")
+    parser.add_argument("--output", help="Write the report as JSON here")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT", help="Compare saved reports instead of running")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    # Forced, since the repo modules imported above already configured INFO logging
+    logging.basicConfig(level=args.log_level, force=True)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        compare(reports)
+        return 0
+
+    if args.backend == "llamacpp":
+        from inference_backend import LlamaCppBackend, download_gguf
+        backend: InferenceBackend = LlamaCppBackend.load(args.gguf or download_gguf(args.cache_dir), n_threads=args.threads)
+    else:
+        backend = StubBackend()
+
+    report = run(backend, args.repos, args.concurrency, args.mode, tune=args.tune_threads)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
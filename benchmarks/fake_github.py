@@ -0,0 +1,357 @@
+"""Local stand-in for the GitHub REST and GraphQL endpoints the analyzer calls.
+
+Serves recorded payloads from a fixtures directory when one matches the request, and
+otherwise deterministic synthetic payloads sized by `commits` and `pull_requests`.
+Point the repo at it with `GITHUB_API_URL=http://127.0.0.1:<port>`:
+
+    python -m benchmarks.fake_github serve --commits 1000
+    python -m benchmarks.fake_github record octocat --fixtures benchmarks/fixtures
+
+Recorded fixtures are laid out as `graphql/<username>.json` (the `ANALYSIS_QUERY`
+response) and `rest/users/<username>.json` / `rest/users/<username>/repos.json`.
+The owner/name repository queries (`REPOSITORY_DETAIL_QUERY` and the commit and merged
+PR pagers of `contribution_stream`) are always answered from the synthetic history.
+"""
+import hashlib
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+LANGUAGES = ("Python", "TypeScript", "Go", "Rust", "Java")
+# Synthetic histories end here, so payloads are identical from run to run
+HISTORY_END = datetime(2024, 6, 30, 12, 0, 0)
+
+SYNTHETIC_README = """# {name}
+
+A synthetic repository served by the benchmark's fake GitHub server.
+
+## Features
+- Fast
+- Deterministic
+
+## Installation
+```bash
+pip install {name}
+```
+
+## Usage
+```python
+import {name}
+{name}.run()
+```
+
+## License
+MIT License
+"""
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class SyntheticGitHub:
+    """Deterministic payloads for any username, seeded by the username itself."""
+
+    def __init__(self, commits: int = 100, pull_requests: int = 100, history_days: int = 365):
+        # Unlike GitHub, which caps each connection at 100 nodes, any size is served so
+        # the processing stages can be measured at scale
+        self.commits = commits
+        self.pull_requests = pull_requests
+        self.history_days = history_days
+
+    def _random(self, username: str) -> random.Random:
+        return random.Random(username)
+
+    def repository(self, username: str, with_history: bool = True) -> Dict[str, Any]:
+        rng = self._random(username)
+        name = f"{username}-project"
+        repo: Dict[str, Any] = {
+            "name": name,
+            "stargazerCount": rng.randint(0, 5000),
+            "forkCount": rng.randint(0, 500),
+            "watchers": {"totalCount": rng.randint(0, 300)},
+            "openIssues": {"totalCount": rng.randint(0, 100)},
+            "closedIssues": {"totalCount": rng.randint(0, 400)},
+            "openPullRequests": {"totalCount": rng.randint(0, 30)},
+            "primaryLanguage": {"name": rng.choice(LANGUAGES)},
+            "defaultBranchRef": {"target": {"oid": "%040x" % rng.getrandbits(160)}},
+            "object": {"text": SYNTHETIC_README.format(name=name.replace("-", "_"))}
+        }
+        if with_history:
+            repo["defaultBranchRef"]["target"]["history"] = {"edges": [
+                {"node": {
+                    "committedDate": _timestamp(self._moment(rng)),
+                    "message": f"Commit {i}",
+                    "additions": rng.randint(0, 400),
+                    "deletions": rng.randint(0, 200)
+                }}
+                for i in range(self.commits)
+            ]}
+            repo["pullRequests"] = {"edges": [
+                {"node": {
+                    "createdAt": _timestamp(self._moment(rng)),
+                    "title": f"Pull request {i}",
+                    "additions": rng.randint(0, 800),
+                    "deletions": rng.randint(0, 400)
+                }}
+                for i in range(self.pull_requests)
+            ]}
+        return repo
+
+    def commit_history(self, username: str) -> List[Dict[str, Any]]:
+        """`commits` default-branch commits newest first; the newest is the repository's HEAD."""
+        rng = self._random(f"{username}:commits")
+        moments = sorted((self._moment(rng) for _ in range(self.commits)), reverse=True)
+        head_oid = self.repository(username, with_history=False)["defaultBranchRef"]["target"]["oid"]
+        return [
+            {
+                "oid": head_oid if i == 0 else hashlib.sha1(f"{username}:{i}".encode()).hexdigest(),
+                "committedDate": _timestamp(moment)
+            }
+            for i, moment in enumerate(moments)
+        ]
+
+    def merged_pull_requests(self, username: str) -> List[Dict[str, Any]]:
+        """`pull_requests` merged PRs, most recently updated first."""
+        rng = self._random(f"{username}:pull-requests")
+        pull_requests = []
+        for _ in range(self.pull_requests):
+            created = self._moment(rng)
+            merged = min(created + timedelta(hours=rng.randint(1, 72)), HISTORY_END)
+            pull_requests.append({"createdAt": _timestamp(created), "updatedAt": _timestamp(merged), "mergedAt": _timestamp(merged)})
+        return sorted(pull_requests, key=lambda pull_request: pull_request["updatedAt"], reverse=True)
+
+    def _moment(self, rng: random.Random) -> datetime:
+        return HISTORY_END - timedelta(seconds=rng.randint(0, self.history_days * 86400))
+
+    def user(self, username: str, with_history: bool = True) -> Dict[str, Any]:
+        rng = self._random(username)
+        return {
+            "login": username,
+            "avatarUrl": f"https://avatars.example.com/{username}",
+            "createdAt": "2015-03-01T00:00:00Z",
+            "bio": f"Synthetic user {username}",
+            "followers": {"totalCount": rng.randint(0, 1000)},
+            "following": {"totalCount": rng.randint(0, 100)},
+            "repositories": {"nodes": [self.repository(username, with_history)]}
+        }
+
+    def rest_user(self, username: str) -> Dict[str, Any]:
+        user = self.user(username, with_history=False)
+        return {
+            "login": username,
+            "avatar_url": user["avatarUrl"],
+            "created_at": user["createdAt"],
+            "public_repos": 1,
+            "followers": user["followers"]["totalCount"],
+            "following": user["following"]["totalCount"],
+            "bio": user["bio"]
+        }
+
+    def rest_repos(self, username: str) -> List[Dict[str, Any]]:
+        repo = self.repository(username, with_history=False)
+        return [{
+            "name": repo["name"],
+            "stargazers_count": repo["stargazerCount"],
+            "forks_count": repo["forkCount"],
+            "open_issues_count": repo["openIssues"]["totalCount"] + repo["openPullRequests"]["totalCount"],
+            "watchers_count": repo["watchers"]["totalCount"]
+        }]
+
+class FakeGitHubServer:
+    """The stand-in server, running on its own event loop thread.
+
+        with FakeGitHubServer(SyntheticGitHub(commits=1000)) as server:
+            os.environ["GITHUB_API_URL"] = server.url
+    """
+
+    def __init__(self, synthetic: Optional[SyntheticGitHub] = None, fixtures_dir: Optional[str] = None, host: str = "127.0.0.1", port: int = 0):
+        self.synthetic = synthetic or SyntheticGitHub()
+        self.fixtures_dir = fixtures_dir
+        self.host = host
+        self.port = port
+        self.requests_served = 0
+        # Mirrors GitHub's hourly windows: 5,000 REST requests, 5,000 GraphQL points
+        self.rate_limit_used = {"core": 0, "graphql": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _fixture(self, *parts: str) -> Optional[Any]:
+        if self.fixtures_dir is None:
+            return None
+        path = os.path.join(self.fixtures_dir, *parts)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _user_payload(self, username: str, with_history: bool) -> Optional[Dict[str, Any]]:
+        recorded = self._fixture("graphql", f"{username}.json")
+        if recorded is not None:
+            return recorded["data"]["user"]
+        return self.synthetic.user(username, with_history)
+
+    def _repository_payload(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """A repository detail node, or one page of its commit history or merged PRs."""
+        owner = variables["owner"]
+        if "...AnalysisRepository" in query:
+            return self.synthetic.repository(owner, variables.get("withHistory", True))
+        repo = self.synthetic.repository(owner, with_history=False)
+        # The cursor is the offset of the page's first node; GitHub caps pages at 100
+        start = int(variables.get("cursor") or 0)
+        page_size = min(variables["pageSize"], 100)
+        if "history(" in query:
+            nodes = [
+                commit for commit in self.synthetic.commit_history(owner)
+                if (variables.get("since") is None or commit["committedDate"] >= variables["since"])
+                and (variables.get("until") is None or commit["committedDate"] <= variables["until"])
+            ]
+        else:
+            nodes = self.synthetic.merged_pull_requests(owner)
+        page = {
+            "pageInfo": {"hasNextPage": start + page_size < len(nodes), "endCursor": str(start + page_size)},
+            "nodes": nodes[start:start + page_size]
+        }
+        if "history(" in query:
+            repo["defaultBranchRef"]["target"]["history"] = page
+        else:
+            repo["pullRequests"] = page
+        return repo
+
+    def _rate_limit_headers(self, resource: str) -> Dict[str, str]:
+        self.rate_limit_used[resource] += 1
+        return {
+            "x-ratelimit-limit": "5000",
+            "x-ratelimit-remaining": str(max(0, 5000 - self.rate_limit_used[resource])),
+            "x-ratelimit-reset": str(int(HISTORY_END.timestamp()) + 3600),
+            "x-ratelimit-resource": resource
+        }
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        self.requests_served += 1
+        payload = await request.json()
+        query, variables = payload["query"], payload.get("variables", {})
+        with_history = variables.get("withHistory", True)
+        if "$owner" in query:
+            data = {"repository": self._repository_payload(query, variables)}
+            data["rateLimit"] = {"cost": 1, "remaining": max(0, 5000 - self.rate_limit_used["graphql"] - 1)}
+        elif "$username" in query:
+            data = {"user": self._user_payload(variables["username"], with_history)}
+        elif re.search(r"\bu0: user\(", query):
+            # Aliased batch query: one `u<i>` field per username variable
+            data = {alias: self._user_payload(username, with_history) for alias, username in variables.items() if alias != "withHistory"}
+        else:
+            return web.json_response({"errors": [{"message": "Query not supported by the fake GitHub server"}]})
+        return web.json_response({"data": data}, headers=self._rate_limit_headers("graphql"))
+
+    async def rest_user(self, request: web.Request) -> web.Response:
+        self.requests_served += 1
+        username = request.match_info["username"]
+        return web.json_response(self._fixture("rest", "users", f"{username}.json") or self.synthetic.rest_user(username), headers=self._rate_limit_headers("core"))
+
+    async def rest_repos(self, request: web.Request) -> web.Response:
+        self.requests_served += 1
+        username = request.match_info["username"]
+        return web.json_response(self._fixture("rest", "users", username, "repos.json") or self.synthetic.rest_repos(username), headers=self._rate_limit_headers("core"))
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/graphql", self.graphql)
+        app.router.add_get("/users/{username}", self.rest_user)
+        app.router.add_get("/users/{username}/repos", self.rest_repos)
+        return app
+
+    def start(self) -> "FakeGitHubServer":
+        started = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.app(), access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            # Port 0 binds a free port; read back the one chosen
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-github", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self) -> "FakeGitHubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+def record(username: str, fixtures_dir: str, github_token: str) -> None:
+    """Save live GitHub responses for `username` as fixtures the server replays."""
+    import requests
+    from github_gateway import ANALYSIS_QUERY
+
+    headers = {"Authorization": f"Bearer {github_token}"}
+    responses = {
+        ("graphql", f"{username}.json"): requests.post(
+            "https://api.github.com/graphql", headers=headers,
+            json={"query": ANALYSIS_QUERY, "variables": {"username": username, "withHistory": True}}
+        ),
+        ("rest", "users", f"{username}.json"): requests.get(f"https://api.github.com/users/{username}", headers=headers),
+        ("rest", "users", username, "repos.json"): requests.get(
+            f"https://api.github.com/users/{username}/repos", headers=headers, params={"sort": "updated", "per_page": 1}
+        ),
+    }
+    for parts, response in responses.items():
+        response.raise_for_status()
+        path = os.path.join(fixtures_dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(response.json(), f, indent=2)
+        print(f"Recorded {path}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--commits", type=int, default=100)
+    serve.add_argument("--pull-requests", type=int, default=100)
+    serve.add_argument("--fixtures")
+    recorder = commands.add_parser("record")
+    recorder.add_argument("username")
+    recorder.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.username, args.fixtures, os.environ["GITHUB_TOKEN"])
+        return
+    server = FakeGitHubServer(SyntheticGitHub(args.commits, args.pull_requests), args.fixtures, port=args.port).start()
+    print(f"Fake GitHub serving on {server.url}; Ctrl-C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
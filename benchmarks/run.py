@@ -0,0 +1,263 @@
+"""Offline benchmarks for the analysis pipeline, compared against a stored baseline.
+
+Runs every stage against the local fake GitHub server and the stub model, so it needs
+neither Modal, a GPU nor network access (only `outlines`, whose template renders the
+README extraction prompt):
+
+    python -m benchmarks.run                              # compare with benchmarks/baseline.json
+    python -m benchmarks.run --commits 100,10000 --concurrency 1,16
+    python -m benchmarks.run --update-baseline            # accept the current numbers
+
+Exits non-zero when a stage's median latency regresses past `--tolerance`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Any, List
+
+from benchmarks.fake_github import FakeGitHubServer, SyntheticGitHub
+from benchmarks.stub_model import StubRegistry, DEFAULT_BATCH_LATENCY_MS, DEFAULT_PROMPT_LATENCY_MS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+# Differences below this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.5
+BENCH_TOKEN = "benchmark-token"
+
+def summarize(samples: List[float], items_per_sample: float, unit: str) -> Dict[str, Any]:
+    """Latency percentiles in ms and throughput in `unit` per second of the timed samples."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "mean_ms": round(1000 * total / len(ordered), 3),
+        "p50_ms": round(1000 * statistics.median(ordered), 3),
+        "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "throughput": round(items_per_sample * len(ordered) / total, 1) if total else 0.0,
+        "unit": unit
+    }
+
+def time_calls(fn: Callable[[], Any], iterations: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_data_stages(server: FakeGitHubServer, commit_counts: List[int], iterations: int) -> Dict[str, Dict[str, Any]]:
+    from heatmap import fetch_contributions_data, process_contributions, generate_visual_attributes, generate_heatmap_json
+    from contribution_table import ContributionTable
+
+    results = {}
+    for commits in commit_counts:
+        server.synthetic.commits = server.synthetic.pull_requests = commits
+        username = f"bench-{commits}"
+        records = commits * 2
+
+        samples = time_calls(lambda: fetch_contributions_data(username, BENCH_TOKEN), iterations)
+        results[f"fetch_contributions_data[records={records}]"] = summarize(samples, records, "records")
+
+        repo_info = fetch_contributions_data(username, BENCH_TOKEN)["repo_analysis"][0]
+        contributions = repo_info["commits"] + repo_info["pull_requests"]
+        samples = time_calls(lambda: process_contributions(contributions), iterations)
+        results[f"process_contributions[records={records}]"] = summarize(samples, records, "records")
+
+        table = ContributionTable.from_records(contributions)
+        samples = time_calls(lambda: process_contributions(table), iterations)
+        results[f"process_contributions[table,records={records}]"] = summarize(samples, records, "records")
+
+        structured_data = process_contributions(contributions)
+        insights = generate_visual_attributes(structured_data)
+        samples = time_calls(lambda: generate_heatmap_json(structured_data, insights), iterations)
+        results[f"generate_heatmap_json[days={len(structured_data)}]"] = summarize(samples, len(structured_data), "days")
+    return results
+
+def bench_analyze_repo(iterations: int, registry: StubRegistry) -> Dict[str, Dict[str, Any]]:
+    from repo_analyzer import analyze_repo, ANALYSIS_MODES
+
+    results = {}
+    for mode in ANALYSIS_MODES:
+        # Includes the REST metrics fetch from the fake server, as in production
+        samples = time_calls(lambda: analyze_repo("bench-analyze", BENCH_TOKEN, None, None, llm=registry, mode=mode), iterations)
+        results[f"analyze_repo[mode={mode}]"] = summarize(samples, 1, "analyses")
+    return results
+
+def bench_inference(scheduler, store_dir: str):
+    """Build the stand-in for the Modal `LLMInference` handle that `api.create_app` calls.
+
+    The class is defined here, not at import, because the repo's modules read
+    GITHUB_API_URL when they are first imported, after the fake server has started.
+    """
+    from analysis_pipeline import AnalysisPipeline
+    from contribution_store import ContributionStore
+    from github_gateway import GitHubGateway
+    from result_store import ResultStore
+
+    class BenchInference(AnalysisPipeline):
+        """`analyze_repos` runs `AnalysisPipeline._analyze_gateway`, the code `LLMInference`
+        runs on a result-store miss: one gateway query, the insight stages and the README
+        extraction through the micro-batch scheduler, and a contribution sync into a
+        `ContributionStore` for the heatmap. The HEAD check and result-store hit are
+        skipped, so every request does the full work; README extractions and synced
+        contributions are reused across requests as in production.
+        """
+
+        def __init__(self, scheduler, store_dir: str):
+            self.model = self.tokenizer = None
+            self.scheduler = scheduler
+            self.result_store = ResultStore(os.path.join(store_dir, "analysis_results.sqlite"))
+            self.contribution_store = ContributionStore(os.path.join(store_dir, "contributions.sqlite"))
+            self.client = None
+            self.analyze_repos = SimpleNamespace(remote=SimpleNamespace(aio=self._analyze_repos))
+
+        def _github(self):
+            return self.client
+
+        async def _analyze_repos(self, username: str, mode: str = "chained") -> Dict[str, Any]:
+            gateway = GitHubGateway(username, BENCH_TOKEN, with_history=False)
+            await gateway.fetch_async(self.client)
+            return await self._analyze_gateway(username, gateway, mode=mode, check_cache=False)
+
+    return BenchInference(scheduler, store_dir)
+
+async def _endpoint_run(app, inference, requests: int, concurrency: int, mode: str) -> List[float]:
+    import httpx
+    from github_client import AsyncGitHubClient
+
+    latencies: List[float] = []
+    limit = asyncio.Semaphore(concurrency)
+    async with AsyncGitHubClient(BENCH_TOKEN, max_concurrency=max(8, concurrency)) as client:
+        inference.client = client
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+            async def one(i: int) -> None:
+                async with limit:
+                    started = time.perf_counter()
+                    response = await http.get("/api/analyze", params={"username": f"bench-user-{i % 50}", "mode": mode})
+                    latencies.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+def bench_endpoint(server: FakeGitHubServer, concurrency_levels: List[int], requests: int, rounds: int, registry: StubRegistry, max_batch_size: int, store_dir: str) -> Dict[str, Dict[str, Any]]:
+    from api import create_app
+    from batching import MicroBatchScheduler
+
+    # Endpoint payloads keep the default 100 + 100 history GitHub would return
+    server.synthetic.commits = server.synthetic.pull_requests = 100
+    scheduler = MicroBatchScheduler(registry, max_batch_size=max_batch_size)
+    inference = bench_inference(scheduler, store_dir)
+    app = create_app(inference, job_dict={})
+    results = {}
+    try:
+        for concurrency in concurrency_levels:
+            # How concurrent requests line up into micro-batches varies from run to run,
+            # so the best of several rounds is kept, as timeit does
+            for _ in range(rounds):
+                calls_before, prompts_before = registry.calls, registry.prompts
+                started = time.perf_counter()
+                latencies = asyncio.run(_endpoint_run(app, inference, requests, concurrency, "chained"))
+                wall = time.perf_counter() - started
+                summary = summarize(latencies, 1, "requests")
+                # Under concurrency the requests overlap, so throughput is requests over wall time
+                summary["throughput"] = round(requests / wall, 1)
+                calls = registry.calls - calls_before
+                summary["mean_batch_size"] = round((registry.prompts - prompts_before) / calls, 2) if calls else 0
+                name = f"api_analyze[concurrency={concurrency}]"
+                if name not in results or summary["p50_ms"] < results[name]["p50_ms"]:
+                    results[name] = summary
+    finally:
+        scheduler.stop()
+    return results
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Print each stage against the baseline and return the regressions."""
+    regressions = []
+    print(f"{'stage':<52} {'p50 ms':>10} {'baseline':>10} {'change':>8} {'throughput':>18}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        line = f"{name:<52} {result['p50_ms']:>10.3f}"
+        if reference:
+            change = result["p50_ms"] / reference["p50_ms"] - 1 if reference["p50_ms"] else 0.0
+            line += f" {reference['p50_ms']:>10.3f} {change:>+8.0%}"
+            if change > tolerance and result["p50_ms"] - reference["p50_ms"] > MIN_REGRESSION_MS:
+                regressions.append(f"{name}: p50 {result['p50_ms']:.3f} ms vs baseline {reference['p50_ms']:.3f} ms ({change:+.0%})")
+        else:
+            line += f" {'-':>10} {'new':>8}"
+        print(line + f" {result['throughput']:>11} {result['unit']}/s")
+    return regressions
+
+def environment() -> Dict[str, Any]:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=_int_list, default=[100, 1000, 10000], help="History sizes for the data stages")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--analyze-iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Endpoint requests per concurrency level")
+    parser.add_argument("--rounds", type=int, default=3, help="Endpoint rounds per concurrency level; the best is kept")
+    parser.add_argument("--batch-latency-ms", type=float, default=DEFAULT_BATCH_LATENCY_MS)
+    parser.add_argument("--prompt-latency-ms", type=float, default=DEFAULT_PROMPT_LATENCY_MS)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--fixtures", help="Directory of recorded GitHub responses to serve")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="Also write the results as JSON here")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    with FakeGitHubServer(SyntheticGitHub(), fixtures_dir=args.fixtures) as server, tempfile.TemporaryDirectory() as scratch:
+        # Both must be set before the repo's modules are imported; the HTTP cache gets
+        # a scratch file and no GraphQL reuse, so every iteration reaches the server
+        os.environ["GITHUB_API_URL"] = server.url
+        os.environ["GITHUB_HTTP_CACHE_PATH"] = os.path.join(scratch, "http_cache.sqlite")
+        os.environ["GITHUB_GRAPHQL_CACHE_TTL"] = "0"
+        # Configured first, so the modules' own basicConfig(level=INFO) calls are no-ops
+        logging.basicConfig(level=args.log_level)
+
+        registry = StubRegistry(args.batch_latency_ms, args.prompt_latency_ms)
+        results: Dict[str, Dict[str, Any]] = {}
+        results.update(bench_data_stages(server, args.commits, args.iterations))
+        results.update(bench_analyze_repo(args.analyze_iterations, registry))
+        results.update(bench_endpoint(server, args.concurrency, args.requests, args.rounds, registry, args.max_batch_size, scratch))
+
+    baseline: Dict[str, Any] = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+
+    report = {"environment": environment(), "model": registry.stats(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Deterministic stand-in for the constrained-generation model.
+
+`StubRegistry` has the `get(schema) -> generator` interface of `GeneratorRegistry`, so
+it plugs in wherever `run_generation` or `MicroBatchScheduler` expects the compiled
+`generate.json(models.Transformers(...), schema)` generators, without torch, outlines
+or a GPU. Each generator accepts one prompt or a batch of them, sleeps a fixed
+simulated latency per batch plus per prompt, and builds a schema instance whose
+values depend only on the prompt.
+"""
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+DEFAULT_BATCH_LATENCY_MS = 20.0
+DEFAULT_PROMPT_LATENCY_MS = 2.0
+
+def _value(annotation: Any, name: str, seed: int) -> Any:
+    origin = get_origin(annotation)
+    if origin is Union:
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        origin = get_origin(annotation)
+    if origin in (list, List):
+        (item,) = get_args(annotation) or (str,)
+        return [_value(item, f"{name} {i}", seed + i) for i in range(1, 4)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation, seed)
+    if annotation is int:
+        return seed % 101
+    if annotation is float:
+        return (seed % 1000) / 1000
+    if annotation is bool:
+        return bool(seed % 2)
+    return f"{name.replace('_', ' ')} #{seed % 10000}"
+
+def fake_instance(schema: Type[BaseModel], seed: int) -> BaseModel:
+    """A valid `schema` instance whose every field is derived from `seed`."""
+    return schema(**{name: _value(field.annotation, name, seed + i) for i, (name, field) in enumerate(schema.model_fields.items())})
+
+def prompt_seed(prompt: str) -> int:
+    return int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:4], "big")
+
+class StubRegistry:
+    """Counts calls, prompts and batch sizes so benchmarks can report model-side load."""
+
+    def __init__(self, batch_latency_ms: float = DEFAULT_BATCH_LATENCY_MS, prompt_latency_ms: float = DEFAULT_PROMPT_LATENCY_MS):
+        self.batch_latency = batch_latency_ms / 1000
+        self.prompt_latency = prompt_latency_ms / 1000
+        self.calls = 0
+        self.prompts = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        def generate(prompts: Union[str, List[str]]) -> Union[BaseModel, List[BaseModel]]:
+            batch = [prompts] if isinstance(prompts, str) else list(prompts)
+            with self._lock:
+                self.calls += 1
+                self.prompts += len(batch)
+                self.prompt_chars += sum(len(prompt) for prompt in batch)
+            # One forward pass per call, longer for every extra sequence in the batch
+            time.sleep(self.batch_latency + self.prompt_latency * len(batch))
+            results = [fake_instance(schema, prompt_seed(prompt)) for prompt in batch]
+            return results[0] if isinstance(prompts, str) else results
+        return generate
+
+    def warm(self, schemas) -> None:
+        for schema in schemas:
+            self.get(schema)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompts": self.prompts,
+            "mean_batch_size": round(self.prompts / self.calls, 2) if self.calls else 0,
+            "prompt_chars": self.prompt_chars
+        }
@@ -0,0 +1,102 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+RESOLUTIONS = ("day", "week", "month", "total")
+# Ten years of days; longer ranges need a coarser resolution
+MAX_BUCKETS = 3660
+
+def parse_day(date: str) -> int:
+    """Day ordinal (days since 1970-01-01) of a `YYYY-MM-DD` date."""
+    try:
+        return int(np.datetime64(date, "D").astype(np.int64))
+    except ValueError:
+        raise ValueError(f"Invalid date {date!r}; expected YYYY-MM-DD")
+
+def _day_string(day: int) -> str:
+    return str(np.datetime64(day, "D"))
+
+class RollupIndex:
+    """Prefix sums of daily contribution counts, answering any date range in O(1) per bucket.
+
+    Built once from aggregated (date, language, contribution_type, count) rows. Row
+    `d` of `prefix` holds the running totals of every series (one per contribution
+    type, then one per language) over the days before `start_day + d`, so the counts of
+    any day, week, month or custom range are one subtraction of two rows.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str, str, int]]):
+        rows = list(rows)
+        self.contribution_types: List[str] = sorted({row[2] for row in rows})
+        self.languages: List[str] = sorted({row[1] for row in rows})
+        if not rows:
+            self.start_day = self.end_day = 0
+            self.prefix = np.zeros((1, 0), dtype=np.int64)
+            return
+
+        days = np.array([row[0] for row in rows], dtype="datetime64[D]").astype(np.int64)
+        counts = np.array([row[3] for row in rows], dtype=np.int64)
+        type_columns = np.searchsorted(self.contribution_types, [row[2] for row in rows])
+        language_columns = len(self.contribution_types) + np.searchsorted(self.languages, [row[1] for row in rows])
+
+        self.start_day = int(days.min())
+        self.end_day = int(days.max())
+        daily = np.zeros((self.end_day - self.start_day + 1, len(self.contribution_types) + len(self.languages)), dtype=np.int64)
+        np.add.at(daily, (days - self.start_day, type_columns), counts)
+        np.add.at(daily, (days - self.start_day, language_columns), counts)
+
+        self.prefix = np.zeros((daily.shape[0] + 1, daily.shape[1]), dtype=np.int64)
+        np.cumsum(daily, axis=0, out=self.prefix[1:])
+
+    def __len__(self) -> int:
+        return self.prefix.shape[0] - 1
+
+    def _bucket_starts(self, start: int, end: int, resolution: str) -> np.ndarray:
+        if resolution == "day":
+            return np.arange(start, end + 1)
+        if resolution == "week":
+            # Weeks start on Monday; 1970-01-01 was a Thursday
+            first_monday = start - (start + 3) % 7
+            return np.maximum(np.arange(first_monday, end + 1, 7), start)
+        if resolution == "month":
+            months = np.arange(np.datetime64(start, "D").astype("datetime64[M]"), np.datetime64(end, "D").astype("datetime64[M]") + 1)
+            return np.maximum(months.astype("datetime64[D]").astype(np.int64), start)
+        if resolution == "total":
+            return np.array([start])
+        raise ValueError(f"resolution must be one of {list(RESOLUTIONS)}")
+
+    def query(self, start: Optional[str] = None, end: Optional[str] = None, resolution: str = "day") -> Dict[str, Any]:
+        """Counts per bucket between `start` and `end` (inclusive, default: all stored days)."""
+        start_day = parse_day(start) if start else self.start_day
+        end_day = parse_day(end) if end else self.end_day
+        if start_day > end_day:
+            raise ValueError("from must not be after to")
+
+        starts = self._bucket_starts(start_day, end_day, resolution)
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f"Range spans {len(starts)} {resolution} buckets; at most {MAX_BUCKETS} are allowed")
+        bounds = np.append(starts, end_day + 1)
+
+        # Two prefix rows per bucket; days outside the index contribute nothing
+        rows = np.clip(bounds - self.start_day, 0, len(self))
+        totals = self.prefix[rows[1:]] - self.prefix[rows[:-1]]
+
+        n_types = len(self.contribution_types)
+        buckets = []
+        for bucket_start, bucket_end, bucket in zip(bounds[:-1].tolist(), (bounds[1:] - 1).tolist(), totals.tolist()):
+            contribution_types = {name: count for name, count in zip(self.contribution_types, bucket[:n_types]) if count}
+            buckets.append({
+                "start": _day_string(bucket_start),
+                "end": _day_string(bucket_end),
+                "commits": contribution_types.get("commit", 0),
+                "pull_requests": contribution_types.get("pull_request", 0),
+                "contribution_types": contribution_types,
+                "languages": {name: count for name, count in zip(self.languages, bucket[n_types:]) if count}
+            })
+
+        return {
+            "from": _day_string(start_day),
+            "to": _day_string(end_day),
+            "resolution": resolution,
+            "buckets": buckets
+        }
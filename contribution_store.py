@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from telemetry import traced
+from contribution_stream import DEFAULT_PAGE_SIZE, QueryBudget, build_structured_data, iter_commits, iter_merged_pull_requests
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Container-local, like the result store: SQLite is not shared safely through the volume
+DEFAULT_STORE_DIR = os.path.expanduser("~/.cache/repo-analyzer")
+DEFAULT_STORE_PATH = os.getenv("CONTRIBUTION_STORE_PATH", os.path.join(DEFAULT_STORE_DIR, "contributions.sqlite"))
+# The first sync of a repository covers the same window the analysis query always
+# fetched: the latest 100 commits and 100 merged PRs. Later syncs page back to the mark.
+# 0 lifts the page limit, ingesting the full history on first sync; without it the full
+# history is served by /api/heatmap/history, which streams it from GitHub per request.
+DEFAULT_INITIAL_PAGES = int(os.getenv("CONTRIBUTION_SYNC_MAX_PAGES", 1)) or None
+# GraphQL rate-limit points a first sync may spend; 0 means unlimited
+DEFAULT_INITIAL_COST = int(os.getenv("CONTRIBUTION_SYNC_MAX_COST", 0)) or None
+# Pages a later sync walks back looking for the marked commit before giving up and
+# resyncing from scratch, as it does when the history was rewritten
+DEFAULT_CATCH_UP_PAGES = int(os.getenv("CONTRIBUTION_SYNC_CATCH_UP_PAGES", 10)) or None
+
+# High-water mark of a synced repository: the newest counted commit and merge
+MARK_FIELDS = ("commit_oid", "commit_date", "pr_merged_at")
+EMPTY_MARK = {"commit_oid": "", "commit_date": "", "pr_merged_at": ""}
+
+class ContributionStore:
+    """SQLite store of daily contribution counts per (username, repo, day, language, type).
+
+    Each repository carries a high-water mark, so a sync only fetches what was pushed
+    or merged since the previous one and adds it to the stored counts.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_contributions (
+                    username TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    contribution_type TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (username, repo, date, language, contribution_type)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_marks (
+                    username TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    commit_oid TEXT NOT NULL,
+                    commit_date TEXT NOT NULL,
+                    pr_merged_at TEXT NOT NULL,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (username, repo)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_mark(self, username: str, repo: str) -> Optional[Dict[str, str]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT commit_oid, commit_date, pr_merged_at FROM sync_marks WHERE username = ? AND repo = ?",
+                (username.lower(), repo)
+            ).fetchone()
+        return dict(zip(MARK_FIELDS, row)) if row is not None else None
+
+    def merge(
+        self,
+        username: str,
+        repo: str,
+        counts: Dict[Tuple[str, str, str], int],
+        expected_mark: Optional[Dict[str, str]],
+        new_mark: Dict[str, str],
+        reset_commits: bool = False
+    ) -> bool:
+        """Add `counts` and advance the mark, unless another sync moved the mark first.
+
+        `counts` maps (date, language, contribution_type) to the number of new
+        contributions. Returns False, changing nothing, when the stored mark no longer
+        equals `expected_mark`, so concurrent syncs never count the same delta twice.
+        """
+        key = (username.lower(), repo)
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT commit_oid, commit_date, pr_merged_at FROM sync_marks WHERE username = ? AND repo = ?", key
+            ).fetchone()
+            current = dict(zip(MARK_FIELDS, row)) if row is not None else None
+            if current != expected_mark:
+                return False
+            if reset_commits:
+                conn.execute(
+                    "DELETE FROM daily_contributions WHERE username = ? AND repo = ? AND contribution_type = 'commit'", key
+                )
+            conn.executemany(
+                """
+                INSERT INTO daily_contributions VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(username, repo, date, language, contribution_type) DO UPDATE SET count = count + excluded.count
+                """,
+                [key + (date, language, contribution_type, count) for (date, language, contribution_type), count in counts.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?, ?, ?, ?)",
+                key + tuple(new_mark[field] for field in MARK_FIELDS) + (time.time(),)
+            )
+        return True
+
+    def rows(self, username: str, repo: Optional[str] = None) -> List[Tuple[str, str, str, int]]:
+        """Raw (date, language, contribution_type, count) rows for one repository, or all of the user's."""
+        query = "SELECT date, language, contribution_type, SUM(count) FROM daily_contributions WHERE username = ?"
+        params: Tuple = (username.lower(),)
+        if repo is not None:
+            query += " AND repo = ?"
+            params += (repo,)
+        with self._lock, self._connect() as conn:
+            return conn.execute(query + " GROUP BY date, language, contribution_type", params).fetchall()
+
+    def version(self, username: str) -> Optional[float]:
+        """Time of the user's latest sync, or None if nothing is stored; changes whenever the counts do."""
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT MAX(synced_at) FROM sync_marks WHERE username = ?", (username.lower(),)).fetchone()[0]
+
+    def structured_data(self, username: str, repo: str, contribution_types: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Stored counts in the shape returned by `heatmap.process_contributions`, newest day first."""
+        query = "SELECT date, language, contribution_type, count FROM daily_contributions WHERE username = ? AND repo = ?"
+        params: Tuple = (username.lower(), repo)
+        if contribution_types is not None:
+            contribution_types = tuple(contribution_types)
+            query += f" AND contribution_type IN ({', '.join('?' * len(contribution_types))})"
+            params += contribution_types
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY date DESC, language, contribution_type", params).fetchall()
+        return build_structured_data(rows)
+
+async def _sync_commits(client, owner: str, name: str, mark: Optional[Dict[str, str]], page_size: int, budget: QueryBudget) -> Dict[str, Any]:
+    """Count newest-first commits down to the marked oid, or until the budget runs out."""
+    marked_oid = mark["commit_oid"] if mark else ""
+    counts: Counter = Counter()
+    newest = None
+    found_mark = False
+    # No `since` here: history is in graph order, and a commit pushed after the mark can
+    # carry an older committer date (rebases, cherry-picks, skewed clocks)
+    commits = iter_commits(client, owner, name, page_size=page_size, budget=budget)
+    async for commit in commits:
+        if newest is None:
+            newest = commit
+        if marked_oid and commit["oid"] == marked_oid:
+            found_mark = True
+            break
+        counts[(commit["date"], commit["language"], "commit")] += 1
+    await commits.aclose()
+    return {"counts": counts, "newest": newest, "found_mark": found_mark}
+
+async def _sync_pull_requests(client, owner: str, name: str, mark: Optional[Dict[str, str]], page_size: int, budget: QueryBudget) -> Dict[str, Any]:
+    """Count merged PRs merged after the mark."""
+    merged_mark = mark["pr_merged_at"] if mark else ""
+    counts: Counter = Counter()
+    newest_merge = merged_mark
+    pull_requests = iter_merged_pull_requests(
+        client, owner, name,
+        updated_since=merged_mark or None,
+        page_size=page_size,
+        budget=QueryBudget() if mark else budget
+    )
+    async for pull_request in pull_requests:
+        if pull_request["merged_at"] <= merged_mark:
+            continue  # Merged before the mark and counted then; updated since
+        counts[(pull_request["date"], pull_request["language"], "pull_request")] += 1
+        newest_merge = max(newest_merge, pull_request["merged_at"])
+    return {"counts": counts, "newest_merge": newest_merge}
+
+@traced("github.sync_contributions")
+async def sync_repository_async(
+    client,
+    store: ContributionStore,
+    owner: str,
+    name: str,
+    head_oid: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    max_pages: Optional[int] = DEFAULT_INITIAL_PAGES,
+    max_cost: Optional[int] = DEFAULT_INITIAL_COST,
+    catch_up_pages: Optional[int] = DEFAULT_CATCH_UP_PAGES
+) -> Dict[str, Any]:
+    """Bring the stored daily counts for `owner/name` up to date.
+
+    Passing the known `head_oid` skips the commit query entirely when the default
+    branch has not moved since the last sync. `max_pages` and `max_cost` bound the
+    commit and the pull request history of a repository's first sync, each on its own;
+    later syncs page back to the mark for at most `catch_up_pages` pages. Returns what
+    the sync fetched.
+    """
+    mark = store.get_mark(owner, name)
+    skip_commits = mark is not None and head_oid is not None and mark["commit_oid"] == head_oid
+
+    async def no_commits() -> Dict[str, Any]:
+        return {"counts": Counter(), "newest": None, "found_mark": True}
+
+    commits, pull_requests = await asyncio.gather(
+        no_commits() if skip_commits else _sync_commits(
+            client, owner, name, mark, page_size,
+            QueryBudget(max_pages=catch_up_pages) if mark and mark["commit_oid"] else QueryBudget(max_pages=max_pages, max_cost=max_cost)
+        ),
+        _sync_pull_requests(client, owner, name, mark, page_size, QueryBudget(max_pages=max_pages, max_cost=max_cost))
+    )
+
+    # A marked commit missing from the walk back means the branch was rewritten, or
+    # moved further than the catch-up pages reach; either way the stored commit counts
+    # can no longer be extended, so start over
+    reset_commits = bool(mark and mark["commit_oid"]) and not commits["found_mark"]
+    if reset_commits:
+        logger.info(f"Marked commit of {owner}/{name} not reached; resyncing commits")
+        commits = await _sync_commits(client, owner, name, None, page_size, QueryBudget(max_pages=max_pages, max_cost=max_cost))
+
+    new_mark = dict(mark or EMPTY_MARK)
+    if commits["newest"] is not None:
+        new_mark["commit_oid"] = commits["newest"]["oid"]
+        new_mark["commit_date"] = commits["newest"]["committed_at"]
+    new_mark["pr_merged_at"] = pull_requests["newest_merge"]
+
+    counts = commits["counts"] + pull_requests["counts"]
+    merged = store.merge(owner, name, counts, mark, new_mark, reset_commits=reset_commits)
+    if not merged:
+        logger.info(f"Another sync of {owner}/{name} finished first; discarding this delta")
+
+    stats = {
+        "new_commits": sum(commits["counts"].values()),
+        "new_pull_requests": sum(pull_requests["counts"].values()),
+        "resynced": reset_commits,
+        "merged": merged
+    }
+    logger.info(f"Synced contributions for {owner}/{name}: {stats}")
+    return stats
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Any, AsyncIterator, Iterable, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+
+# Newest commits first, optionally bounded to a committed-date window
+COMMIT_PAGE_QUERY = """
+query ($owner: String!, $name: String!, $pageSize: Int!, $cursor: String, $since: GitTimestamp, $until: GitTimestamp) {
+  rateLimit {
+    cost
+    remaining
+  }
+  repository(owner: $owner, name: $name) {
+    primaryLanguage {
+      name
+    }
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $pageSize, after: $cursor, since: $since, until: $until) {
+            pageInfo {
+              hasNextPage
+              endCursor
+            }
+            nodes {
+              oid
+              committedDate
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Most recently updated first: a PR merged or created after some time was updated
+# after it too, so paging can stop at the first PR last updated before it
+PULL_REQUEST_PAGE_QUERY = """
+query ($owner: String!, $name: String!, $pageSize: Int!, $cursor: String) {
+  rateLimit {
+    cost
+    remaining
+  }
+  repository(owner: $owner, name: $name) {
+    primaryLanguage {
+      name
+    }
+    pullRequests(first: $pageSize, after: $cursor, states: MERGED, orderBy: {field: UPDATED_AT, direction: DESC}) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        createdAt
+        updatedAt
+        mergedAt
+      }
+    }
+  }
+}
+"""
+
+class QueryBudget:
+    """Page and GraphQL cost limits shared by every pager of one ingestion.
+
+    A pager reserves each page, its first included, before sending the request, so
+    pagers sharing a budget never send more than `max_pages` requests between them.
+    The cost limit is checked against points already spent. `truncated` is set when a
+    pager stops because the budget ran out while more pages may be left, so callers can
+    tell a partial history from a complete one.
+    """
+
+    def __init__(self, max_pages: Optional[int] = None, max_cost: Optional[int] = None):
+        self.max_pages = max_pages
+        self.max_cost = max_cost
+        self.pages = 0
+        self.cost = 0
+        self.remaining: Optional[int] = None
+        self.truncated = False
+
+    @property
+    def exhausted(self) -> bool:
+        return (
+            (self.max_pages is not None and self.pages >= self.max_pages)
+            or (self.max_cost is not None and self.cost >= self.max_cost)
+        )
+
+    def reserve(self) -> bool:
+        """Claim the next page, or mark the history truncated when the budget is spent."""
+        if self.exhausted:
+            self.truncated = True
+            return False
+        self.pages += 1
+        return True
+
+    def spend(self, rate_limit: Optional[Dict[str, Any]]) -> None:
+        if rate_limit:
+            self.cost += rate_limit["cost"]
+            self.remaining = rate_limit["remaining"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.pages, "cost": self.cost, "remaining": self.remaining, "truncated": self.truncated}
+
+def _language(repo: Dict[str, Any]) -> str:
+    return repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown"
+
+def _timestamp(date: Optional[str], end_of_day: bool = False) -> Optional[str]:
+    """Widen a `YYYY-MM-DD` window bound to a GitTimestamp; full timestamps pass through."""
+    if date is None or "T" in date:
+        return date
+    return f"{date}T23:59:59Z" if end_of_day else f"{date}T00:00:00Z"
+
+async def _repository_page(client, query: str, variables: Dict[str, Any], budget: QueryBudget) -> Dict[str, Any]:
+    """Fetch one page already reserved in `budget` and record its cost."""
+    # Pages past a sync mark must be current, or new commits would be missed until the cache expires
+    data = await client.graphql(query, variables, use_cache=False)
+    budget.spend(data["data"].get("rateLimit"))
+    repo = data["data"]["repository"]
+    if repo is None:
+        raise ValueError(f"Repository {variables['owner']}/{variables['name']} not found.")
+    return repo
+
+async def iter_commits(
+    client,
+    owner: str,
+    name: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    budget: Optional[QueryBudget] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield default-branch commits newest first, one page in memory at a time."""
+    budget = budget or QueryBudget()
+    cursor = None
+    while budget.reserve():
+        variables = {
+            "owner": owner,
+            "name": name,
+            "pageSize": page_size,
+            "cursor": cursor,
+            "since": _timestamp(since),
+            "until": _timestamp(until, end_of_day=True)
+        }
+        repo = await _repository_page(client, COMMIT_PAGE_QUERY, variables, budget)
+        target = repo["defaultBranchRef"]["target"] if repo["defaultBranchRef"] else None
+        history = target.get("history") if target else None
+        if history is None:
+            return  # Empty repository
+
+        language = _language(repo)
+        for node in history["nodes"]:
+            yield {
+                "oid": node["oid"],
+                "committed_at": node["committedDate"],
+                "date": node["committedDate"].split('T')[0],
+                "language": language,
+                "contribution_type": "commit"
+            }
+
+        if not history["pageInfo"]["hasNextPage"]:
+            return
+        cursor = history["pageInfo"]["endCursor"]
+
+async def iter_merged_pull_requests(
+    client,
+    owner: str,
+    name: str,
+    updated_since: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    budget: Optional[QueryBudget] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield merged PRs most recently updated first, stopping before any updated before `updated_since`."""
+    budget = budget or QueryBudget()
+    updated_since = _timestamp(updated_since)
+    cursor = None
+    while budget.reserve():
+        variables = {"owner": owner, "name": name, "pageSize": page_size, "cursor": cursor}
+        repo = await _repository_page(client, PULL_REQUEST_PAGE_QUERY, variables, budget)
+        language = _language(repo)
+        connection = repo["pullRequests"]
+        for node in connection["nodes"]:
+            # ISO 8601 timestamps in UTC compare correctly as strings
+            if updated_since is not None and node["updatedAt"] < updated_since:
+                return
+            yield {
+                "created_at": node["createdAt"],
+                "updated_at": node["updatedAt"],
+                "merged_at": node["mergedAt"],
+                "date": node["createdAt"].split('T')[0],
+                "language": language,
+                "contribution_type": "pull_request"
+            }
+
+        if not connection["pageInfo"]["hasNextPage"]:
+            return
+        cursor = connection["pageInfo"]["endCursor"]
+
+def build_structured_data(rows: Iterable[Tuple[str, str, str, int]]) -> Dict[str, Any]:
+    """Fold (date, language, contribution_type, count) rows into the shape of `heatmap.process_contributions`."""
+    structured_data: Dict[str, Any] = {}
+    for date, language, contribution_type, count in rows:
+        day = structured_data.setdefault(date, {"total_commits": 0, "languages": {}, "contribution_types": {}})
+        if contribution_type == "commit":
+            day["total_commits"] += count
+        day["languages"][language] = day["languages"].get(language, 0) + count
+        # Pull requests count twice here, as they always have in process_contributions
+        weight = 2 if contribution_type == "pull_request" else 1
+        day["contribution_types"][contribution_type] = day["contribution_types"].get(contribution_type, 0) + count * weight
+    return structured_data
+
+class ContributionAggregator:
+    """Running daily counts of streamed contribution records.
+
+    Memory grows with the number of distinct (day, language, type) keys, never with
+    the number of records, so a 100k-commit history costs a few thousand counters.
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.records = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.counts[(record["date"], record["language"], record["contribution_type"])] += 1
+        self.records += 1
+
+    async def consume(self, records: AsyncIterator[Dict[str, Any]]) -> None:
+        async for record in records:
+            self.add(record)
+
+    def structured_data(self, contribution_types: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Aggregated counts, newest day first."""
+        wanted = set(contribution_types) if contribution_types is not None else None
+        rows = [
+            key + (count,) for key, count in self.counts.items()
+            if wanted is None or key[2] in wanted
+        ]
+        # Same order as `ContributionStore.structured_data`: day descending, then language and type
+        rows.sort(key=lambda row: (row[1], row[2]))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return build_structured_data(rows)
+
+async def ingest_repository_async(
+    client,
+    owner: str,
+    name: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    max_pages: Optional[int] = None,
+    max_cost: Optional[int] = None,
+    aggregator: Optional[ContributionAggregator] = None
+) -> Tuple[ContributionAggregator, Dict[str, Any]]:
+    """Stream a repository's whole commit and merged PR history into an aggregator.
+
+    `since`/`until` bound the contribution dates (`YYYY-MM-DD`, inclusive). Paging stops
+    early once `max_pages` requests or `max_cost` GraphQL points are spent; the returned
+    stats say whether that happened. Pass an existing aggregator to fold several
+    repositories into one heatmap.
+    """
+    aggregator = aggregator or ContributionAggregator()
+    budget = QueryBudget(max_pages=max_pages, max_cost=max_cost)
+    until_timestamp = _timestamp(until, end_of_day=True)
+
+    async def pull_requests() -> AsyncIterator[Dict[str, Any]]:
+        # Created in the window means updated since its start, so `since` bounds paging
+        async for record in iter_merged_pull_requests(client, owner, name, updated_since=since, page_size=page_size, budget=budget):
+            if since is not None and record["created_at"] < _timestamp(since):
+                continue
+            if until_timestamp is not None and record["created_at"] > until_timestamp:
+                continue
+            yield record
+
+    await asyncio.gather(
+        aggregator.consume(iter_commits(client, owner, name, since=since, until=until, page_size=page_size, budget=budget)),
+        aggregator.consume(pull_requests())
+    )
+
+    stats = dict(budget.stats(), records=aggregator.records)
+    logger.info(f"Ingested contributions for {owner}/{name}: {stats}")
+    return aggregator, stats
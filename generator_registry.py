@@ -0,0 +1,62 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple, Type
+
+from pydantic import BaseModel
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Outlines memoizes the regex/FSM index it compiles for a schema in a diskcache under
+# OUTLINES_CACHE_DIR. Pointing it at the model volume lets a cold container load the
+# indexes built by an earlier one instead of recompiling them against the tokenizer.
+OUTLINES_CACHE_DIR = "/root/model_cache/outlines"
+
+def schema_key(schema: Type[BaseModel]) -> str:
+    """Identify a schema by its name and JSON schema, so edits to a model get a new entry."""
+    digest = hashlib.sha256(json.dumps(schema.model_json_schema(), sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{schema.__name__}-{digest[:12]}"
+
+class GeneratorRegistry:
+    """Build each schema's constrained JSON generator once and share it across requests."""
+
+    def __init__(self, llm, tokenizer_name: str):
+        self.llm = llm
+        self.tokenizer_name = tokenizer_name
+        self._generators: Dict[Tuple[str, str], Callable] = {}
+        self._lock = threading.Lock()
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        key = (schema_key(schema), self.tokenizer_name)
+        generator = self._generators.get(key)
+        if generator is None:
+            with self._lock:
+                generator = self._generators.get(key)
+                if generator is None:
+                    from outlines import generate
+                    started = time.monotonic()
+                    generator = self._generators[key] = generate.json(self.llm, schema)
+                    logger.info(f"Built {key[0]} generator in {time.monotonic() - started:.2f}s")
+        return generator
+
+    def warm(self, schemas: Iterable[Type[BaseModel]]) -> None:
+        for schema in schemas:
+            self.get(schema)
+
+def run_generation(llm, schema: Type[BaseModel], prompt: str):
+    """Generate one `schema` instance from whichever generation handle the caller has.
+
+    `llm` may be a `MicroBatchScheduler`, an `InferenceBackend`, a `GeneratorRegistry`
+    or a bare Outlines model.
+    """
+    if hasattr(llm, "submit"):
+        return llm.submit(schema, prompt)
+    if hasattr(llm, "get"):
+        return llm.get(schema)(prompt)
+    from outlines import generate
+    return generate.json(llm, schema)(prompt)
@@ -1,25 +1,32 @@
 import os
-import requests
+from github_client import GITHUB_API_URL, send_sync
 from datetime import datetime
 
 def analyze_github_profile(username, github_token):
     print(f"Analyzing GitHub profile for {username}...")
     
-    headers = {"Authorization": f"token {github_token}"}
-    
     # Fetch user info
-    user_url = f"https://api.github.com/users/{username}"
-    user_response = requests.get(user_url, headers=headers)
+    user_url = f"{GITHUB_API_URL}/users/{username}"
+    user_response = send_sync("GET", user_url, "core", github_token)
     if user_response.status_code != 200:
         raise Exception(f"GitHub API request failed with status code {user_response.status_code}")
     user_info_data = user_response.json()
 
+    user_info = _build_user_info(user_info_data)
+    print("GitHub profile analysis completed.")
+    return user_info
+
+async def analyze_github_profile_async(username, client):
+    user_info_data = await client.get_json(f"/users/{username}")
+    return _build_user_info(user_info_data)
+
+def _build_user_info(user_info_data):
     # Calculate years on GitHub
     user_creation_date = datetime.strptime(user_info_data['created_at'], "%Y-%m-%dT%H:%M:%SZ")
     current_date = datetime.now()
     years_on_github = current_date.year - user_creation_date.year
 
-    user_info = {
+    return {
         "username": user_info_data['login'],
         "avatar_url": user_info_data['avatar_url'],
         "years_on_github": years_on_github,
@@ -28,5 +35,3 @@ def analyze_github_profile(username, github_token):
         "following": user_info_data['following'],
         "bio": user_info_data['bio'],
     }
-    print("GitHub profile analysis completed.")
-    return user_info
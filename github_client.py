@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import aiohttp
+from yarl import URL
+
+from github_scheduler import DEFAULT_BLOCK_SECONDS, TokenPool, RateLimitExceeded, estimate_graphql_cost, get_token_pool
+from http_cache import HTTPCache, CachedResponse, cache_key, conditional_headers, get_cache, get_session, DEFAULT_POST_TTL_SECONDS
+from telemetry import CACHE_EVENTS, record_rate_limit, span
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Overridable for GitHub Enterprise or a local stand-in server (see benchmarks/)
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT_SECONDS = 30
+# Rate-limited responses are retried on another token (or after the block) this many times
+MAX_RATE_LIMIT_RETRIES = 3
+
+class GitHubAPIError(Exception):
+    """GitHub answered with an error status, or a GraphQL response without data."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        # Both in args, so the error survives pickling across Modal calls
+        super().__init__(message, status)
+        self.message = message
+        self.status = status
+
+    def __str__(self) -> str:
+        return self.message
+
+def check_response(response) -> None:
+    """Raise for a failed sync `requests` response: `RateLimitExceeded` when GitHub rate limited it."""
+    status, headers = response.status_code, response.headers
+    if status in (403, 429) and ("Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"):
+        if "Retry-After" in headers:
+            retry_after = float(headers["Retry-After"])
+        else:
+            retry_after = max(1.0, float(headers.get("X-RateLimit-Reset", 0)) - time.time())
+        raise RateLimitExceeded(f"GitHub rate limited {response.url}; retry in {retry_after:.0f}s", retry_after=retry_after)
+    if status not in (200, 304):
+        raise GitHubAPIError(f"GitHub API request failed with status code {status}", status)
+
+def check_graphql_response(status: Optional[int], data: Any) -> Dict[str, Any]:
+    """Raise unless the response carries data; per-field errors alongside data are left to callers."""
+    if status == 200 and isinstance(data, dict) and data.get("data") is not None:
+        return data
+    detail = "no data"
+    if isinstance(data, dict):
+        messages = [error.get("message", "GraphQL error") for error in data.get("errors") or []]
+        detail = "; ".join(messages) or data.get("message", detail)
+    raise GitHubAPIError(f"GitHub GraphQL request failed with status code {status}: {detail}", status)
+
+def _graphql_rate_limit(data: Any) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """The `rateLimit` object a query asked for, and whether GitHub refused it as RATE_LIMITED."""
+    if not isinstance(data, dict):
+        return None, False
+    limited = any(error.get("type") == "RATE_LIMITED" for error in data.get("errors") or [])
+    return (data.get("data") or {}).get("rateLimit"), limited
+
+def send_sync(
+    method: str,
+    url: str,
+    resource: str,
+    github_token: Optional[str] = None,
+    cost: int = 1,
+    params: Optional[Dict[str, Any]] = None,
+    json_body: Optional[Dict[str, Any]] = None
+):
+    """Blocking counterpart of `AsyncGitHubClient._send` over the cached `requests` session.
+
+    The token comes from the same `TokenPool` the async client uses, so sync fetches
+    share its budgets and queue for them instead of spending a token blind.
+    """
+    pool = get_token_pool([github_token] if github_token else None)
+    session = get_session()
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        lease = pool.acquire_sync(resource, cost)
+        headers = {"Authorization": f"Bearer {lease.token}"}
+        try:
+            if method == "GET":
+                response = session.get(url, headers=headers, params=params)
+            else:
+                response = session.post(url, headers=headers, json=json_body)
+        except BaseException:
+            pool.release(lease, None, None)
+            raise
+        if response.from_cache:
+            # Nothing was spent, and cached headers would report a stale budget
+            pool.release(lease, None, None)
+            return response
+
+        rate_limit, graphql_limited = None, False
+        if resource == "graphql":
+            try:
+                rate_limit, graphql_limited = _graphql_rate_limit(response.json())
+            except ValueError:
+                pass
+        if not pool.release(lease, response.status_code, response.headers, rate_limit, graphql_limited):
+            return response
+        logger.warning(f"GitHub rate limited {method} {url} (attempt {attempt + 1})")
+    # Still limited after every retry: `check_response` raises RateLimitExceeded for it
+    return response
+
+class AsyncGitHubClient:
+    """Keep-alive aiohttp client for GitHub with bounded concurrency.
+
+    One client (and so one pooled connection set) should be shared by every fetch a
+    container makes. Responses go through the same `HTTPCache` as the sync session, so
+    REST GETs are revalidated and GraphQL POSTs are reused while fresh. Every request
+    takes its token from a `TokenPool`, which spreads load across `GITHUB_TOKENS` and
+    queues requests while every token's budget is spent.
+
+        async with AsyncGitHubClient(pool=get_token_pool()) as client:
+            user, repos = await asyncio.gather(client.get_json(...), client.graphql(...))
+    """
+
+    def __init__(
+        self,
+        github_token: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+        cache: Optional[HTTPCache] = None,
+        post_ttl_seconds: int = DEFAULT_POST_TTL_SECONDS,
+        api_url: str = GITHUB_API_URL,
+        pool: Optional[TokenPool] = None
+    ):
+        self.pool = pool or get_token_pool([github_token] if github_token else None)
+        # The pool picks the token each request is sent with, and cache entries are keyed
+        # by that token; this one is only handed to callers that still want a token
+        self.github_token = github_token or self.pool.tokens[0]
+        self.api_url = api_url.rstrip("/")
+        self.graphql_url = f"{self.api_url}/graphql"
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        self.cache = cache or get_cache()
+        self.post_ttl_seconds = post_ttl_seconds
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncGitHubClient":
+        self._ensure_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        # Created lazily because aiohttp sessions must be bound to a running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Accept": "application/vnd.github+json"}
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        resource: str,
+        cost: int = 1,
+        headers: Optional[Dict[str, str]] = None,
+        json_body: Optional[Dict[str, Any]] = None
+    ) -> Tuple[int, Dict[str, str], bytes, str]:
+        """Send one request on a leased token, retrying on another when it is rate limited.
+
+        Returns the token the answer was sent with along with the response.
+        """
+        session = self._ensure_session()
+        api = "rest" if resource == "core" else resource
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            lease = await self.pool.acquire(resource, cost)
+            request_headers = {**(headers or {}), "Authorization": f"Bearer {lease.token}"}
+            try:
+                async with self._semaphore:
+                    with span(f"github.{api}", attempt=attempt):
+                        async with session.request(method, url, headers=request_headers, json=json_body) as response:
+                            body = await response.read()
+                            status = response.status
+                            response_headers = dict(response.headers)
+            except BaseException:
+                self.pool.release(lease, None, None)
+                raise
+            record_rate_limit(response_headers, api, status)
+
+            rate_limit, graphql_limited = None, False
+            if resource == "graphql":
+                try:
+                    rate_limit, graphql_limited = _graphql_rate_limit(json.loads(body))
+                except ValueError:
+                    pass
+            if not self.pool.release(lease, status, response_headers, rate_limit, graphql_limited):
+                return status, response_headers, body, lease.token
+            logger.warning(f"GitHub rate limited {method} {url} (attempt {attempt + 1})")
+        raise RateLimitExceeded(
+            f"GitHub rate limited {method} {url} on {MAX_RATE_LIMIT_RETRIES + 1} attempts",
+            retry_after=next((float(value) for name, value in response_headers.items() if name.lower() == "retry-after"), DEFAULT_BLOCK_SECONDS)
+        )
+
+    def _lookup(self, method: str, url: str, body: Any = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """The cache key and entry stored for this request under any of the pool's tokens."""
+        for token in self.pool.tokens:
+            key = cache_key(method, url, {"Authorization": f"Bearer {token}"}, body)
+            entry = self.cache.lookup(key)
+            if entry is not None:
+                return key, entry
+        return None, None
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None):
+        # Paths are resolved against `api_url` so a stand-in server can be swapped in
+        if url.startswith("/"):
+            url = self.api_url + url
+        full_url = str(URL(url).update_query(params or {}))
+        key, entry = self._lookup("GET", full_url)
+
+        status, headers, body, token = await self._send("GET", full_url, "core", headers=conditional_headers(entry))
+
+        if status == 304 and entry is not None:
+            logger.debug(f"HTTP cache revalidated: {full_url}")
+            CACHE_EVENTS.inc(cache="http", event="revalidated")
+            self.cache.refresh(key)
+            return CachedResponse(entry["url"], entry["status"], entry["headers"], entry["body"])
+
+        CACHE_EVENTS.inc(cache="http", event="miss")
+
+        if status == 200 and ("ETag" in headers or "Last-Modified" in headers):
+            self.cache.store(cache_key("GET", full_url, {"Authorization": f"Bearer {token}"}), full_url, status, headers, body)
+        result = CachedResponse(full_url, status, headers, body)
+        result.from_cache = False
+        return result
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        response = await self.get(url, params=params)
+        if response.status_code != 200:
+            raise GitHubAPIError(f"GitHub API request failed with status code {response.status_code}", response.status_code)
+        return response.json()
+
+    async def graphql(self, query: str, variables: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+        """Run a query; raises `GitHubAPIError` unless the response carries data.
+
+        `use_cache=False` always asks GitHub and stores nothing, for answers that must be current.
+        """
+        payload = {"query": query, "variables": variables}
+        key, entry = self._lookup("POST", self.graphql_url, payload) if use_cache else (None, None)
+        if entry is not None and time.time() - entry["stored_at"] <= self.post_ttl_seconds:
+            logger.debug(f"HTTP cache hit: {self.graphql_url}")
+            CACHE_EVENTS.inc(cache="http", event="hit")
+            self.cache.touch(key)
+            return json.loads(entry["body"])
+
+        cost = estimate_graphql_cost(query, variables)
+        status, headers, body, token = await self._send("POST", self.graphql_url, "graphql", cost, json_body=payload)
+        CACHE_EVENTS.inc(cache="http", event="miss")
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        check_graphql_response(status, data)
+        if use_cache and "errors" not in data:
+            key = cache_key("POST", self.graphql_url, {"Authorization": f"Bearer {token}"}, payload)
+            self.cache.store(key, self.graphql_url, status, headers, body)
+        return data
@@ -0,0 +1,339 @@
+from typing import Dict, Any, List, Optional, Tuple, TypedDict
+import asyncio
+import logging
+from github_client import GITHUB_API_URL, check_graphql_response, check_response, send_sync
+from github_scheduler import estimate_graphql_cost
+from contribution_table import ContributionTable
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+
+# Repository fields every analysis reads: metrics, commit and merged PR history, and
+# the README. Shared by the single-repo query and the per-repository queries; every
+# operation using it declares `$withHistory`, which callers that keep contributions
+# in a `ContributionStore` set to false to skip the two history connections.
+REPOSITORY_FRAGMENT = """
+fragment AnalysisRepository on Repository {
+  name
+  stargazerCount
+  forkCount
+  watchers {
+    totalCount
+  }
+  openIssues: issues(states: OPEN) {
+    totalCount
+  }
+  closedIssues: issues(states: CLOSED) {
+    totalCount
+  }
+  openPullRequests: pullRequests(states: OPEN) {
+    totalCount
+  }
+  primaryLanguage {
+    name
+  }
+  defaultBranchRef {
+    target {
+      oid
+      ... on Commit {
+        history(first: 100) @include(if: $withHistory) {
+          edges {
+            node {
+              committedDate
+              message
+              additions
+              deletions
+            }
+          }
+        }
+      }
+    }
+  }
+  pullRequests(first: 100, states: MERGED) @include(if: $withHistory) {
+    edges {
+      node {
+        createdAt
+        title
+        additions
+        deletions
+      }
+    }
+  }
+  object(expression: "HEAD:README.md") {
+    ... on Blob {
+      text
+    }
+  }
+}
+"""
+
+USER_FIELDS = """
+    login
+    avatarUrl
+    createdAt
+    bio
+    followers {
+      totalCount
+    }
+    following {
+      totalCount
+    }
+    repositories(first: 1, orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes {
+        ...AnalysisRepository
+      }
+    }
+"""
+
+# One query carrying everything a single analysis needs: the user profile and the
+# most recently updated repository. Every consumer reads from this payload instead
+# of refetching.
+ANALYSIS_QUERY = """
+query ($username: String!, $withHistory: Boolean = true) {
+  user(login: $username) {""" + USER_FIELDS + """  }
+}
+""" + REPOSITORY_FRAGMENT
+
+# Nodes one user contributes to ANALYSIS_QUERY: the repository plus up to 100 commits
+# and 100 merged PRs. GitHub rejects queries over 500,000 nodes and times out large
+# ones well before that, so batches are sized against a much smaller budget.
+NODES_PER_USER = 1 + 100 + 100
+MAX_BATCH_QUERY_NODES = 2500
+MAX_USERS_PER_QUERY = max(1, MAX_BATCH_QUERY_NODES // NODES_PER_USER)
+
+class RepoMetrics(TypedDict):
+    repo_name: str
+    stars: int
+    forks: int
+    open_issues: int
+    watchers: int
+    issues_closed: int
+
+class Contribution(TypedDict, total=False):
+    date: str
+    message: str
+    title: str
+    additions: int
+    deletions: int
+    language: str
+    contribution_type: str
+
+class RepoInfo(TypedDict):
+    name: str
+    head_oid: str
+    primary_language: str
+    commits: List[Contribution]
+    pull_requests: List[Contribution]
+    readme_content: str
+
+def build_repo_info(repo: Dict[str, Any]) -> RepoInfo:
+    """Flatten a repository node of `ANALYSIS_QUERY` into per-contribution records."""
+    language = repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown"
+
+    repo_info: RepoInfo = {
+        "name": repo["name"],
+        "head_oid": repo["defaultBranchRef"]["target"]["oid"] if repo["defaultBranchRef"] else "",
+        "primary_language": language,
+        "commits": [],
+        "pull_requests": [],
+        "readme_content": repo["object"]["text"] if repo["object"] else ""
+    }
+
+    # Both connections are absent when the query ran with `$withHistory: false`
+    history = repo["defaultBranchRef"]["target"].get("history", {"edges": []})["edges"] if repo["defaultBranchRef"] else []
+    for commit in history:
+        commit_node = commit["node"]
+        repo_info["commits"].append({
+            "date": commit_node["committedDate"].split('T')[0],  # Ensure date is a string without time component
+            "message": commit_node["message"],
+            "additions": commit_node["additions"],
+            "deletions": commit_node["deletions"],
+            "language": language,
+            "contribution_type": "commit"
+        })
+
+    for pr in repo.get("pullRequests", {"edges": []})["edges"]:
+        pr_node = pr["node"]
+        repo_info["pull_requests"].append({
+            "date": pr_node["createdAt"].split('T')[0],  # Ensure date is a string without time component
+            "title": pr_node["title"],
+            "additions": pr_node["additions"],
+            "deletions": pr_node["deletions"],
+            "language": language,
+            "contribution_type": "pull_request"
+        })
+
+    return repo_info
+
+def build_contribution_table(repo: Dict[str, Any], table: Optional[ContributionTable] = None) -> ContributionTable:
+    """Append a repository node's commits and merged PRs to a columnar table.
+
+    Reads the GraphQL nodes directly, so no per-contribution dicts are built. Pass the
+    same table for several repositories to heatmap them together.
+    """
+    table = table if table is not None else ContributionTable()
+    language = repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown"
+    history = repo["defaultBranchRef"]["target"].get("history", {"edges": []})["edges"] if repo["defaultBranchRef"] else []
+    for commit in history:
+        node = commit["node"]
+        table.append(node["committedDate"], language, "commit", node["additions"], node["deletions"], node["message"])
+    for pr in repo.get("pullRequests", {"edges": []})["edges"]:
+        node = pr["node"]
+        table.append(node["createdAt"], language, "pull_request", node["additions"], node["deletions"], node["title"])
+    return table
+
+def build_repo_metrics(repo: Dict[str, Any]) -> RepoMetrics:
+    """Map a repository node of `ANALYSIS_QUERY` onto the `fetch_repo_data` shape."""
+    return {
+        "repo_name": repo["name"],
+        "stars": repo.get("stargazerCount", 0),
+        "forks": repo.get("forkCount", 0),
+        # The REST `open_issues_count` counts open pull requests as issues too
+        "open_issues": repo["openIssues"]["totalCount"] + repo["openPullRequests"]["totalCount"],
+        "watchers": repo["watchers"]["totalCount"],
+        "issues_closed": repo["closedIssues"]["totalCount"]
+    }
+
+def build_batch_query(usernames: List[str], with_history: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """Fold several users into one query, aliasing each `user` field as `u<index>`."""
+    variables: Dict[str, Any] = {f"u{i}": username for i, username in enumerate(usernames)}
+    declarations = ", ".join(f"${alias}: String!" for alias in variables) + ", $withHistory: Boolean = true"
+    fields = "".join(
+        f"""
+  {alias}: user(login: ${alias}) {{""" + USER_FIELDS + "  }"
+        for alias in variables
+    )
+    variables["withHistory"] = with_history
+    return f"query ({declarations}) {{{fields}\n}}\n" + REPOSITORY_FRAGMENT, variables
+
+def chunk_usernames(usernames: List[str], chunk_size: int = MAX_USERS_PER_QUERY) -> List[List[str]]:
+    return [usernames[i:i + chunk_size] for i in range(0, len(usernames), chunk_size)]
+
+class GitHubGateway:
+    """Single source of GitHub data for one analysis.
+
+    The combined query is issued at most once per gateway and the payload is memoized,
+    so create one gateway per analysis and pass its slices to every consumer.
+    """
+
+    def __init__(self, username: str, github_token: str, with_history: bool = True):
+        self.username = username
+        self.github_token = github_token
+        # Without history, `commits()` and `pull_requests()` are empty
+        self.with_history = with_history
+        self._payload: Optional[Dict[str, Any]] = None
+        self._repo_info: Optional[RepoInfo] = None
+
+    @classmethod
+    def from_user(cls, username: str, github_token: str, user: Dict[str, Any], with_history: bool = True) -> "GitHubGateway":
+        """Build a gateway around a `user` payload that was fetched elsewhere, e.g. in a batch."""
+        gateway = cls(username, github_token, with_history=with_history)
+        gateway._load({"data": {"user": user}})
+        return gateway
+
+    def _load(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        user = data["data"]["user"]
+        if user is None:
+            raise ValueError(f"GitHub user {self.username} not found.")
+        if not user["repositories"]["nodes"]:
+            raise ValueError("No repositories found for the given user.")
+        self._payload = user
+        return user
+
+    def _variables(self) -> Dict[str, Any]:
+        return {"username": self.username, "withHistory": self.with_history}
+
+    def _fetch(self) -> Dict[str, Any]:
+        if self._payload is None:
+            variables = self._variables()
+            response = send_sync(
+                "POST", GRAPHQL_URL, "graphql", self.github_token,
+                cost=estimate_graphql_cost(ANALYSIS_QUERY, variables),
+                json_body={"query": ANALYSIS_QUERY, "variables": variables}
+            )
+            check_response(response)
+            self._load(check_graphql_response(response.status_code, response.json()))
+        return self._payload
+
+    async def fetch_async(self, client) -> Dict[str, Any]:
+        """Populate the gateway through a shared `AsyncGitHubClient` instead of blocking."""
+        if self._payload is None:
+            self._load(await client.graphql(ANALYSIS_QUERY, self._variables()))
+        return self._payload
+
+    def _repo(self) -> Dict[str, Any]:
+        return self._fetch()["repositories"]["nodes"][0]
+
+    def user_profile(self) -> Dict[str, Any]:
+        return self._fetch()
+
+    def repo_metrics(self) -> RepoMetrics:
+        return build_repo_metrics(self._repo())
+
+    def repo_info(self) -> RepoInfo:
+        if self._repo_info is None:
+            self._repo_info = build_repo_info(self._repo())
+        return self._repo_info
+
+    def contribution_table(self) -> ContributionTable:
+        """Commits and merged PRs in columnar form, without the per-record dicts of `repo_info`."""
+        return build_contribution_table(self._repo())
+
+    def commits(self) -> List[Contribution]:
+        return self.repo_info()["commits"]
+
+    def pull_requests(self) -> List[Contribution]:
+        return self.repo_info()["pull_requests"]
+
+    def readme(self) -> str:
+        return self.repo_info()["readme_content"]
+
+    def contributions_data(self) -> Dict[str, Any]:
+        """Return the payload in the shape produced by `heatmap.fetch_contributions_data`."""
+        repo_info = self.repo_info()
+        return {
+            "user_profile": self.user_profile(),
+            "repo_analysis": [repo_info],
+            "readme_content": repo_info["readme_content"]
+        }
+
+async def fetch_gateways_async(client, usernames: List[str], with_history: bool = True) -> Dict[str, Any]:
+    """Fetch many users with aliased batch queries.
+
+    Returns a `GitHubGateway` per username, or the exception explaining why that user
+    could not be loaded, so one bad username never fails the whole batch.
+    """
+    async def fetch_chunk(chunk: List[str]) -> Dict[str, Any]:
+        query, variables = build_batch_query(chunk, with_history=with_history)
+        try:
+            data = await client.graphql(query, variables)
+        except Exception as e:
+            return {username: e for username in chunk}
+
+        # Errors for missing users come back per alias alongside the other users' data
+        errors = {}
+        for error in data.get("errors", []):
+            for alias in error.get("path", [])[:1]:
+                errors[alias] = error.get("message", "GraphQL error")
+
+        results = {}
+        users = data.get("data") or {}
+        for alias, username in variables.items():
+            if alias == "withHistory":
+                continue
+            if alias in errors:
+                results[username] = ValueError(errors[alias])
+                continue
+            try:
+                results[username] = GitHubGateway.from_user(username, client.github_token, users.get(alias), with_history=with_history)
+            except Exception as e:
+                results[username] = e
+        return results
+
+    gateways: Dict[str, Any] = {}
+    for chunk_result in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunk_usernames(usernames))):
+        gateways.update(chunk_result)
+    return gateways
@@ -0,0 +1,437 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from telemetry import GITHUB_QUEUE_SECONDS, GITHUB_RATE_LIMITED
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Lower runs first: people waiting on a page before queued jobs and batches
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Share of each token's window that batch work leaves for interactive requests
+BATCH_RESERVE_FRACTION = float(os.getenv("GITHUB_BATCH_RESERVE_FRACTION", 0.2))
+# How long a request queues for budget before giving up with RateLimitExceeded
+MAX_WAIT_SECONDS = {PRIORITY_INTERACTIVE: 30.0, PRIORITY_BATCH: 900.0}
+# Waiters re-check this often, since in-flight reservations can return budget any time
+POLL_SECONDS = 0.25
+# GitHub's separately limited APIs: REST and GraphQL
+RESOURCES = ("core", "graphql")
+# Blocked for this long when GitHub rate limits without saying until when
+DEFAULT_BLOCK_SECONDS = 60.0
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("github_priority", default=PRIORITY_INTERACTIVE)
+
+def current_priority() -> int:
+    return _priority.get()
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """Run GitHub requests made in this context (and tasks started from it) at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class RateLimitExceeded(Exception):
+    """No token had budget for a request within its wait limit."""
+
+    def __init__(self, message: str, retry_after: float = DEFAULT_BLOCK_SECONDS):
+        # Both in args, so the error survives pickling across Modal calls
+        super().__init__(message, retry_after)
+        self.message = message
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return self.message
+
+# GraphQL cost, per GitHub's formula: every connection is charged for the nodes it can
+# return, the product of its own and its ancestors' `first:` values; the sum is divided
+# by 100 and rounded up, with a minimum of 1
+
+_GRAPHQL_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\.\.\.|\$?[_A-Za-z][_0-9A-Za-z]*|-?\d+(?:\.\d+)?|[{}():@=!\[\]]')
+
+def _tokenize(query: str) -> List[str]:
+    return _GRAPHQL_TOKEN.findall(re.sub(r"#[^\n]*", "", query))
+
+def _skip_value(tokens: List[str], i: int) -> int:
+    """Index past the argument value starting at `i`, skipping nested objects and lists."""
+    if tokens[i] in ("{", "["):
+        depth = 0
+        while True:
+            if tokens[i] in ("{", "["):
+                depth += 1
+            elif tokens[i] in ("}", "]"):
+                depth -= 1
+            i += 1
+            if depth == 0:
+                return i
+    return i + 1
+
+def _parse_selection_set(tokens: List[str], i: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Parse `{ ... }` at `i` into field, spread and inline-fragment nodes."""
+    selections: List[Dict[str, Any]] = []
+    i += 1
+    while tokens[i] != "}":
+        node: Dict[str, Any] = {"kind": "field", "page_size": None, "conditions": [], "children": []}
+        if tokens[i] == "...":
+            i += 1
+            if tokens[i] == "on":
+                node["kind"] = "inline"
+                i += 2
+            elif tokens[i] not in ("@", "{"):
+                node = {"kind": "spread", "name": tokens[i], "conditions": []}
+                i += 1
+            else:
+                node["kind"] = "inline"
+        else:
+            i += 1
+            if tokens[i] == ":":
+                i += 2  # alias: the field name follows
+            if tokens[i] == "(":
+                i += 1
+                while tokens[i] != ")":
+                    name = tokens[i]
+                    value = tokens[i + 2]
+                    if name in ("first", "last"):
+                        node["page_size"] = value
+                    i = _skip_value(tokens, i + 2)
+                i += 1
+        while tokens[i] == "@":
+            # @include(if: X) / @skip(if: X)
+            directive, value = tokens[i + 1], tokens[i + 5]
+            node["conditions"].append((directive, value))
+            i += 7
+        if node["kind"] != "spread" and tokens[i] == "{":
+            node["children"], i = _parse_selection_set(tokens, i)
+        selections.append(node)
+    return selections, i + 1
+
+@functools.lru_cache(maxsize=256)
+def _parse_query(query: str) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+    """The operation's selections, fragment bodies by name, and variable defaults."""
+    tokens = _tokenize(query)
+    operation: List[Dict[str, Any]] = []
+    fragments: Dict[str, List[Dict[str, Any]]] = {}
+    defaults: Dict[str, str] = {}
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "fragment":
+            name = tokens[i + 1]
+            i += 4  # fragment Name on Type
+            fragments[name], i = _parse_selection_set(tokens, i)
+            continue
+        if tokens[i] == "(":
+            # Variable definitions: $name: Type[!] [= default]
+            while tokens[i] != ")":
+                if tokens[i].startswith("$") and tokens[i + 1] == ":":
+                    variable = tokens[i]
+                    i += 2
+                    while tokens[i] not in ("=", ")") and not tokens[i].startswith("$"):
+                        i += 1
+                    if tokens[i] == "=":
+                        defaults[variable[1:]] = tokens[i + 1]
+                        i += 2
+                    continue
+                i += 1
+        if tokens[i] == "{":
+            operation, i = _parse_selection_set(tokens, i)
+            continue
+        i += 1
+    return operation, fragments, defaults
+
+def _resolve(value: str, variables: Dict[str, Any], defaults: Dict[str, str]) -> Any:
+    if value.startswith("$"):
+        name = value[1:]
+        value = variables[name] if name in variables else defaults.get(name)
+    if isinstance(value, str):
+        if value in ("true", "false"):
+            return value == "true"
+        if value.lstrip("-").isdigit():
+            return int(value)
+    return value
+
+def _count_requests(
+    selections: List[Dict[str, Any]],
+    multiplier: int,
+    fragments: Dict[str, List[Dict[str, Any]]],
+    variables: Dict[str, Any],
+    defaults: Dict[str, str]
+) -> int:
+    requests = 0
+    for node in selections:
+        included = all(
+            bool(_resolve(value, variables, defaults)) == (directive == "include")
+            for directive, value in node["conditions"]
+        )
+        if not included:
+            continue
+        if node["kind"] == "spread":
+            requests += _count_requests(fragments.get(node["name"], []), multiplier, fragments, variables, defaults)
+            continue
+        child_multiplier = multiplier
+        page_size = _resolve(node["page_size"], variables, defaults) if node["page_size"] is not None else None
+        if isinstance(page_size, int) and node["children"]:
+            child_multiplier = multiplier * page_size
+            requests += child_multiplier
+        requests += _count_requests(node["children"], child_multiplier, fragments, variables, defaults)
+    return requests
+
+def estimate_graphql_cost(query: str, variables: Optional[Dict[str, Any]] = None) -> int:
+    """Rate-limit points GitHub will charge for `query`, computed before sending it."""
+    try:
+        operation, fragments, defaults = _parse_query(query)
+        requests = _count_requests(operation, 1, fragments, variables or {}, defaults)
+    except (IndexError, KeyError) as e:
+        logger.warning(f"Could not estimate GraphQL cost, assuming 1: {str(e)}")
+        return 1
+    return max(1, -(-requests // 100))
+
+class Lease:
+    """One request's claim on a token: `cost` points are reserved until `release`."""
+
+    __slots__ = ("token", "resource", "cost")
+
+    def __init__(self, token: str, resource: str, cost: int):
+        self.token = token
+        self.resource = resource
+        self.cost = cost
+
+class _Budget:
+    __slots__ = ("limit", "remaining", "reset_at", "reserved", "blocked_until", "uses")
+
+    def __init__(self):
+        # Unknown until the first response reports the window
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.reserved = 0
+        self.blocked_until = 0.0
+        self.uses = 0
+
+    def available(self, now: float) -> float:
+        if self.remaining is None:
+            return float("inf")
+        if now >= self.reset_at:
+            # A new window: full again, or unknown until the next response says
+            return (self.limit if self.limit is not None else float("inf")) - self.reserved
+        return self.remaining - self.reserved
+
+class TokenPool:
+    """Rate-limit budgets per token and per API ("core" for REST, "graphql"), shared by every client.
+
+    Each request reserves its estimated cost on the token with the most budget left,
+    and every response's X-RateLimit headers (or GraphQL `rateLimit` field) correct
+    the estimate. When no token can afford a request it queues until a window resets
+    or a block lifts, interactive requests ahead of batch ones; batch requests also
+    leave `batch_reserve` of each window untouched.
+    """
+
+    def __init__(self, tokens: List[str], batch_reserve: float = BATCH_RESERVE_FRACTION):
+        if not tokens:
+            raise ValueError("At least one GitHub token is required")
+        self.tokens = list(dict.fromkeys(tokens))
+        self.batch_reserve = batch_reserve
+        self._budgets: Dict[Tuple[str, str], _Budget] = {}
+        # Queued requests per API as (priority, arrival) tickets; only the head may take budget
+        self._waiting: Dict[str, List[Tuple[int, int]]] = {}
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def _budget(self, token: str, resource: str) -> _Budget:
+        budget = self._budgets.get((token, resource))
+        if budget is None:
+            budget = self._budgets[(token, resource)] = _Budget()
+        return budget
+
+    def _try_lease(self, resource: str, cost: int, priority: int, now: float) -> Optional[Lease]:
+        best = None
+        for token in self.tokens:
+            budget = self._budget(token, resource)
+            if budget.blocked_until > now:
+                continue
+            available = budget.available(now)
+            floor = budget.limit * self.batch_reserve if priority >= PRIORITY_BATCH and budget.limit else 0
+            if available - cost < floor:
+                continue
+            # Most budget left first; unused tokens before busy ones when nothing is known
+            rank = (available, -budget.uses)
+            if best is None or rank > best[0]:
+                best = (rank, token, budget)
+        if best is None:
+            return None
+        _, token, budget = best
+        if budget.remaining is not None and now >= budget.reset_at:
+            budget.remaining = budget.limit
+        budget.reserved += cost
+        budget.uses += 1
+        return Lease(token, resource, cost)
+
+    def _next_change(self, resource: str, now: float) -> float:
+        """Seconds until some token's block lifts or window resets."""
+        moments = []
+        for token in self.tokens:
+            budget = self._budget(token, resource)
+            moments.append(max(budget.blocked_until, budget.reset_at if budget.remaining is not None else 0.0))
+        return max(0.0, min(moments) - now)
+
+    def _enqueue(self, resource: str, priority: int) -> Tuple[int, int]:
+        ticket = (priority, next(self._arrivals))
+        with self._lock:
+            heapq.heappush(self._waiting.setdefault(resource, []), ticket)
+        return ticket
+
+    def _dequeue(self, resource: str, ticket: Tuple[int, int]) -> None:
+        with self._lock:
+            queue = self._waiting[resource]
+            queue.remove(ticket)
+            heapq.heapify(queue)
+
+    def _poll(self, resource: str, cost: int, ticket: Tuple[int, int], started: float, deadline: float) -> Tuple[Optional[Lease], float]:
+        """A lease when `ticket` heads the queue and a token can afford `cost`, else how long to sleep."""
+        now = time.time()
+        with self._lock:
+            if self._waiting[resource][0] == ticket:
+                lease = self._try_lease(resource, cost, ticket[0], now)
+                if lease is not None:
+                    GITHUB_QUEUE_SECONDS.observe(time.monotonic() - started, resource=resource, priority=ticket[0])
+                    return lease, 0.0
+            wait = self._next_change(resource, now)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RateLimitExceeded(
+                f"No GitHub token can spend {cost} {resource} points now; retry in {wait:.0f}s",
+                retry_after=max(wait, 1.0)
+            )
+        return None, min(POLL_SECONDS, remaining, wait or POLL_SECONDS)
+
+    def _deadline(self, priority: int, max_wait: Optional[float]) -> Tuple[float, float]:
+        max_wait = MAX_WAIT_SECONDS.get(priority, MAX_WAIT_SECONDS[PRIORITY_BATCH]) if max_wait is None else max_wait
+        started = time.monotonic()
+        return started, started + max_wait
+
+    async def acquire(self, resource: str, cost: int = 1, priority: Optional[int] = None, max_wait: Optional[float] = None) -> Lease:
+        priority = current_priority() if priority is None else priority
+        started, deadline = self._deadline(priority, max_wait)
+        ticket = self._enqueue(resource, priority)
+        try:
+            while True:
+                lease, sleep = self._poll(resource, cost, ticket, started, deadline)
+                if lease is not None:
+                    return lease
+                await asyncio.sleep(sleep)
+        finally:
+            self._dequeue(resource, ticket)
+
+    def acquire_sync(self, resource: str, cost: int = 1, priority: Optional[int] = None, max_wait: Optional[float] = None) -> Lease:
+        """`acquire` for blocking callers, e.g. `requests` fetches run in worker threads."""
+        priority = current_priority() if priority is None else priority
+        started, deadline = self._deadline(priority, max_wait)
+        ticket = self._enqueue(resource, priority)
+        try:
+            while True:
+                lease, sleep = self._poll(resource, cost, ticket, started, deadline)
+                if lease is not None:
+                    return lease
+                time.sleep(sleep)
+        finally:
+            self._dequeue(resource, ticket)
+
+    def release(
+        self,
+        lease: Lease,
+        status: Optional[int],
+        headers,
+        rate_limit: Optional[Dict[str, Any]] = None,
+        rate_limited: bool = False
+    ) -> bool:
+        """Return the reservation and record the response; True when it was rate limited.
+
+        `rate_limit` is a GraphQL `rateLimit { cost remaining resetAt }` object, and
+        `rate_limited` flags GraphQL RATE_LIMITED errors, which arrive with a 200.
+        """
+        now = time.time()
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        with self._lock:
+            budget = self._budget(lease.token, lease.resource)
+            budget.reserved = max(0, budget.reserved - lease.cost)
+
+            if "x-ratelimit-remaining" in headers:
+                reported = self._budget(lease.token, headers.get("x-ratelimit-resource", lease.resource))
+                reported.remaining = int(headers["x-ratelimit-remaining"])
+                if "x-ratelimit-limit" in headers:
+                    reported.limit = int(headers["x-ratelimit-limit"])
+                if "x-ratelimit-reset" in headers:
+                    reported.reset_at = float(headers["x-ratelimit-reset"])
+            if rate_limit and "remaining" in rate_limit:
+                budget.remaining = int(rate_limit["remaining"])
+                if rate_limit.get("limit"):
+                    budget.limit = int(rate_limit["limit"])
+                if rate_limit.get("resetAt"):
+                    budget.reset_at = datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00")).timestamp()
+
+            limited = rate_limited or (status in (403, 429) and ("retry-after" in headers or budget.remaining == 0))
+            if limited:
+                GITHUB_RATE_LIMITED.inc(resource=lease.resource)
+                if "retry-after" in headers:
+                    # Secondary limits cover every API of the token
+                    until = now + float(headers["retry-after"])
+                    resources = {resource for _, resource in self._budgets} | set(RESOURCES)
+                    for resource in resources:
+                        token_budget = self._budget(lease.token, resource)
+                        token_budget.blocked_until = max(token_budget.blocked_until, until)
+                else:
+                    budget.remaining = 0
+                    budget.blocked_until = budget.reset_at if budget.reset_at > now else now + DEFAULT_BLOCK_SECONDS
+                logger.warning(f"GitHub rate limited a {lease.resource} request; token blocked for {budget.blocked_until - now:.0f}s")
+        return limited
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Budget per token (by position, never the token itself) and API."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "token": self.tokens.index(token),
+                    "resource": resource,
+                    "limit": budget.limit,
+                    "remaining": budget.remaining,
+                    "reserved": budget.reserved,
+                    "reset_in": max(0.0, round(budget.reset_at - now, 1)) if budget.remaining is not None else None,
+                    "blocked_for": max(0.0, round(budget.blocked_until - now, 1))
+                }
+                for (token, resource), budget in self._budgets.items()
+            ]
+
+_pools: Dict[Tuple[str, ...], TokenPool] = {}
+_pools_lock = threading.Lock()
+
+def tokens_from_env() -> List[str]:
+    """`GITHUB_TOKENS` (comma-separated) when set, else the single `GITHUB_TOKEN`."""
+    tokens = [token.strip() for token in os.getenv("GITHUB_TOKENS", "").split(",") if token.strip()]
+    if not tokens and os.getenv("GITHUB_TOKEN"):
+        tokens = [os.environ["GITHUB_TOKEN"]]
+    return tokens
+
+def get_token_pool(tokens: Optional[List[str]] = None) -> TokenPool:
+    """The process-wide pool for `tokens` (default: from the environment), so every client shares its budgets."""
+    tokens = tokens or tokens_from_env()
+    key = tuple(dict.fromkeys(tokens))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = TokenPool(list(key))
+        return _pools[key]
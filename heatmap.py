@@ -1,18 +1,11 @@
-import json
-import requests
-from typing import List, Dict, Any
-from pydantic import BaseModel, Field, ValidationError
-from datetime import datetime, timedelta
-from collections import defaultdict
-import re
-
-# Define a Pydantic model to enforce type constraints on the fetched data
-class ContributionData(BaseModel):
-    repo_name: str
-    date: datetime
-    commit_size: int = Field(..., ge=0)  # Ensure commit size is non-negative
-    language: str
-    contribution_type: str
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
+from pydantic import BaseModel
+from datetime import datetime
+from github_gateway import GitHubGateway
+from contribution_stream import ingest_repository_async
+from contribution_table import ContributionTable
+from telemetry import traced
 
 # Define a Pydantic model for the processed contributions data
 class ProcessedContributionData(BaseModel):
@@ -22,159 +15,96 @@ class ProcessedContributionData(BaseModel):
 
 # Step 1: Fetch GitHub contributions data
 def fetch_contributions_data(username: str, github_token: str) -> Dict[str, Any]:
-    headers = {"Authorization": f"Bearer {github_token}"}
-    url = "https://api.github.com/graphql"
-    
-    query = """
-    query ($username: String!) {
-      user(login: $username) {
-        login
-        avatarUrl
-        createdAt
-        bio
-        followers {
-          totalCount
-        }
-        following {
-          totalCount
-        }
-        repositories(first: 1, orderBy: {field: UPDATED_AT, direction: DESC}) {
-          nodes {
-            name
-            primaryLanguage {
-              name
-            }
-            defaultBranchRef {
-              target {
-                ... on Commit {
-                  history(first: 100) {
-                    edges {
-                      node {
-                        committedDate
-                        message
-                        additions
-                        deletions
-                      }
-                    }
-                  }
-                }
-              }
-            }
-            pullRequests(first: 100, states: MERGED) {
-              edges {
-                node {
-                  createdAt
-                  title
-                  additions
-                  deletions
-                }
-              }
-            }
-            object(expression: "HEAD:README.md") {
-              ... on Blob {
-                text
-              }
-            }
-          }
-        }
-      }
-    }
+    # Callers that also need repo metrics or the README should share one GitHubGateway
+    # instead, so the combined query is only issued once per analysis.
+    return GitHubGateway(username, github_token).contributions_data()
+
+async def fetch_contributions_data_async(username: str, client) -> Dict[str, Any]:
+    gateway = GitHubGateway(username, client.github_token)
+    await gateway.fetch_async(client)
+    return gateway.contributions_data()
+
+async def fetch_structured_contributions_async(
+    username: str,
+    repo_name: str,
+    client,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    max_pages: Optional[int] = None,
+    max_cost: Optional[int] = None
+) -> Dict[str, Any]:
+    """Full-history replacement for `fetch_contributions_data` + `process_contributions`.
+
+    Commits and merged PRs stream page by page into a running aggregator, so the result
+    is ready for `generate_visual_attributes` without ever holding the history in memory.
+    The whole history is read unless `max_pages` or `max_cost` is given. Served by
+    /api/heatmap/history.
     """
-    
-    response = requests.post(url, headers=headers, json={"query": query, "variables": {"username": username}})
-    data = response.json()
-    
-    user_profile = data["data"]["user"]
-    repo = user_profile["repositories"]["nodes"][0]  # Get the first repository
-    
-    repo_info = {
-        "name": repo["name"],
-        "primary_language": repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown",
-        "commits": [],
-        "pull_requests": [],
-        "readme_content": repo["object"]["text"] if repo["object"] else ""
-    }
-    
-    for commit in repo["defaultBranchRef"]["target"]["history"]["edges"]:
-        commit_node = commit["node"]
-        repo_info["commits"].append({
-            "date": commit_node["committedDate"].split('T')[0],  # Ensure date is a string without time component
-            "message": commit_node["message"],
-            "additions": commit_node["additions"],
-            "deletions": commit_node["deletions"],
-            "language": repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown",
-            "contribution_type": "commit"
-        })
-    
-    for pr in repo["pullRequests"]["edges"]:
-        pr_node = pr["node"]
-        repo_info["pull_requests"].append({
-            "date": pr_node["createdAt"].split('T')[0],  # Ensure date is a string without time component
-            "title": pr_node["title"],
-            "additions": pr_node["additions"],
-            "deletions": pr_node["deletions"],
-            "language": repo["primaryLanguage"]["name"] if repo["primaryLanguage"] else "Unknown",
-            "contribution_type": "pull_request"
-        })
-    
-    return {
-        "user_profile": user_profile,
-        "repo_analysis": [repo_info],
-        "readme_content": repo_info["readme_content"]  # Add README content to the return value
-    }
+    aggregator, _ = await ingest_repository_async(
+        client, username, repo_name, since=since, until=until, max_pages=max_pages, max_cost=max_cost
+    )
+    return aggregator.structured_data()
 
 def calculate_years_on_github(created_at: str) -> int:
     user_creation_date = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%SZ")
     current_date = datetime.now()
     return current_date.year - user_creation_date.year
 
-# Step 2: Process and structure contributions data
-def process_contributions(contributions: List[Dict[str, Any]]) -> Dict[str, Any]:
-    structured_data = defaultdict(lambda: {
-        "total_commits": 0,
-        "languages": defaultdict(int),
-        "contribution_types": defaultdict(int)
-    })
-
-    for contribution in contributions:
-        # Debugging: Print the contribution to check its structure
-        print("Processing contribution:", json.dumps(contribution, indent=2))
-        
-        if "date" not in contribution:
-            print("Missing date in contribution:", json.dumps(contribution, indent=2))
-            continue  # Skip this contribution if date is missing
-        
-        date = contribution["date"]
-        language = contribution["language"]
-        contribution_type = contribution["contribution_type"]
-
-        # Increment the total number of commits or pull requests on that date
-        if contribution_type == "commit":
-            structured_data[date]["total_commits"] += 1
-        elif contribution_type == "pull_request":
-            structured_data[date]["contribution_types"]["pull_request"] += 1
-        
-        structured_data[date]["languages"][language] += 1
-        structured_data[date]["contribution_types"][contribution_type] += 1
+def _pair_counts(outer: np.ndarray, inner: np.ndarray, n_inner: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Count (outer, inner) code pairs, returned in order of each pair's first occurrence."""
+    pairs = outer * n_inner + inner
+    unique_pairs, first_index, counts = np.unique(pairs, return_index=True, return_counts=True)
+    order = np.argsort(first_index, kind="stable")
+    unique_pairs, counts = unique_pairs[order], counts[order]
+    return unique_pairs // n_inner, unique_pairs % n_inner, counts
 
-    # Debugging: Print the structured data before validation
-    print("Structured data before validation:", json.dumps(structured_data, indent=2))
+# Step 2: Process and structure contributions data
+@traced("aggregate.process_contributions")
+def process_contributions(contributions: Union[List[Dict[str, Any]], ContributionTable]) -> Dict[str, Any]:
+    # Columnar pass over a shared ContributionTable; plain record lists are packed
+    # into one first, skipping contributions without a date
+    table = contributions if isinstance(contributions, ContributionTable) else ContributionTable.from_records(contributions)
+    if not len(table):
+        return {}
 
-    # Convert defaultdicts to regular dictionaries
-    structured_data = {date: dict(data) for date, data in structured_data.items()}
+    # Number dates in first-seen order, as the per-date dict keys have always been
+    unique_days, first_index, inverse = np.unique(table.column("days"), return_index=True, return_inverse=True)
+    order = np.argsort(first_index, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    date_codes = rank[inverse.reshape(-1)]
+    date_values = ContributionTable.day_strings(unique_days[order])
+    n_dates = len(date_values)
+
+    language_codes, language_values = table.column("language_codes").astype(np.int64), table.languages
+    type_codes, type_values = table.column("type_codes").astype(np.int64), table.contribution_types
+
+    # Total commits per date
+    if "commit" in type_values:
+        commit_mask = type_codes == type_values.index("commit")
+        total_commits = np.bincount(date_codes[commit_mask], minlength=n_dates).tolist()
+    else:
+        total_commits = [0] * n_dates
+
+    structured_data = {
+        date: {"total_commits": commits, "languages": {}, "contribution_types": {}}
+        for date, commits in zip(date_values, total_commits)
+    }
 
-    try:
-        validated_data = {date: ProcessedContributionData(**data).dict() for date, data in structured_data.items()}
-    except ValidationError as e:
-        print(f"Validation error: {e}")
-        return {}
+    for date_code, language_code, count in zip(*(a.tolist() for a in _pair_counts(date_codes, language_codes, len(language_values)))):
+        structured_data[date_values[date_code]]["languages"][language_values[language_code]] = count
 
-    # Debugging: Print the validated data
-    print("Validated data:", json.dumps(validated_data, indent=2))
+    for date_code, type_code, count in zip(*(a.tolist() for a in _pair_counts(date_codes, type_codes, len(type_values)))):
+        contribution_type = type_values[type_code]
+        # Pull requests have always been counted twice under contribution_types
+        if contribution_type == "pull_request":
+            count *= 2
+        structured_data[date_values[date_code]]["contribution_types"][contribution_type] = count
 
-    return validated_data
+    return structured_data
 
 # Step 3: Use Chain of Thought for generating insights and visual attributes
+@traced("aggregate.visual_attributes")
 def generate_visual_attributes(contributions: List[Dict[str, Any]]) -> Dict[str, Any]:
     insights = {}
 
@@ -197,27 +127,29 @@ def generate_visual_attributes(contributions: List[Dict[str, Any]]) -> Dict[str,
     return insights
 
 # Step 4: Generate heatmap JSON using insights
+@traced("aggregate.heatmap_json")
 def generate_heatmap_json(structured_data: Dict[str, Any], insights: Dict[str, Any]) -> Dict[str, Any]:
     heatmap_json = {}
 
-    # Calculate the time span
-    dates = sorted(structured_data.keys())
-    start_date = datetime.strptime(dates[0], "%Y-%m-%d")
-    end_date = datetime.strptime(dates[-1], "%Y-%m-%d")
-    total_days = (end_date - start_date).days
-    period_length = total_days // 10
+    if not structured_data:
+        return {"period_commits": [0] * 10}
 
-    # Initialize periods
-    periods = [start_date + timedelta(days=i * period_length) for i in range(11)]
+    # Parse every date once into day ordinals
+    dates = list(structured_data.keys())
+    days = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+    commits = np.fromiter((data["total_commits"] for data in structured_data.values()), dtype=np.int64, count=len(dates))
 
-    # Aggregate commits in each period
-    period_commits = [0] * 10
-    for date, data in structured_data.items():
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        for i in range(10):
-            if periods[i] <= date_obj < periods[i + 1]:
-                period_commits[i] += data["total_commits"]
-                break
+    # Ten equal periods from the first day; spans under ten days get one-day periods
+    # instead of zero-length ones that no date could fall into
+    start_day = days.min()
+    total_days = int(days.max() - start_day)
+    period_length = max(total_days // 10, 1)
+    boundaries = start_day + np.arange(11) * period_length
+
+    # Aggregate commits in each period; days on or after the last boundary fall outside
+    period_index = np.searchsorted(boundaries, days, side="right") - 1
+    in_range = period_index < 10
+    period_commits = np.bincount(period_index[in_range], weights=commits[in_range], minlength=10).astype(np.int64).tolist()
 
     for date, data in structured_data.items():
         insight = insights.get(date, {})
@@ -235,4 +167,4 @@ def generate_heatmap_json(structured_data: Dict[str, Any], insights: Dict[str, A
     # Add period commits to the JSON
     heatmap_json["period_commits"] = period_commits
 
-    return heatmap_json
\ No newline at end of file
+    return heatmap_json
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import requests
+
+from telemetry import CACHE_EVENTS, record_rate_limit, span
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Container-local, like the result store: SQLite is not shared safely through the volume
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.cache/repo-analyzer")
+DEFAULT_CACHE_PATH = os.getenv("GITHUB_HTTP_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "github_http_cache.sqlite"))
+DEFAULT_TTL_SECONDS = int(os.getenv("GITHUB_HTTP_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.getenv("GITHUB_HTTP_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# GitHub's GraphQL API sends no validators, so POST responses are only reused while fresh
+DEFAULT_POST_TTL_SECONDS = int(os.getenv("GITHUB_GRAPHQL_CACHE_TTL", 300))
+
+def cache_key(method: str, url: str, headers: Dict[str, str], body: Any = None) -> str:
+    # Responses can differ per token (private repos), so the credentials are part of the key
+    raw = json.dumps([method, url, headers.get("Authorization", ""), body], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Validators to send for a cached entry so GitHub can answer 304 Not Modified."""
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+class CachedResponse:
+    """The subset of `requests.Response` the fetchers use, rebuilt from a cache entry."""
+
+    from_cache = True
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+class HTTPCache:
+    """SQLite store of GitHub responses with their validators, evicted by TTL and total size."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT url, status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, etag, last_modified, stored_at = row
+        if time.time() - stored_at > self.ttl_seconds:
+            return None
+        return {
+            "url": url,
+            "status": status,
+            "headers": json.loads(headers),
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": stored_at
+        }
+
+    def store(self, key: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(dict(headers)), body, headers.get("ETag"),
+                 headers.get("Last-Modified"), now, now, len(body))
+            )
+            self._evict(conn, now)
+
+    def refresh(self, key: str) -> None:
+        """Mark an entry as revalidated, e.g. after a 304 Not Modified."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE responses SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key))
+
+    def touch(self, key: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE stored_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the store fits again
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+class CachedSession:
+    """Drop-in for `requests.get`/`requests.post` that revalidates cached GitHub responses.
+
+    GETs are sent with `If-None-Match`/`If-Modified-Since` and a 304 is answered from the
+    cache; GitHub does not count those against the REST rate limit. GraphQL POSTs carry no
+    validators and are reused for `post_ttl_seconds`.
+    """
+
+    def __init__(self, cache: Optional[HTTPCache] = None, session: Optional[requests.Session] = None, post_ttl_seconds: int = DEFAULT_POST_TTL_SECONDS):
+        self.cache = cache or HTTPCache()
+        self.session = session or requests.Session()
+        self.post_ttl_seconds = post_ttl_seconds
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, Any]] = None, **kwargs):
+        headers = dict(headers or {})
+        prepared_url = requests.Request("GET", url, params=params).prepare().url
+        key = cache_key("GET", prepared_url, headers)
+        entry = self.cache.lookup(key)
+        headers.update(conditional_headers(entry))
+
+        with span("github.rest"):
+            response = self.session.get(prepared_url, headers=headers, **kwargs)
+        record_rate_limit(response.headers, "rest", response.status_code)
+
+        if response.status_code == 304 and entry is not None:
+            logger.debug(f"HTTP cache revalidated: {prepared_url}")
+            CACHE_EVENTS.inc(cache="http", event="revalidated")
+            self.cache.refresh(key)
+            return CachedResponse(entry["url"], entry["status"], entry["headers"], entry["body"])
+
+        response.from_cache = False
+        CACHE_EVENTS.inc(cache="http", event="miss")
+        if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            self.cache.store(key, prepared_url, response.status_code, response.headers, response.content)
+        return response
+
+    def post(self, url: str, headers: Optional[Dict[str, str]] = None, json: Any = None, **kwargs):
+        headers = dict(headers or {})
+        key = cache_key("POST", url, headers, json)
+        entry = self.cache.lookup(key)
+        if entry is not None and time.time() - entry["stored_at"] <= self.post_ttl_seconds:
+            logger.debug(f"HTTP cache hit: {url}")
+            CACHE_EVENTS.inc(cache="http", event="hit")
+            self.cache.touch(key)
+            return CachedResponse(entry["url"], entry["status"], entry["headers"], entry["body"])
+
+        with span("github.graphql"):
+            response = self.session.post(url, headers=headers, json=json, **kwargs)
+        record_rate_limit(response.headers, "graphql", response.status_code)
+        CACHE_EVENTS.inc(cache="http", event="miss")
+        response.from_cache = False
+        if response.status_code == 200 and "errors" not in response.json():
+            self.cache.store(key, url, response.status_code, response.headers, response.content)
+        return response
+
+_default_cache: Optional[HTTPCache] = None
+_default_session: Optional[CachedSession] = None
+_default_session_lock = threading.Lock()
+
+def get_cache() -> HTTPCache:
+    """Return the process-wide response cache shared by the sync and async clients."""
+    global _default_cache
+    with _default_session_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache()
+        return _default_cache
+
+def get_session() -> CachedSession:
+    """Return the process-wide cached session shared by all GitHub fetchers."""
+    global _default_session
+    cache = get_cache()
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = CachedSession(cache)
+        return _default_session
@@ -0,0 +1,90 @@
+"""Guard the web tier's import cost.
+
+Imports each module in a fresh interpreter under `python -X importtime` and fails when
+it pulls in any of the model stack or takes longer than the budget:
+
+    python import_time_check.py                  # checks `api` and `main`
+    python import_time_check.py api --budget-ms 2000
+
+`main` declares its Modal app at import time; where the modal client is not installed
+it is replaced by a stub, so the check measures this repo's own imports.
+"""
+import argparse
+import importlib.util
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Packages only the inference containers may load
+FORBIDDEN_PACKAGES = ("torch", "transformers", "outlines", "llama_cpp", "bitsandbytes", "accelerate", "matplotlib", "seaborn", "pandas")
+DEFAULT_MODULES = ("api", "main")
+DEFAULT_BUDGET_MS = 1500
+# Accepts any attribute, call or decorator use, which is all `main` does with modal at import
+MODAL_STUB = """
+import sys, types
+class _Stub:
+    def __getattr__(self, name):
+        return self
+    def __call__(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and callable(args[0]) and not isinstance(args[0], _Stub):
+            return args[0]
+        return self
+modal = types.ModuleType("modal")
+modal.__getattr__ = lambda name: _Stub()
+sys.modules["modal"] = modal
+"""
+
+def import_command(module: str) -> str:
+    """Source that imports `module`, stubbing modal first when it is not installed."""
+    prelude = MODAL_STUB if importlib.util.find_spec("modal") is None else ""
+    return f"{prelude}\nimport {module}"
+
+def measure_imports(module: str) -> Dict[str, Tuple[int, int]]:
+    """Map every module imported by `import <module>` to its (self, cumulative) microseconds."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_command(module)],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}")
+
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+def check_module(module: str, budget_ms: float) -> List[str]:
+    try:
+        timings = measure_imports(module)
+    except RuntimeError as e:
+        return [str(e)]
+    problems = []
+    loaded = sorted({name.split(".")[0] for name in timings} & set(FORBIDDEN_PACKAGES))
+    if loaded:
+        problems.append(f"{module} imports {', '.join(loaded)}")
+    total_ms = timings[module][1] / 1000
+    slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:5]
+    print(f"{module}: {total_ms:.0f} ms cumulative; slowest: " + ", ".join(f"{name} {own / 1000:.0f} ms" for name, (own, _) in slowest))
+    if total_ms > budget_ms:
+        problems.append(f"{module} took {total_ms:.0f} ms to import, over the {budget_ms:.0f} ms budget")
+    return problems
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    problems = []
+    for module in args.modules:
+        problems.extend(check_module(module, args.budget_ms))
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Type, Union
+
+from pydantic import BaseModel
+
+from generator_registry import GeneratorRegistry
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "transformers": the NF4 Llama on a GPU; "llamacpp": a small GGUF model on CPU
+BACKENDS = ("transformers", "llamacpp")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "transformers")
+
+# The CPU model: a 4-bit GGUF of a small instruction-tuned Llama, about 2 GB on disk
+CPU_MODEL_REPO = os.getenv("CPU_MODEL_REPO", "bartowski/Llama-3.2-3B-Instruct-GGUF")
+CPU_MODEL_FILE = os.getenv("CPU_MODEL_FILE", "Llama-3.2-3B-Instruct-Q4_K_M.gguf")
+# Enough for the chained analysis prompts plus the preamble
+CPU_CONTEXT_TOKENS = int(os.getenv("CPU_CONTEXT_TOKENS", 8192))
+# Tokens per llama_decode call while reading the prompt
+CPU_PROMPT_BATCH_TOKENS = 512
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which in a container is its allotment, not the host's."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def default_threads() -> Dict[str, int]:
+    """llama.cpp thread counts from LLAMA_CPP_THREADS / LLAMA_CPP_BATCH_THREADS, else by CPU count.
+
+    Decoding is bound by memory bandwidth, and threads beyond the physical cores (half
+    the hyperthreaded CPUs) only contend for it; reading the prompt is compute bound
+    and uses every CPU. `tune_threads` measures the best decode count for a machine.
+    """
+    cpus = available_cpus()
+    return {
+        "n_threads": int(os.getenv("LLAMA_CPP_THREADS", max(1, cpus // 2))),
+        "n_threads_batch": int(os.getenv("LLAMA_CPP_BATCH_THREADS", cpus))
+    }
+
+class InferenceBackend:
+    """A model the analysis can generate schema-constrained JSON with.
+
+    `get(schema)` returns a generator taking one prompt or a list of them, as
+    `GeneratorRegistry.get` does, so a backend goes wherever a registry does:
+    `run_generation`, `MicroBatchScheduler`, `analyze_repo(llm=...)`.
+    """
+
+    name = "base"
+    # Prompts worth generating together; 1 when the backend decodes one sequence at a time
+    max_batch_size = 1
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        raise NotImplementedError
+
+    def warm(self, schemas: Iterable[Type[BaseModel]]) -> None:
+        for schema in schemas:
+            self.get(schema)
+
+    def count_tokens(self, text: str) -> int:
+        # About four characters per token when the backend has no tokenizer to ask
+        return (len(text) + 3) // 4
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class TransformersBackend(InferenceBackend):
+    """The GPU path: a Transformers model driven by Outlines, batched across prompts."""
+
+    name = "transformers"
+    max_batch_size = 8
+
+    def __init__(self, model, tokenizer, llm=None, model_name: Optional[str] = None):
+        # `llm` is the Outlines model to generate with, e.g. a `PrefixCachedTransformers`
+        if llm is None:
+            from outlines import models
+            llm = models.Transformers(model, tokenizer)
+        self.model = model
+        self.tokenizer = tokenizer
+        self.model_name = model_name or getattr(model, "name_or_path", type(model).__name__)
+        self.registry = GeneratorRegistry(llm, self.model_name)
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        return self.registry.get(schema)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "model": self.model_name}
+
+class LlamaCppBackend(InferenceBackend):
+    """The CPU path: a quantized GGUF model in llama.cpp, constrained by the same Outlines schemas.
+
+    One llama.cpp context decodes one sequence at a time, so batches run prompt by
+    prompt under a lock. llama.cpp keeps the previous prompt's KV and re-reads only
+    the tokens after the longest shared prefix, which is what the chained stages need.
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, llama, model_name: str):
+        from outlines import models
+
+        self.llama = llama
+        self.model_name = model_name
+        self.registry = GeneratorRegistry(models.LlamaCpp(llama), model_name)
+        self.n_threads = llama.context_params.n_threads
+        self.n_threads_batch = llama.context_params.n_threads_batch
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls,
+        model_path: str,
+        n_threads: Optional[int] = None,
+        n_threads_batch: Optional[int] = None,
+        n_ctx: int = CPU_CONTEXT_TOKENS
+    ) -> "LlamaCppBackend":
+        """Memory-map a GGUF file; thread counts default to `default_threads()`."""
+        from llama_cpp import Llama
+
+        threads = default_threads()
+        llama = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_batch=CPU_PROMPT_BATCH_TOKENS,
+            n_threads=n_threads or threads["n_threads"],
+            n_threads_batch=n_threads_batch or threads["n_threads_batch"],
+            use_mmap=True,
+            verbose=False
+        )
+        return cls(llama, os.path.basename(model_path))
+
+    def get(self, schema: Type[BaseModel]) -> Callable:
+        generator = self.registry.get(schema)
+
+        def generate(prompts: Union[str, List[str]]) -> Union[BaseModel, List[BaseModel]]:
+            with self._lock:
+                if isinstance(prompts, str):
+                    return generator(prompts)
+                return [generator(prompt) for prompt in prompts]
+        return generate
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llama.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def set_threads(self, n_threads: int, n_threads_batch: Optional[int] = None) -> None:
+        """Change thread counts on the live context, without reloading the weights."""
+        import llama_cpp
+
+        n_threads_batch = n_threads_batch or self.n_threads_batch
+        with self._lock:
+            llama_cpp.llama_set_n_threads(self.llama.ctx, n_threads, n_threads_batch)
+            self.n_threads, self.n_threads_batch = n_threads, n_threads_batch
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "model": self.model_name, "n_threads": self.n_threads, "n_threads_batch": self.n_threads_batch}
+
+def download_gguf(cache_dir: str, repo_id: str = CPU_MODEL_REPO, filename: str = CPU_MODEL_FILE) -> str:
+    """Path of the GGUF file in the model volume, downloading it the first time."""
+    from huggingface_hub import hf_hub_download
+
+    return hf_hub_download(repo_id, filename, cache_dir=cache_dir, token=os.getenv("ACCESS_TOKEN"))
+
+def tune_threads(
+    backend: LlamaCppBackend,
+    schema: Type[BaseModel],
+    prompts: Sequence[str],
+    candidates: Optional[Sequence[int]] = None
+) -> Dict[str, Any]:
+    """Time `prompts` at each decode thread count, then keep the fastest.
+
+    Candidates default to powers of two up to the CPU count. Each prompt is generated
+    once untimed first, so every count is measured with the same warm KV state.
+    """
+    cpus = available_cpus()
+    candidates = list(candidates or sorted({1 << i for i in range(cpus.bit_length()) if 1 << i <= cpus} | {cpus}))
+    generate = backend.get(schema)
+    generate(list(prompts))
+
+    results = []
+    for n_threads in candidates:
+        backend.set_threads(n_threads)
+        started = time.perf_counter()
+        outputs = generate(list(prompts))
+        seconds = time.perf_counter() - started
+        tokens = sum(backend.count_tokens(output.model_dump_json()) for output in outputs)
+        results.append({"n_threads": n_threads, "seconds": round(seconds, 3), "tokens_per_second": round(tokens / seconds, 1)})
+        logger.info(f"llama.cpp with {n_threads} decode threads: {results[-1]['tokens_per_second']} tokens/s")
+
+    best = max(results, key=lambda result: result["tokens_per_second"])
+    backend.set_threads(best["n_threads"])
+    return {"best": best["n_threads"], "n_threads_batch": backend.n_threads_batch, "results": results}
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, List, MutableMapping, Optional, Tuple
+
+import aiohttp
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+MAX_PENDING_JOBS = 64
+ACTIVE_JOBS_KEY = "active-jobs"
+# A job not renewed within this long is assumed lost with its container
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 600))
+# Lost jobs are re-queued until they have been started this many times
+MAX_JOB_ATTEMPTS = 3
+# How often the scheduled sweep looks for lost jobs nobody is polling
+JOB_SWEEP_SECONDS = float(os.getenv("JOB_SWEEP_SECONDS", 60))
+
+class QueueFullError(Exception):
+    pass
+
+def idempotency_key(username: str, repo: str, head_oid: str, mode: str) -> str:
+    return f"idempotency:{username.lower()}:{repo}:{head_oid}:{mode}"
+
+class JobStore:
+    """Analysis jobs kept in a shared key-value backend, normally a `modal.Dict`.
+
+    Jobs are idempotent on (username, repo, HEAD oid, mode): submitting the same work
+    again returns the existing job unless it failed. The pending bound is enforced from
+    the shared active-job list, so it is approximate when web containers race.
+
+    Every queued or running job holds a lease that its worker renews. A job whose
+    lease ran out was lost with its container: it is re-queued when next submitted or
+    read, or by the periodic `sweep`, up to `MAX_JOB_ATTEMPTS` starts, and dropped
+    from the active list when that list is full.
+    """
+
+    def __init__(self, backend: MutableMapping, max_pending: int = MAX_PENDING_JOBS, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+
+    def _active(self) -> List[str]:
+        return list(self.backend.get(ACTIVE_JOBS_KEY, []))
+
+    def _remove_active(self, job_ids: List[str]) -> None:
+        self.backend[ACTIVE_JOBS_KEY] = [active_id for active_id in self._active() if active_id not in job_ids]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.backend.get(f"job:{job_id}")
+
+    def lease_expired(self, job: Dict[str, Any], now: Optional[float] = None) -> bool:
+        return job["status"] in ACTIVE_STATUSES and job.get("lease_expires_at", float("inf")) < (now or time.time())
+
+    def recover(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Re-queue a job whose lease expired; returns `(job, requeued)`, failing it once out of attempts."""
+        if not self.lease_expired(job):
+            return job, False
+        if job.get("attempts", 0) >= MAX_JOB_ATTEMPTS:
+            logger.warning(f"Job {job['id']} lost after {job['attempts']} attempts; failing it")
+            return self.update(job["id"], status=JOB_FAILED, error=f"Job was lost {job['attempts']} times; resubmit it"), False
+        logger.warning(f"Job {job['id']} lease expired while {job['status']}; re-queueing it")
+        return self.update(job["id"], status=JOB_QUEUED, lease_expires_at=time.time() + self.lease_seconds), True
+
+    def _prune_active(self, active: List[str]) -> List[str]:
+        """Drop finished, missing and lost jobs from the active list; lost jobs are failed."""
+        now = time.time()
+        stale = []
+        for job_id in active:
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                stale.append(job_id)
+            elif self.lease_expired(job, now):
+                self.update(job_id, status=JOB_FAILED, error="Job was lost; resubmit it")
+                stale.append(job_id)
+        if stale:
+            self._remove_active(stale)
+        return [job_id for job_id in active if job_id not in stale]
+
+    def sweep(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Recover every active job whose lease expired; returns the `(requeued, failed)` jobs.
+
+        Finished and missing jobs are dropped from the active list on the way.
+        """
+        requeued, failed, stale = [], [], []
+        for job_id in self._active():
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                stale.append(job_id)
+                continue
+            job, was_requeued = self.recover(job)
+            if was_requeued:
+                requeued.append(job)
+            elif job["status"] == JOB_FAILED:
+                failed.append(job)
+        if stale:
+            self._remove_active(stale)
+        return requeued, failed
+
+    def submit(self, username: str, repo: str, head_oid: str, mode: str, callback_url: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Return `(job, created)`: the existing job for this work, or a newly queued (or re-queued) one.
+
+        `created` tells the caller to start a worker for the job.
+        """
+        key = idempotency_key(username, repo, head_oid, mode)
+        existing_id = self.backend.get(key)
+        if existing_id is not None:
+            existing = self.get(existing_id)
+            if existing is not None and self.lease_expired(existing):
+                existing, requeued = self.recover(existing)
+                if requeued:
+                    return existing, True
+            if existing is not None and existing["status"] != JOB_FAILED:
+                return existing, False
+
+        active = self._active()
+        if len(active) >= self.max_pending:
+            active = self._prune_active(active)
+        if len(active) >= self.max_pending:
+            raise QueueFullError(f"{len(active)} jobs are already pending")
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "username": username,
+            "repo": repo,
+            "head_oid": head_oid,
+            "mode": mode,
+            "callback_url": callback_url,
+            "status": JOB_QUEUED,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "attempts": 0,
+            # Covers the time until a worker picks the job up, too
+            "lease_expires_at": now + self.lease_seconds,
+            "result": None,
+            "error": None
+        }
+        self.backend[f"job:{job['id']}"] = job
+        self.backend[key] = job["id"]
+        self.backend[ACTIVE_JOBS_KEY] = active + [job["id"]]
+        return job, True
+
+    def claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Mark the job running for this worker, or None when it is no longer waiting to run."""
+        job = self.get(job_id)
+        if job is None or job["status"] != JOB_QUEUED:
+            return None
+        now = time.time()
+        return self.update(job_id, status=JOB_RUNNING, started_at=now, attempts=job.get("attempts", 0) + 1, lease_expires_at=now + self.lease_seconds)
+
+    def renew(self, job_id: str) -> None:
+        """Extend the running job's lease; its worker calls this while it works."""
+        self.update(job_id, lease_expires_at=time.time() + self.lease_seconds)
+
+    def update(self, job_id: str, **fields) -> Dict[str, Any]:
+        job = self.get(job_id)
+        job.update(fields, updated_at=time.time())
+        self.backend[f"job:{job_id}"] = job
+        if job["status"] not in ACTIVE_STATUSES:
+            self._remove_active([job_id])
+        return job
+
+    def public_view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """The job as returned by the API; the callback URL may carry a secret."""
+        return {key: value for key, value in job.items() if key != "callback_url"}
+
+async def send_job_callback(callback_url: str, job: Dict[str, Any], attempts: int = 3) -> None:
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+        for attempt in range(attempts):
+            try:
+                async with session.post(callback_url, json=job) as response:
+                    if response.status < 400:
+                        return
+                    logger.warning(f"Job callback returned {response.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # A timeout carries no message of its own
+                logger.warning(f"Job callback failed: {str(e) or type(e).__name__}")
+            await asyncio.sleep(2 ** attempt)
@@ -0,0 +1,177 @@
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from outlines import models
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Llama-3.1-8B keeps ~128 KB of KV per token (32 layers x 8 KV heads x 128 dims x K/V
+# in fp16), so 16k cached tokens cost about 2 GB of the A10G's memory.
+DEFAULT_MAX_CACHED_TOKENS = 16384
+
+class PrefixKVCache:
+    """LRU store of prefilled KV caches, keyed by the prompt token ids they cover.
+
+    Lookups match on token ids rather than text, so a cached prefix is only reused when
+    the new prompt tokenizes to exactly the same leading ids. Pinned prefixes (the
+    instruction preamble shared by every analysis) are never evicted.
+    """
+
+    def __init__(self, model, max_cached_tokens: int = DEFAULT_MAX_CACHED_TOKENS):
+        self.model = model
+        self.max_cached_tokens = max_cached_tokens
+        self._entries: "OrderedDict[Tuple[int, ...], object]" = OrderedDict()
+        self._pinned = set()
+        self._cached_tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Padded batches only read the cache, so they are counted apart
+        self.batch_hits = 0
+        self.batch_misses = 0
+
+    def _longest_prefix(self, ids: Tuple[int, ...]) -> Optional[Tuple[int, ...]]:
+        best = None
+        for key in self._entries:
+            if len(key) <= len(ids) and ids[:len(key)] == key and (best is None or len(key) > len(best)):
+                best = key
+        return best
+
+    def _store(self, key: Tuple[int, ...], kv) -> None:
+        self._entries[key] = kv
+        self._cached_tokens += len(key)
+        for old_key in list(self._entries):
+            if self._cached_tokens <= self.max_cached_tokens:
+                break
+            if old_key in self._pinned or old_key == key:
+                continue
+            del self._entries[old_key]
+            self._cached_tokens -= len(old_key)
+
+    def prefill(self, input_ids, pin: bool = False):
+        """Return a private copy of the KV cache for all but the last of `input_ids`.
+
+        Only the tokens past the longest cached prefix are run through the model. The
+        last token is left for `generate` to process so it can produce the first logits.
+        """
+        import torch
+        from transformers import DynamicCache
+
+        ids = tuple(input_ids[0, :-1].tolist())
+        with self._lock:
+            prefix = self._longest_prefix(ids)
+            if prefix is not None:
+                self._entries.move_to_end(prefix)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            if prefix == ids:
+                return copy.deepcopy(self._entries[ids])
+
+            kv = copy.deepcopy(self._entries[prefix]) if prefix is not None else DynamicCache()
+            start = len(prefix) if prefix is not None else 0
+            with torch.no_grad():
+                self.model(input_ids=input_ids[:, start:-1], past_key_values=kv, use_cache=True)
+
+            # The shorter entry is superseded by this one unless other prompts share it
+            if prefix is not None and prefix not in self._pinned:
+                del self._entries[prefix]
+                self._cached_tokens -= len(prefix)
+            if pin:
+                self._pinned.add(ids)
+            self._store(ids, kv)
+            return copy.deepcopy(kv)
+
+    def shared_prefix(self, rows, batch_size: int):
+        """The longest cached prefix leading every one of `rows`, with its KV repeated per row.
+
+        Returns `(None, None)` when no cached entry is shared by the whole batch. Nothing
+        is prefilled or stored: rows diverge after the shared prefix.
+        """
+        with self._lock:
+            shortest = min(len(row) for row in rows)
+            best = None
+            for key in self._entries:
+                # At least one token per row must be left for `generate` to process
+                if len(key) < shortest and (best is None or len(key) > len(best)) and all(row[:len(key)] == key for row in rows):
+                    best = key
+            if best is None:
+                self.batch_misses += 1
+                return None, None
+            self.batch_hits += 1
+            self._entries.move_to_end(best)
+            kv = copy.deepcopy(self._entries[best])
+        kv.batch_repeat_interleave(batch_size)
+        return best, kv
+
+class PrefixCachedTransformers(models.Transformers):
+    """Outlines Transformers model that starts generations from cached KV.
+
+    Each insight stage's prompt extends the previous stage's prompt, so only the tokens
+    added since the last stage are prefilled. Padded batches from the micro-batch
+    scheduler start from the longest cached prefix all their prompts share, usually the
+    pinned preamble, with each row's padding moved behind it.
+    """
+
+    def __init__(self, model, tokenizer, prefix_cache: PrefixKVCache):
+        super().__init__(model, tokenizer)
+        self.prefix_cache = prefix_cache
+
+    def pin_prefix(self, text: str, prompt: Optional[str] = None) -> None:
+        """Prefill and pin `text`; `prompt`, a prompt rendered on it, must tokenize to the same leading ids.
+
+        Otherwise the pinned entry would never match, because BPE merges tokens across
+        the point where the preamble ends.
+        """
+        input_ids, _ = self.tokenizer.encode([text])
+        if prompt is not None:
+            prompt_ids, _ = self.tokenizer.encode([prompt])
+            prefix_len = input_ids.shape[1]
+            if prompt_ids.shape[1] < prefix_len or prompt_ids[0, :prefix_len].tolist() != input_ids[0].tolist():
+                raise ValueError("The pinned prefix does not tokenize as a prefix of the prompts built on it")
+        # Prefill one extra token so the pinned entry covers every token of `text`
+        pad = input_ids.new_full((1, 1), self.tokenizer.pad_token_id)
+        import torch
+        self.prefix_cache.prefill(torch.cat([input_ids, pad], dim=1).to(self.model.device), pin=True)
+
+    def _shift_padding(self, inputs, prefix_len: int) -> None:
+        """Move each row's left padding from before the shared prefix to just after it.
+
+        The prefix then sits at the same positions in every row, where the cached KV
+        covers it; Llama derives position ids from the attention mask, so the masked gap
+        leaves the positions of the tokens after it unchanged.
+        """
+        input_ids, attention_mask = inputs["input_ids"], inputs["attention_mask"]
+        shifted_ids = input_ids.clone()
+        shifted_mask = attention_mask.clone()
+        width = input_ids.shape[1]
+        for row in range(input_ids.shape[0]):
+            tokens = input_ids[row][attention_mask[row].bool()]
+            padding = width - tokens.shape[0]
+            shifted_ids[row, :prefix_len] = tokens[:prefix_len]
+            shifted_ids[row, prefix_len:prefix_len + padding] = self.tokenizer.pad_token_id
+            shifted_ids[row, prefix_len + padding:] = tokens[prefix_len:]
+            shifted_mask[row] = 1
+            shifted_mask[row, prefix_len:prefix_len + padding] = 0
+        inputs["input_ids"], inputs["attention_mask"] = shifted_ids, shifted_mask
+
+    def _generate_output_seq(self, prompts, inputs, generation_config, **generation_kwargs):
+        input_ids = inputs["input_ids"]
+        if input_ids.shape[0] == 1 and input_ids.shape[1] > 1:
+            generation_kwargs["past_key_values"] = self.prefix_cache.prefill(input_ids)
+        elif input_ids.shape[0] > 1:
+            rows = [
+                tuple(ids[mask.bool()].tolist())
+                for ids, mask in zip(input_ids, inputs["attention_mask"])
+            ]
+            prefix, kv = self.prefix_cache.shared_prefix(rows, input_ids.shape[0])
+            if prefix is not None:
+                self._shift_padding(inputs, len(prefix))
+                generation_kwargs["past_key_values"] = kv
+        return super()._generate_output_seq(prompts, inputs, generation_config, **generation_kwargs)
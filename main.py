@@ -1,18 +1,31 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import modal
 import os
-import transformers
-import torch
+import asyncio
 import json
-from transformers import BitsAndBytesConfig
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Request, HTTPException
-from repo_analyzer import analyze_repo
-from heatmap import fetch_contributions_data, process_contributions, generate_visual_attributes, generate_heatmap_json
+import threading
+from collections import OrderedDict
+from repo_analyzer import analyze_repo, iter_repo_insights, SurfaceInsights, IntermediateInsights, DeepInsights, NarrativeSummary, FusedInsights, ANALYST_PREAMBLE, SURFACE_INSTRUCTION, build_stage_prompt, compute_derived_metrics
+from generator_registry import OUTLINES_CACHE_DIR
+from inference_backend import INFERENCE_BACKEND, BACKENDS, InferenceBackend, TransformersBackend, LlamaCppBackend, download_gguf
+from batching import MicroBatchScheduler
+from github_gateway import GitHubGateway, build_repo_info, build_repo_metrics, fetch_gateways_async
+from result_store import ResultStore, fetch_head_async
+from contribution_store import ContributionStore
+from contribution_rollup import RollupIndex
+from job_store import JobStore, JOB_SUCCEEDED, JOB_FAILED, JOB_SWEEP_SECONDS, send_job_callback
+from repo_selection import select_repositories, fetch_repository_async, aggregate_repo_results, gather_bounded
+from github_client import AsyncGitHubClient
+from github_scheduler import PRIORITY_BATCH, get_token_pool, request_priority
+from heatmap import generate_visual_attributes, generate_heatmap_json
+from api import create_app
+from analysis_pipeline import AnalysisPipeline
+from model_snapshot import PhaseTimer, load_or_build, build_snapshot, snapshot_dir
+from telemetry import METRICS, CACHE_EVENTS, METRICS_PUBLISH_SECONDS, collect_gpu_memory, log_payload, publish_snapshot
 from modal import asgi_app 
 import logging
-import requests
-from readme_extraction import readme_extraction
+# torch, transformers, outlines and llama_cpp (kv_cache, readme_extraction) are
+# imported in load_backend, so the web container never loads the model stack
 
 
 # Set up logging
@@ -21,6 +34,22 @@ logger = logging.getLogger(__name__)
 
 MODEL_PATH = "meta-llama/Meta-Llama-3.1-8B-Instruct"
 ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+CONCURRENT_INPUTS = 8
+# Micro-batching trades up to MAX_BATCH_WAIT_MS of latency for larger GPU batches
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", 25))
+# Rollup indexes kept in memory per container, least recently queried evicted first
+MAX_ROLLUP_INDEXES = 256
+ANALYSIS_SCHEMAS = [SurfaceInsights, IntermediateInsights, DeepInsights, NarrativeSummary, FusedInsights]
+# Any repository will do: pinning checks the preamble against a prompt rendered on it
+SAMPLE_REPO_DATA = {"repo_name": "octocat/Hello-World", "stars": 0, "forks": 0, "open_issues": 0, "watchers": 0}
+# Physical cores and memory for a CPU (llama.cpp) inference container
+CPU_CORES = float(os.getenv("CPU_CORES", 8))
+CPU_MEMORY_MB = int(os.getenv("CPU_MEMORY_MB", 8192))
+
+if INFERENCE_BACKEND not in BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {BACKENDS}")
+GPU_BACKEND = INFERENCE_BACKEND == "transformers"
 
 # Define the image with all necessary dependencies
 llm_image = modal.Image.debian_slim().pip_install(
@@ -37,119 +66,504 @@ llm_image = modal.Image.debian_slim().pip_install(
     "matplotlib",
     "seaborn",
     "pandas",
+    "numpy",
     "fastapi",
     "fastapi-cors"
+).env({"OUTLINES_CACHE_DIR": OUTLINES_CACHE_DIR})
+
+# The CPU backend's image: llama.cpp instead of bitsandbytes and CUDA. Its container
+# must evaluate INFERENCE_BACKEND the same way the deploying shell did
+cpu_image = modal.Image.debian_slim().apt_install("build-essential", "cmake").pip_install(
+    "llama-cpp-python",
+    "huggingface_hub",
+    "requests",
+    "aiohttp",
+    "pydantic",
+    "jinja2",
+    "outlines",
+    "numpy",
+    "fastapi"
+).env({"OUTLINES_CACHE_DIR": OUTLINES_CACHE_DIR, "INFERENCE_BACKEND": INFERENCE_BACKEND})
+
+# Everything the API layer imports, and nothing of the model stack
+web_image = modal.Image.debian_slim().pip_install(
+    "fastapi",
+    "pydantic",
+    "aiohttp",
+    "requests",
+    "numpy"
 )
 
 volume = modal.Volume.from_name("llm-model-volume", create_if_missing=True)
-modal_app = modal.App("meta-llama-project")
+job_dict = modal.Dict.from_name("analysis-jobs", create_if_missing=True)
+# Each inference container's latest metrics snapshot, read by the web tier's /metrics
+metrics_dict = modal.Dict.from_name("analysis-metrics", create_if_missing=True)
+# `INFERENCE_BACKEND=llamacpp modal deploy main.py` deploys the CPU variant as its own
+# app, next to the GPU one, for overflow capacity or when no GPUs can be had
+modal_app = modal.App("meta-llama-project" if GPU_BACKEND else f"meta-llama-project-{INFERENCE_BACKEND}")
+inference_image = llm_image if GPU_BACKEND else cpu_image
 
-app = FastAPI()
+def load_backend(cache_dir: str, timer: PhaseTimer) -> InferenceBackend:
+    """Load the configured model and build every schema's generator once.
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    The compiled indexes land in the Outlines cache on the volume, so the next cold
+    container loads them instead of compiling them again.
+    """
+    with timer.phase("import_model_stack"):
+        from readme_extraction import ReadmeSummary
+        if GPU_BACKEND:
+            from kv_cache import PrefixKVCache, PrefixCachedTransformers
+
+    if GPU_BACKEND:
+        # Memory-map the prebuilt NF4 snapshot (see build_model_snapshot); only the very
+        # first container without one quantizes the hub checkpoint and saves it
+        model, tokenizer = load_or_build(MODEL_PATH, ACCESS_TOKEN, cache_dir, timer)
+        tokenizer.pad_token = tokenizer.eos_token
+        # Batched prompts are padded on the left so generation continues from real tokens
+        tokenizer.padding_side = "left"
+
+        # Chained stages and the shared preamble reuse prefilled KV instead of re-encoding it
+        with timer.phase("pin_preamble"):
+            prefix_cache = PrefixKVCache(model)
+            llm = PrefixCachedTransformers(model, tokenizer, prefix_cache)
+            llm.pin_prefix(ANALYST_PREAMBLE, build_stage_prompt(SAMPLE_REPO_DATA, [], SURFACE_INSTRUCTION))
+
+        def collect_prefix_cache() -> None:
+            CACHE_EVENTS.set(prefix_cache.hits, cache="kv_prefix", event="hit")
+            CACHE_EVENTS.set(prefix_cache.misses, cache="kv_prefix", event="miss")
+            CACHE_EVENTS.set(prefix_cache.batch_hits, cache="kv_prefix_batch", event="hit")
+            CACHE_EVENTS.set(prefix_cache.batch_misses, cache="kv_prefix_batch", event="miss")
+
+        METRICS.add_collector(collect_prefix_cache)
+        # Keyed by the hub name, so snapshot and hub loads share compiled indexes
+        backend = TransformersBackend(model, tokenizer, llm, MODEL_PATH)
+    else:
+        with timer.phase("download_gguf"):
+            model_path = download_gguf(cache_dir)
+        with timer.phase("load_weights"):
+            backend = LlamaCppBackend.load(model_path)
+
+    with timer.phase("warm_generators"):
+        backend.warm(ANALYSIS_SCHEMAS + [ReadmeSummary])
+    return backend
 
 @modal_app.cls(
-    gpu="A10G",
-    image=llm_image,
+    gpu="A10G" if GPU_BACKEND else None,
+    cpu=None if GPU_BACKEND else CPU_CORES,
+    memory=None if GPU_BACKEND else CPU_MEMORY_MB,
+    image=inference_image,
     volumes={"/root/model_cache": volume},
     secrets=[modal.Secret.from_name("huggingface-secret"), modal.Secret.from_name("github-secret")],
-    mounts=[modal.Mount.from_local_dir(".", remote_path="/root/app")]
+    mounts=[modal.Mount.from_local_dir(".", remote_path="/root/app")],
+    # Inputs overlap their GitHub round trips and share micro-batches on the model
+    allow_concurrent_inputs=CONCURRENT_INPUTS
 )
-class LLMInference:
+class LLMInference(AnalysisPipeline):
     def __init__(self):
         self.tokenizer = None
         self.model = None
+        self.github_client = None
+        self.backend = None
+        self.scheduler = None
+        self.result_store = None
+        self.contribution_store = None
+        self.rollups = OrderedDict()
+        self.startup_timings = {}
+        self.metrics_stop = threading.Event()
 
     @modal.enter()
     def setup(self):
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-
+        timer = PhaseTimer()
         cache_dir = "/root/model_cache"
         os.makedirs(cache_dir, exist_ok=True)
 
-        # Configuration for quantization
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_quant_type="nf4",
+        self.backend = load_backend(cache_dir, timer)
+        if isinstance(self.backend, TransformersBackend):
+            self.model, self.tokenizer = self.backend.model, self.backend.tokenizer
+        with timer.phase("commit_volume"):
+            volume.commit()
+
+        self.startup_timings = timer.report()
+        logger.info(f"Model ready ({self.backend.describe()}): {self.startup_timings}")
+
+        # Finished analyses keyed by repository HEAD; per container, warm for its lifetime
+        self.result_store = ResultStore()
+        # Daily contribution counts synced incrementally from each repository's mark
+        self.contribution_store = ContributionStore()
+
+        # Concurrent inputs share the model through micro-batches; a CPU backend decodes
+        # one prompt at a time, so its batches are single prompts with no wait
+        batched = self.backend.max_batch_size > 1
+        self.scheduler = MicroBatchScheduler(
+            self.backend,
+            max_batch_size=min(MAX_BATCH_SIZE, self.backend.max_batch_size),
+            max_wait_ms=MAX_BATCH_WAIT_MS if batched else 0,
+            count_tokens=self.backend.count_tokens
         )
 
-        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, use_auth_token=ACCESS_TOKEN, cache_dir=cache_dir)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            MODEL_PATH,
-            use_auth_token=ACCESS_TOKEN,
-            cache_dir=cache_dir,
-            device_map="auto",
-            quantization_config=quantization_config
+        METRICS.add_collector(collect_gpu_memory)
+        threading.Thread(target=self._publish_metrics, name="metrics-publisher", daemon=True).start()
+
+    def _publish_metrics(self) -> None:
+        instance = os.getenv("MODAL_TASK_ID", f"inference-{os.getpid()}")
+        while not self.metrics_stop.wait(METRICS_PUBLISH_SECONDS):
+            try:
+                publish_snapshot(metrics_dict, instance, METRICS.snapshot())
+            except Exception as e:
+                logger.warning(f"Failed to publish metrics: {str(e)}")
+
+    def _github(self) -> AsyncGitHubClient:
+        # The pooled session has to be created inside the container's event loop
+        if self.github_client is None:
+            self.github_client = AsyncGitHubClient(pool=get_token_pool())
+        return self.github_client
+
+    @modal.exit()
+    async def teardown(self):
+        self.metrics_stop.set()
+        if self.github_client is not None:
+            await self.github_client.close()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    async def _analyze_repos(self, username: str, mode: str = "chained") -> Dict[str, Any]:
+        github_token = self._github().github_token
+
+        # A cheap HEAD check first: an unchanged repository is served from the store
+        stored_profile = self.result_store.get_profile(username)
+        head = await fetch_head_async(self._github(), username, with_profile=stored_profile is None)
+        cached = self.result_store.get(username, head["repo"], head["head_oid"], mode)
+        if cached is not None:
+            if head["profile"] is not None:
+                self.result_store.put_profile(username, head["profile"])
+            cached["user_profile"].update(head["profile"] or stored_profile)
+            return cached
+
+        # One gateway per analysis: the combined GitHub query runs once and every
+        # consumer below reads its slice from the memoized payload. Commit history
+        # comes from the contribution store instead, so the query skips it
+        gateway = GitHubGateway(username, github_token, with_history=False)
+        await gateway.fetch_async(self._github())
+        return await self._analyze_gateway(username, gateway, mode=mode, check_cache=False)
+
+    @modal.method()
+    async def analyze_repos(self, username: str, mode: str = "chained"):
+        try:
+            final_output = await self._analyze_repos(username, mode=mode)
+
+            log_payload(logger, "Final structured output", final_output)
+
+            return final_output
+        except Exception as e:
+            logger.error(f"Failed to analyze repos: {str(e)}")
+            raise
+
+    @modal.method()
+    async def run_job(self, job_id: str):
+        """Worker side of the job API: run a queued job and record its outcome.
+
+        The job's lease is renewed while it runs, so only a lost container lets it
+        expire and be re-queued.
+        """
+        jobs = JobStore(job_dict)
+        job = await asyncio.to_thread(jobs.claim, job_id)
+        if job is None:
+            logger.info(f"Job {job_id} is not queued; skipping it")
+            return
+
+        async def keep_lease():
+            while True:
+                await asyncio.sleep(jobs.lease_seconds / 3)
+                try:
+                    await asyncio.to_thread(jobs.renew, job_id)
+                except Exception as e:
+                    logger.warning(f"Failed to renew the lease of job {job_id}: {str(e)}")
+
+        renewer = asyncio.create_task(keep_lease())
+        try:
+            # Nobody is waiting on the page, so interactive requests go first
+            with request_priority(PRIORITY_BATCH):
+                result = await self._analyze_repos(job["username"], mode=job["mode"])
+            outcome = {"status": JOB_SUCCEEDED, "result": result}
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            outcome = {"status": JOB_FAILED, "error": str(e)}
+        finally:
+            renewer.cancel()
+        job = await asyncio.to_thread(jobs.update, job_id, **outcome)
+
+        if job["callback_url"]:
+            await send_job_callback(job["callback_url"], jobs.public_view(job))
+
+    @modal.method()
+    async def analyze_repos_stream(self, username: str, mode: str = "chained"):
+        """Yield `{"section": ..., "data": ...}` events as each part of the analysis is ready.
+
+        The profile comes from the cheap HEAD query (or the stored profile) before the
+        full GitHub fetch starts, and a repository whose HEAD is unchanged is served from
+        the store without it. The heatmap and README text follow within a second; the
+        README summary and the insight tiers follow as the model finishes each one.
+        """
+        github_token = self._github().github_token
+        stored_profile = self.result_store.get_profile(username)
+        head = await fetch_head_async(self._github(), username, with_profile=stored_profile is None)
+        if head["profile"] is not None:
+            self.result_store.put_profile(username, head["profile"])
+        yield {"section": "user_profile", "data": head["profile"] or stored_profile}
+
+        cached = self.result_store.get(username, head["repo"], head["head_oid"], mode)
+        if cached is not None:
+            for section in ("heatmap_data", "readme_analysis", "readme_summary", "repo_analysis"):
+                yield {"section": section, "data": cached[section]}
+            return
+
+        gateway = GitHubGateway(username, github_token, with_history=False)
+        await gateway.fetch_async(self._github())
+        user_profile = gateway.user_profile()
+        repo_info = gateway.repo_info()
+
+        processed_contributions = await self._contributions(username, repo_info["name"], repo_info["head_oid"])
+        insights = generate_visual_attributes(processed_contributions)
+        heatmap_json = generate_heatmap_json(processed_contributions, insights)
+        yield {"section": "heatmap_data", "data": heatmap_json}
+        yield {"section": "readme_analysis", "data": gateway.readme()}
+        readme_summary = await self._readme_summary(username, gateway.readme())
+        yield {"section": "readme_summary", "data": readme_summary}
+
+        # Step the blocking generator in a worker thread so the event loop stays free
+        stages = iter_repo_insights(
+            username, github_token, self.model, self.tokenizer,
+            repo_data=gateway.repo_metrics(), llm=self.scheduler, mode=mode
         )
-        self.tokenizer.pad_token = self.tokenizer.eos_token
+        while True:
+            stage = await asyncio.to_thread(next, stages, None)
+            if stage is None:
+                break
+            section, data = stage
+            yield {"section": section, "data": data}
+            if section == "repo_analysis":
+                repo_analysis = data
 
-        # Save the model with safe serialization
-        self.model.save_pretrained(cache_dir, safe_serialization=True)
+        final_output = {
+            "user_profile": user_profile,
+            "repo_analysis": repo_analysis,
+            "heatmap_data": heatmap_json,
+            "readme_analysis": gateway.readme(),
+            "readme_summary": readme_summary
+        }
+        self.result_store.put(username, repo_info["name"], repo_info["head_oid"], mode, final_output)
+        self.result_store.put_profile(username, user_profile)
 
     @modal.method()
-    def analyze_repos(self, username: str):
-        github_token = os.environ["GITHUB_TOKEN"]
-        
+    def contribution_heatmap(self, username: str, start: Optional[str] = None, end: Optional[str] = None, resolution: str = "day", repo: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a heatmap range query from the stored counts, without touching GitHub.
+
+        The rollup index is rebuilt only when a sync has changed the user's counts.
+        """
+        version = self.contribution_store.version(username)
+        if version is None:
+            raise ValueError(f"No contributions stored for {username}; analyze the user first.")
+        key = (username.lower(), repo)
+        cached = self.rollups.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, RollupIndex(self.contribution_store.rows(username, repo)))
+            self.rollups[key] = cached
+        self.rollups.move_to_end(key)
+        while len(self.rollups) > MAX_ROLLUP_INDEXES:
+            self.rollups.popitem(last=False)
+        return cached[1].query(start, end, resolution)
+
+    @modal.method()
+    def startup_stats(self) -> Dict[str, float]:
+        """Seconds spent in each phase of this container's cold start."""
+        return self.startup_timings
+
+    @modal.method()
+    def result_cache_stats(self) -> Dict[str, int]:
+        return self.result_store.stats()
+
+    @modal.method()
+    async def analyze_batch(self, usernames: List[str], mode: str = "chained") -> Dict[str, Dict[str, Any]]:
+        """Analyze several users, reporting failures per user instead of failing the batch."""
+        with request_priority(PRIORITY_BATCH):
+            return await self._analyze_batch(usernames, mode=mode)
+
+    async def _analyze_batch(self, usernames: List[str], mode: str = "chained") -> Dict[str, Dict[str, Any]]:
+        gateways = await fetch_gateways_async(self._github(), usernames, with_history=False)
+
+        async def analyze_one(username: str) -> Dict[str, Any]:
+            gateway = gateways[username]
+            if isinstance(gateway, Exception):
+                return {"status": "error", "error": str(gateway)}
+            try:
+                return {"status": "ok", "result": await self._analyze_gateway(username, gateway, mode=mode)}
+            except Exception as e:
+                logger.error(f"Failed to analyze {username}: {str(e)}")
+                return {"status": "error", "error": str(e)}
+
+        results = await asyncio.gather(*(analyze_one(username) for username in usernames))
+        return dict(zip(usernames, results))
+
+    async def _fetch_repository(self, username: str, repo: Dict[str, Any], mode: str = "chained") -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return `(result, None)` for a repository with a cached or failed result, else `(None, node)` to analyze."""
+        head_oid = repo["defaultBranchRef"]["target"]["oid"] if repo["defaultBranchRef"] else ""
+        cached = self.result_store.get(username, repo["name"], head_oid, f"repo-{mode}")
+        if cached is not None:
+            return cached, None
+        try:
+            return None, await fetch_repository_async(self._github(), username, repo["name"], with_history=False)
+        except Exception as e:
+            logger.error(f"Failed to fetch {username}/{repo['name']}: {str(e)}")
+            return {"repo_name": repo["name"], "error": str(e)}, None
+
+    async def _analyze_repository(self, username: str, node: Dict[str, Any], repo_data: Dict[str, Any], mode: str = "chained") -> Dict[str, Any]:
+        """Run the per-repo pipeline on one repository node and keep only the results.
+
+        `repo_data` is the node's metrics with the derived metrics already merged in.
+        """
+        github_token = self._github().github_token
         try:
-            # Fetch contributions data (which includes user profile)
-            contributions_data = fetch_contributions_data(username, github_token)
-            user_profile = contributions_data["user_profile"]
-            
-            # Analyze repo
-            repo_analysis = analyze_repo(username, github_token, self.model, self.tokenizer)
-            
-            # Process contributions for heatmap
-            processed_contributions = process_contributions(contributions_data["repo_analysis"][0]["commits"])
+            repo_info = build_repo_info(node)
+
+            repo_analysis, readme_summary = await asyncio.gather(
+                asyncio.to_thread(
+                    analyze_repo, username, github_token, self.model, self.tokenizer,
+                    repo_data=repo_data, llm=self.scheduler, mode=mode
+                ),
+                self._readme_summary(username, repo_info["readme_content"])
+            )
+
+            processed_contributions = await self._contributions(username, node["name"], repo_info["head_oid"])
             insights = generate_visual_attributes(processed_contributions)
-            heatmap_json = generate_heatmap_json(processed_contributions, insights)
-            
-            # Call readme_extraction function to process README
-            github_data = fetch_contributions_data(username, github_token)
-            readme_analysis = github_data["repo_analysis"][0]["readme_content"] 
-
-            
-            final_output = {
-                "user_profile": user_profile,
+
+            # Only the derived results are kept; daily counts live in the contribution store
+            result = {
+                "repo_name": node["name"],
+                "primary_language": repo_info["primary_language"],
+                "commit_count": sum(day["total_commits"] for day in processed_contributions.values()),
                 "repo_analysis": repo_analysis,
-                "heatmap_data": heatmap_json,
-                "readme_analysis": readme_analysis
+                "heatmap_data": generate_heatmap_json(processed_contributions, insights) if processed_contributions else {},
+                "readme_analysis": repo_info["readme_content"],
+                "readme_summary": readme_summary
             }
+            # Per-repo results have their own shape, so they live under their own mode key
+            self.result_store.put(username, node["name"], repo_info["head_oid"], f"repo-{mode}", result)
+            return result
+        except Exception as e:
+            logger.error(f"Failed to analyze {username}/{node['name']}: {str(e)}")
+            return {"repo_name": node["name"], "error": str(e)}
 
-            logger.info(f"Final structured output: {json.dumps(final_output, indent=2)}")
+    @modal.method()
+    async def analyze_user_repos(
+        self,
+        username: str,
+        top_n: int = 5,
+        sort_by: str = "stars",
+        include_archived: bool = False,
+        include_forks: bool = False,
+        max_parallel: int = 4,
+        mode: str = "chained"
+    ):
+        """Analyze the user's top `top_n` repositories and aggregate the results."""
+        client = self._github()
+        try:
+            user_profile, selected, scanned = await select_repositories(
+                client, username, top_n=top_n, sort_by=sort_by,
+                include_archived=include_archived, include_forks=include_forks
+            )
+            fetched = await gather_bounded(
+                [self._fetch_repository(username, repo, mode=mode) for repo in selected],
+                max_parallel
+            )
+            nodes = [node for _, node in fetched if node is not None]
+            # Derived metrics for every repository to analyze in one vectorized pass
+            metrics = [build_repo_metrics(node) for node in nodes]
+            repo_data = {
+                node["name"]: {**row, **derived}
+                for node, row, derived in zip(nodes, metrics, compute_derived_metrics(metrics) if metrics else [])
+            }
+            analyzed = iter(await gather_bounded(
+                [self._analyze_repository(username, node, repo_data[node["name"]], mode=mode) for node in nodes],
+                max_parallel
+            ))
+            repo_results = [result if node is None else next(analyzed) for result, node in fetched]
 
-            return final_output
+            return {
+                "user_profile": user_profile,
+                "repos": repo_results,
+                "aggregate": aggregate_repo_results(repo_results, scanned)
+            }
         except Exception as e:
             logger.error(f"Failed to analyze repos: {str(e)}")
             raise
 
+@modal_app.function(
+    gpu="A10G",
+    image=llm_image,
+    volumes={"/root/model_cache": volume},
+    secrets=[modal.Secret.from_name("huggingface-secret")],
+    mounts=[modal.Mount.from_local_dir(".", remote_path="/root/app")],
+    timeout=3600
+)
+def build_model_snapshot():
+    """One-time build of the quantized snapshot every LLMInference container loads.
+
+    Run with `modal run main.py::build_model_snapshot` after changing MODEL_PATH or the
+    quantization; rerunning replaces the snapshot.
+    """
+    cache_dir = "/root/model_cache"
+    timer = PhaseTimer()
+    build_snapshot(MODEL_PATH, ACCESS_TOKEN, snapshot_dir(MODEL_PATH, cache_dir), cache_dir, timer, replace=True)
+    with timer.phase("commit_volume"):
+        volume.commit()
+    print(json.dumps(timer.report(), indent=2))
+
+@modal_app.function(
+    gpu="A10G" if GPU_BACKEND else None,
+    cpu=None if GPU_BACKEND else CPU_CORES,
+    memory=None if GPU_BACKEND else CPU_MEMORY_MB,
+    image=inference_image,
+    volumes={"/root/model_cache": volume},
+    secrets=[modal.Secret.from_name("huggingface-secret")],
+    mounts=[modal.Mount.from_local_dir(".", remote_path="/root/app")],
+    timeout=3600
+)
+def benchmark_inference_backend(repos: int = 8, concurrency: str = "1,4,8", tune_threads: bool = True):
+    """Throughput of this deployment's backend on the analysis workload, as a JSON report.
+
+    Run once per backend and compare the saved reports with `benchmarks.backends`:
+    `modal run main.py::benchmark_inference_backend > gpu.json`, then the same with
+    `INFERENCE_BACKEND=llamacpp` into cpu.json.
+    """
+    from benchmarks.backends import run
+
+    timer = PhaseTimer()
+    backend = load_backend("/root/model_cache", timer)
+    report = run(backend, repos, [int(level) for level in concurrency.split(",")], tune=tune_threads)
+    report["startup"] = timer.report()
+    print(json.dumps(report, indent=2))
+
 # Create an instance of LLMInference
 llm = LLMInference()
 
-@modal_app.function(image=llm_image)
+# The web tier runs on the slim image: no model stack to pull or import on cold start
+@modal_app.function(image=web_image, secrets=[modal.Secret.from_name("github-secret")])
 @asgi_app()
 def fastapi_app():
+    return create_app(llm, job_dict, metrics_dict)
 
-
-    @app.get("/api/analyze")
-    async def analyze_endpoint(username: str):
-        try:
-            # Use the llm instance to call analyze_repos
-            structured_output = llm.analyze_repos.remote(username)
-            logger.info(f"API response: {json.dumps(structured_output, indent=2)}")
-            return structured_output
-        except Exception as e:
-            logger.error(f"Failed to analyze repos: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to analyze repos: {str(e)}")
-
-    return app
+# Jobs submitted with only a callback are never polled, so lost ones are found here
+@modal_app.function(image=web_image, schedule=modal.Period(seconds=JOB_SWEEP_SECONDS))
+async def sweep_jobs():
+    jobs = JobStore(job_dict)
+    requeued, failed = await asyncio.to_thread(jobs.sweep)
+    for job in requeued:
+        await llm.run_job.spawn.aio(job["id"])
+    for job in failed:
+        if job["callback_url"]:
+            await send_job_callback(job["callback_url"], jobs.public_view(job))
+    if requeued or failed:
+        logger.info(f"Job sweep re-queued {len(requeued)} and failed {len(failed)} lost jobs")
 
 @modal_app.function(
     image=llm_image,
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Written last, so a directory without it is an interrupted build and never loaded
+SNAPSHOT_MARKER = "snapshot.json"
+
+# The one quantization every container serves with; part of the snapshot's identity
+QUANTIZATION = {
+    "load_in_4bit": True,
+    "bnb_4bit_use_double_quant": True,
+    "bnb_4bit_compute_dtype": "float16",
+    "bnb_4bit_quant_type": "nf4",
+}
+
+def quantization_id() -> str:
+    return hashlib.sha256(json.dumps(QUANTIZATION, sort_keys=True).encode()).hexdigest()[:8]
+
+def snapshot_dir(model_path: str, cache_dir: str) -> str:
+    # Named by the quantization too, so changing it builds a new snapshot beside the old
+    return os.path.join(cache_dir, "snapshots", f"{model_path.replace('/', '--')}-nf4-{quantization_id()}")
+
+def read_marker(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, SNAPSHOT_MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_ready(path: str) -> bool:
+    """True for a complete snapshot built with the current `QUANTIZATION`."""
+    marker = read_marker(path)
+    return marker is not None and marker.get("quantization") == QUANTIZATION
+
+class PhaseTimer:
+    """Wall-clock seconds per named startup phase, in the order they ran."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.monotonic() - started, 3)
+
+    def report(self) -> Dict[str, float]:
+        return dict(self.phases, total=round(sum(self.phases.values()), 3))
+
+def _quantization_config():
+    import torch
+    from transformers import BitsAndBytesConfig
+
+    return BitsAndBytesConfig(**dict(QUANTIZATION, bnb_4bit_compute_dtype=getattr(torch, QUANTIZATION["bnb_4bit_compute_dtype"])))
+
+def _publish(staging: str, path: str, replace: bool) -> bool:
+    """Move a finished build to `path`; False, discarding it, when another builder got there first.
+
+    Renaming a directory onto a non-empty one fails, so of concurrent builders exactly
+    one publishes, and a ready snapshot is never taken away from readers. Only an
+    outdated or broken snapshot, or a forced rebuild, is moved aside to be replaced.
+    """
+    try:
+        os.rename(staging, path)
+        return True
+    except OSError:
+        if snapshot_ready(path) and not replace:
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+    aside = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".old-")
+    os.replace(path, aside)
+    os.rename(staging, path)
+    shutil.rmtree(aside, ignore_errors=True)
+    return True
+
+def build_snapshot(model_path: str, access_token: Optional[str], path: str, cache_dir: str, timer: Optional[PhaseTimer] = None, replace: bool = False):
+    """Quantize the hub checkpoint once and save it, with its tokenizer, as safetensors.
+
+    The quantization config is stored in the snapshot's config.json, so loading it
+    restores the NF4 weights as saved instead of quantizing the fp16 checkpoint again.
+    A complete snapshot already at `path` is kept unless `replace` is set. Returns the
+    loaded `(model, tokenizer)` so the building container can serve at once.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    timer = timer or PhaseTimer()
+    with timer.phase("download_tokenizer"):
+        tokenizer = AutoTokenizer.from_pretrained(model_path, use_auth_token=access_token, cache_dir=cache_dir)
+    with timer.phase("quantize"):
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            use_auth_token=access_token,
+            cache_dir=cache_dir,
+            device_map="auto",
+            quantization_config=_quantization_config()
+        )
+
+    # Each builder saves into its own scratch directory and renames it into place, so
+    # concurrent cold containers never touch each other's files and readers never
+    # see a partial snapshot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".partial-")
+    with timer.phase("save_snapshot"):
+        try:
+            model.save_pretrained(staging, safe_serialization=True)
+            tokenizer.save_pretrained(staging)
+            with open(os.path.join(staging, SNAPSHOT_MARKER), "w") as f:
+                json.dump({"model_path": model_path, "quantization": QUANTIZATION, "created_at": time.time()}, f)
+            published = _publish(staging, path, replace)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    if published:
+        logger.info(f"Built quantized snapshot of {model_path} at {path}: {timer.report()}")
+    else:
+        logger.info(f"Another container published the snapshot at {path} first; serving this build without saving it")
+    return model, tokenizer
+
+def load_snapshot(path: str, timer: Optional[PhaseTimer] = None) -> Tuple[Any, Any]:
+    """Load a prebuilt snapshot; safetensors shards are memory-mapped, nothing is re-quantized or saved."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    timer = timer or PhaseTimer()
+    with timer.phase("load_tokenizer"):
+        tokenizer = AutoTokenizer.from_pretrained(path)
+    with timer.phase("load_weights"):
+        model = AutoModelForCausalLM.from_pretrained(path, device_map="auto", low_cpu_mem_usage=True)
+    return model, tokenizer
+
+def load_or_build(model_path: str, access_token: Optional[str], cache_dir: str, timer: Optional[PhaseTimer] = None) -> Tuple[Any, Any]:
+    """Fast path from the snapshot when one exists; otherwise build it once, here."""
+    path = snapshot_dir(model_path, cache_dir)
+    if snapshot_ready(path):
+        return load_snapshot(path, timer)
+    marker = read_marker(path)
+    if marker is not None:
+        logger.warning(f"Snapshot at {path} was built with {marker.get('quantization')}, not {QUANTIZATION}; rebuilding it")
+        return build_snapshot(model_path, access_token, path, cache_dir, timer, replace=True)
+    logger.warning(f"No quantized snapshot at {path}; building it in the startup path")
+    return build_snapshot(model_path, access_token, path, cache_dir, timer)
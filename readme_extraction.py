@@ -1,14 +1,22 @@
 import logging
+import os
 from pydantic import BaseModel
-from typing import List, Optional
-from transformers import PreTrainedModel, PreTrainedTokenizer
+from typing import Any, List, Optional
 import outlines
-from heatmap import fetch_contributions_data  # Import the function
+from github_gateway import GitHubGateway
+from generator_registry import run_generation
+from inference_backend import TransformersBackend
+from readme_index import readme_blob_hash, split_sections, extract_deterministic, budget_sections
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tokens of README text the model reads for the free-text fields
+DEFAULT_README_TOKEN_BUDGET = int(os.environ.get("README_TOKEN_BUDGET", "1500"))
+# Bump when extraction changes, so cached results from older logic are not served
+EXTRACTION_VERSION = 1
+
 # Define the structure for the README data
 class ReadmeData(BaseModel):
     project_description: Optional[str] = ""
@@ -21,33 +29,57 @@ class ReadmeData(BaseModel):
     roadmap: Optional[List[str]] = []
     acknowledgments: Optional[List[str]] = []
 
+# The fields that need the model; license, installation and usage are read by heading
+class ReadmeSummary(BaseModel):
+    project_description: Optional[str] = ""
+    key_features: Optional[List[str]] = []
+    contributing_guidelines: Optional[str] = ""
+    project_status: Optional[str] = ""
+    roadmap: Optional[List[str]] = []
+    acknowledgments: Optional[List[str]] = []
+
 # Define a template for extracting information from the README
 @outlines.prompt
 def extract_readme_info(readme_content: str) -> str:
     """
-    Extract the following information from the README:
+    Extract the following information from these README sections:
     - Project description
     - Key features
-    - Installation instructions
-    - Usage examples
-    - License
     - Contributing guidelines
     - Project status
     - Roadmap (if available)
     - Acknowledgments (if available)
 
-    README content:
-    {readme_content}
+    README sections:
+    {{ readme_content }}
 
     Output the extracted information in JSON format.
     """
-    return f"README content:\n{readme_content}"
+    return f"README sections:\n{readme_content}"
 
 # Function to extract data from README
-def readme_extraction(model: PreTrainedModel, tokenizer: PreTrainedTokenizer, username: str, github_token: str) -> ReadmeData:
-    # Fetch contributions data to get the readme_content
-    github_data = fetch_contributions_data(username, github_token)
-    readme_content = github_data.get("readme_content", "")
+def readme_extraction(
+    model,
+    tokenizer,
+    username: str,
+    github_token: str,
+    readme_content: Optional[str] = None,
+    llm=None,
+    token_budget: int = DEFAULT_README_TOKEN_BUDGET,
+    store: Optional[Any] = None
+) -> ReadmeData:
+    """Extract README data, asking the model only for what headings cannot locate.
+
+    License, installation commands and usage examples come from a deterministic pass
+    over the README's sections; the model reads the intro and summary sections trimmed
+    to `token_budget` tokens. With a `ResultStore`, results are cached by the README's
+    git blob hash, so an unchanged README is never sent to the model twice. `llm` is
+    an `InferenceBackend` or a scheduler over one; without it `model` and `tokenizer`
+    are used through a `TransformersBackend`.
+    """
+    # Only fetch when the caller has not already got the README from its GitHubGateway
+    if readme_content is None:
+        readme_content = GitHubGateway(username, github_token).readme()
 
     if not isinstance(readme_content, str):
         logger.error("Expected readme_content to be a string, but got a %s", type(readme_content).__name__)
@@ -57,14 +89,34 @@ def readme_extraction(model: PreTrainedModel, tokenizer: PreTrainedTokenizer, us
     if not readme_content:
         return ReadmeData()
 
-    logger.debug(f"Extracting README data for content: {readme_content}")
-    prompt = extract_readme_info(readme_content)
-    
-    # Generate structured JSON output using Outlines with type-annotated arguments
-    generator = outlines.generate.json(model, tokenizer, ReadmeData)
-    result = generator([prompt])
-    
-    logger.debug(f"Extracted README data: {result}")
-    
-    # Validate and return the ReadmeData object
-    return ReadmeData(**result[0])
\ No newline at end of file
+    blob_key = f"{readme_blob_hash(readme_content)}:v{EXTRACTION_VERSION}:{token_budget}"
+    if store is not None:
+        cached = store.get_readme(blob_key)
+        if cached is not None:
+            return ReadmeData(**cached)
+
+    sections = split_sections(readme_content)
+    fields = extract_deterministic(sections)
+
+    # Without a backend (or scheduler) to generate with, wrap the bare Transformers model
+    if llm is None:
+        llm = TransformersBackend(model, tokenizer)
+
+    # Count with the model's own tokenizer when there is one
+    count_tokens = getattr(llm, "count_tokens", None)
+    if count_tokens is None and tokenizer is not None:
+        count_tokens = lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    if count_tokens is not None:
+        context = budget_sections(sections, token_budget, count_tokens)
+    else:
+        context = budget_sections(sections, token_budget)
+    logger.debug(f"README {blob_key}: {len(sections)} sections, {len(readme_content)} chars, {len(context)} chars sent to the model")
+
+    if context:
+        summary = run_generation(llm, ReadmeSummary, extract_readme_info(context))
+        fields.update(summary.dict())
+
+    result = ReadmeData(**fields)
+    if store is not None:
+        store.put_readme(blob_key, result.dict())
+    return result
@@ -0,0 +1,203 @@
+import hashlib
+import re
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+
+# Shell-ish fence languages whose lines are commands
+SHELL_LANGUAGES = {"", "bash", "sh", "shell", "console", "zsh", "powershell", "ps", "cmd", "terminal"}
+INSTALL_COMMAND = re.compile(
+    r"^(sudo\s+)?(pip3?|pipx|python3?\s+-m\s+pip|python3?\s+setup\.py|poetry|conda|mamba|npm|yarn|pnpm|npx|bun|cargo|go\s+(install|get)|"
+    r"gem|bundle|composer|brew|apt(-get)?|yum|dnf|pacman|choco|winget|docker|git\s+clone|make|cmake|dotnet|mvn|gradle|./configure)\b"
+)
+# Common license names, most specific first
+LICENSE_NAMES = (
+    "Apache License 2.0", "Apache-2.0", "Apache 2.0", "GNU GPLv3", "GPL-3.0", "GPLv3", "GPL-2.0", "GPLv2",
+    "LGPL-3.0", "LGPL-2.1", "AGPL-3.0", "MPL-2.0", "BSD-3-Clause", "BSD-2-Clause", "BSD 3-Clause", "BSD 2-Clause",
+    "MIT License", "MIT", "ISC", "Unlicense", "CC0-1.0", "CC-BY-4.0", "EPL-2.0", "Zlib", "BSL-1.0",
+)
+
+LICENSE_TITLES = ("license", "licence", "licensing")
+INSTALL_TITLES = ("install", "setup", "set up", "getting started", "quick start", "quickstart", "requirements", "build")
+USAGE_TITLES = ("usage", "example", "quick start", "quickstart", "getting started", "how to use", "demo", "tutorial", "run")
+# Sections the model reads for the free-text fields, in priority order after the intro
+SUMMARY_TITLES = (
+    ("about", "overview", "introduction", "description", "what is", "why"),
+    ("feature", "highlight", "capabilit"),
+    ("status", "roadmap", "todo", "future", "planned"),
+    ("contribut",),
+    ("acknowledg", "credit", "thank"),
+)
+
+MAX_USAGE_EXAMPLES = 5
+MAX_EXAMPLE_CHARS = 800
+
+class ReadmeSection(TypedDict):
+    level: int
+    title: str
+    body: str
+
+def readme_blob_hash(content: str) -> str:
+    """The git blob id of `content`, identical to the README's oid on GitHub."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def split_sections(markdown: str) -> List[ReadmeSection]:
+    """Split Markdown at ATX and setext headings, ignoring `#` lines inside code fences.
+
+    Text before the first heading becomes a level-0 section with an empty title.
+    """
+    sections: List[ReadmeSection] = [{"level": 0, "title": "", "body": ""}]
+    body: List[str] = []
+    fence: Optional[str] = None
+    lines = markdown.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if fence is None and stripped.startswith(("```", "~~~")):
+            fence = stripped[:3]
+        elif fence is not None and stripped.startswith(fence):
+            fence = None
+        elif fence is None:
+            heading = re.match(r"^(#{1,6})\s+(.*?)\s*#*\s*$", line)
+            underline = i + 1 < len(lines) and re.match(r"^(=+|-+)\s*$", lines[i + 1]) and stripped
+            if heading or underline:
+                sections[-1]["body"] = "\n".join(body).strip()
+                body = []
+                if heading:
+                    sections.append({"level": len(heading.group(1)), "title": heading.group(2), "body": ""})
+                else:
+                    sections.append({"level": 1 if lines[i + 1].lstrip().startswith("=") else 2, "title": stripped, "body": ""})
+                continue
+            if body == [] and re.match(r"^(=+|-+)\s*$", line) and sections[-1]["title"]:
+                continue  # The underline of the setext heading just opened
+        body.append(line)
+    sections[-1]["body"] = "\n".join(body).strip()
+    return [section for section in sections if section["title"] or section["body"]]
+
+def _strip_markdown_images(text: str) -> str:
+    # Badges and screenshots cost tokens and carry nothing the model can read
+    return re.sub(r"\[?!\[[^\]]*\]\([^)]*\)(\]\([^)]*\))?", "", text)
+
+def _clean_title(title: str) -> str:
+    # Drop emoji, badges, links and emphasis so "## 🚀 **Quick Start**" matches "quick start"
+    title = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", _strip_markdown_images(title))
+    return re.sub(r"[^a-z0-9 ]+", " ", title.lower()).strip()
+
+def find_sections(sections: List[ReadmeSection], keywords: Tuple[str, ...]) -> List[ReadmeSection]:
+    return [section for section in sections if any(keyword in _clean_title(section["title"]) for keyword in keywords)]
+
+def code_blocks(body: str) -> List[Tuple[str, str]]:
+    """(language, code) for every fenced code block in `body`."""
+    return [(language.strip().lower(), code.strip("\n")) for _, language, code in re.findall(r"^(```|~~~)([^\n]*)\n(.*?)^\1", body, re.M | re.S)]
+
+def _strip_markdown(text: str) -> str:
+    text = re.sub(r"!\[[^\]]*\]\([^)]*\)", "", text)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    return re.sub(r"[*_`>#]", "", text).strip()
+
+def _license_name(text: str) -> str:
+    for name in LICENSE_NAMES:
+        # Hyphens delimit names in badge URLs like .../badge/license-MIT-blue
+        if re.search(rf"(?<![A-Za-z0-9]){re.escape(name)}(?![A-Za-z0-9])", text, re.I):
+            return name
+    return ""
+
+def extract_license(sections: List[ReadmeSection]) -> str:
+    for section in find_sections(sections, LICENSE_TITLES):
+        body = _strip_markdown(section["body"])
+        first_line = next((line.strip() for line in body.splitlines() if line.strip()), "")
+        name = _license_name(body) or first_line
+        if name:
+            return name
+    # Badges and footers often name the license outside any License section
+    for section in sections:
+        for line in section["body"].splitlines():
+            if re.search(r"licen[sc]e", line, re.I):
+                name = _license_name(line)
+                if name:
+                    return name
+    return ""
+
+def _command_lines(code: str) -> List[str]:
+    commands = []
+    for line in code.splitlines():
+        line = re.sub(r"^\s*(\$|>|PS>|#\s*(?=sudo))\s*", "", line).strip()
+        if line and not line.startswith("#"):
+            commands.append(line)
+    return commands
+
+def extract_install_commands(sections: List[ReadmeSection]) -> List[str]:
+    commands: List[str] = []
+    for section in find_sections(sections, INSTALL_TITLES):
+        for language, code in code_blocks(section["body"]):
+            if language in SHELL_LANGUAGES:
+                commands.extend(_command_lines(code))
+        # Inline `pip install foo` outside code blocks
+        commands.extend(command for command in re.findall(r"`([^`\n]+)`", section["body"]) if INSTALL_COMMAND.match(command))
+    if not commands:
+        # No install section: fall back to recognizable install commands anywhere
+        for section in sections:
+            for language, code in code_blocks(section["body"]):
+                if language in SHELL_LANGUAGES:
+                    commands.extend(line for line in _command_lines(code) if INSTALL_COMMAND.match(line))
+    return list(dict.fromkeys(commands))
+
+def extract_usage_examples(sections: List[ReadmeSection], install_commands: List[str]) -> List[str]:
+    examples: List[str] = []
+    installs = set(install_commands)
+    for section in find_sections(sections, USAGE_TITLES):
+        for language, code in code_blocks(section["body"]):
+            # Blocks that only repeat the install commands are not usage
+            if language in SHELL_LANGUAGES and set(_command_lines(code)) <= installs:
+                continue
+            examples.append(code[:MAX_EXAMPLE_CHARS])
+    return list(dict.fromkeys(examples))[:MAX_USAGE_EXAMPLES]
+
+def extract_deterministic(sections: List[ReadmeSection]) -> Dict[str, object]:
+    """The README fields that are located by heading rather than inferred."""
+    install_commands = extract_install_commands(sections)
+    return {
+        "license": extract_license(sections),
+        "installation_instructions": install_commands,
+        "usage_examples": extract_usage_examples(sections, install_commands),
+    }
+
+def approximate_tokens(text: str) -> int:
+    # Roughly four characters per token for English prose and Markdown
+    return (len(text) + 3) // 4
+
+def budget_sections(
+    sections: List[ReadmeSection],
+    token_budget: int,
+    count_tokens: Callable[[str], int] = approximate_tokens
+) -> str:
+    """The sections the free-text fields depend on, trimmed to `token_budget` tokens.
+
+    The introduction goes first, then matched sections by `SUMMARY_TITLES` priority.
+    Code blocks are dropped since the deterministic pass already covers them.
+    """
+    chosen: List[ReadmeSection] = [section for section in sections if section["level"] == 0][:1]
+    if not chosen and sections:
+        chosen = sections[:1]  # The first section usually introduces the project
+    for keywords in SUMMARY_TITLES:
+        chosen.extend(section for section in find_sections(sections, keywords) if section not in chosen)
+
+    parts: List[str] = []
+    remaining = token_budget
+    for section in chosen:
+        body = re.sub(r"^(```|~~~)[^\n]*\n.*?^\1", "", section["body"], flags=re.M | re.S)
+        body = re.sub(r"\n{3,}", "\n\n", _strip_markdown_images(body)).strip()
+        title = _strip_markdown_images(section["title"]).strip()
+        text = f"## {title}\n{body}" if title else body
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            # Keep the head of a section that does not fit whole
+            text = text[:max(0, remaining) * 4]
+            tokens = count_tokens(text)
+            if not text or tokens > remaining:
+                break
+        parts.append(text)
+        remaining -= tokens
+        if remaining <= 0:
+            break
+    return "\n\n".join(parts)
@@ -1,25 +1,38 @@
-import requests
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
-from outlines import models, generate
 import json
+import numpy as np
 import logging
+from github_client import GITHUB_API_URL, check_response, send_sync
+from generator_registry import run_generation
+from inference_backend import TransformersBackend
+from telemetry import log_payload, traced
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def fetch_repo_data(username: str, github_token: str) -> Dict[str, Any]:
-    headers = {"Authorization": f"token {github_token}"}
-    repos_url = f"https://api.github.com/users/{username}/repos?sort=updated&per_page=1"
+    repos_url = f"{GITHUB_API_URL}/users/{username}/repos?sort=updated&per_page=1"
 
-    response = requests.get(repos_url, headers=headers)
+    response = send_sync("GET", repos_url, "core", github_token)
+    check_response(response)
     repos_data = response.json()
 
     if not repos_data:
         raise ValueError("No repositories found for the given user.")
 
-    repo = repos_data[0]
+    return _repo_metrics_from_rest(repos_data[0])
+
+async def fetch_repo_data_async(username: str, client) -> Dict[str, Any]:
+    repos_data = await client.get_json(f"/users/{username}/repos", params={"sort": "updated", "per_page": 1})
+
+    if not repos_data:
+        raise ValueError("No repositories found for the given user.")
+
+    return _repo_metrics_from_rest(repos_data[0])
+
+def _repo_metrics_from_rest(repo: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "repo_name": repo['name'],
         "stars": repo.get("stargazers_count", 0),
@@ -29,15 +42,48 @@ def fetch_repo_data(username: str, github_token: str) -> Dict[str, Any]:
         "issues_closed": repo.get("closed_issues_count", 0)
     }
 
+def compute_derived_metrics(repos: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Compute the arithmetic metrics for many repositories at once."""
+    stars = np.array([repo["stars"] for repo in repos], dtype=np.float64)
+    forks = np.array([repo["forks"] for repo in repos], dtype=np.float64)
+    open_issues = np.array([repo["open_issues"] for repo in repos], dtype=np.float64)
+    issues_closed = np.array([repo.get("issues_closed", 0) for repo in repos], dtype=np.float64)
+    total_issues = open_issues + issues_closed
+
+    # Repositories without stars or issues get 0 instead of a division by zero
+    forks_to_stars = np.divide(forks, stars, out=np.zeros_like(forks), where=stars > 0)
+    resolution_rate = np.divide(issues_closed, total_issues, out=np.zeros_like(total_issues), where=total_issues > 0)
+
+    return [
+        {"forks_to_stars_ratio": round(float(ratio), 3), "issues_resolution_rate": round(float(rate), 3)}
+        for ratio, rate in zip(forks_to_stars, resolution_rate)
+    ]
+
+def format_repo_facts(repo_data: Dict[str, Any]) -> str:
+    """Render repository metrics (and derived metrics, when present) as compact prompt lines."""
+    lines = [
+        f"Repository: {repo_data['repo_name']}",
+        f"Stars: {repo_data['stars']}",
+        f"Forks: {repo_data['forks']}",
+        f"Open Issues: {repo_data['open_issues']}",
+        f"Closed Issues: {repo_data.get('issues_closed', 0)}",
+        f"Watchers: {repo_data['watchers']}",
+    ]
+    if "forks_to_stars_ratio" in repo_data:
+        lines.append(f"Forks to Stars Ratio: {repo_data['forks_to_stars_ratio']}")
+    if "issues_resolution_rate" in repo_data:
+        lines.append(f"Issues Resolution Rate: {repo_data['issues_resolution_rate']}")
+    return "\n".join(lines)
+
 class SurfaceInsights(BaseModel):
     popularity: str
     community_engagement: str
     issue_management: str
     observations: List[str]
 
+# Numeric metrics are computed by `compute_derived_metrics` and given to the model as
+# facts; the schemas only hold the fields that need the model's judgment.
 class IntermediateInsights(BaseModel):
-    forks_to_stars_ratio: float
-    issues_resolution_rate: float
     community_interest: str
     derived_insights: List[str]
 
@@ -51,102 +97,168 @@ class DeepInsights(BaseModel):
 class NarrativeSummary(BaseModel):
     summary: str
 
+# All four tiers in one schema, for the single-pass "fused" mode
+class FusedInsights(BaseModel):
+    surface: SurfaceInsights
+    intermediate: IntermediateInsights
+    deep: DeepInsights
+    narrative: NarrativeSummary
+
+ANALYSIS_MODES = ("chained", "fused")
+
+# The four stages form one growing conversation: every prompt is the previous stage's
+# prompt plus its answer plus the next instruction. With a prefix-cached model only the
+# new tail is prefilled, and the preamble is shared by every analysis. It ends in a
+# blank line so the tokens at its end are the same in every prompt built on it.
+ANALYST_PREAMBLE = """You are an expert reviewer of open-source projects. You will analyze one GitHub repository in four stages and answer each stage in JSON. Later stages build on your earlier answers.
+
+"""
+
+SURFACE_INSTRUCTION = """Stage 1, surface insights: provide insights on popularity, community engagement, issue management, and a list of key observations."""
+
+INTERMEDIATE_INSTRUCTION = """Stage 2, intermediate insights: the ratios above are already computed; use them as given. Analyze community interest and provide a list of derived insights based on the surface observations."""
+
+DEEP_INSTRUCTION = """Stage 3, deep insights: evaluate project health, community vitality, and documentation quality. Provide an overall score (0-100) and a list of key findings that synthesize all previous insights."""
+
+NARRATIVE_INSTRUCTION = """Stage 4, narrative summary: provide a summary with exactly four well-written, informative sentences:
+1. One sentence on the repository's overall health and popularity.
+2. One sentence on the community's involvement and interest in the project.
+3. One sentence on the project's documentation quality and issue management.
+4. One sentence with specific improvement suggestions based on the analysis.
+
+Ensure each sentence is detailed, nuanced, and captures the essence of the insights provided."""
+
+def build_stage_prompt(repo_data: Dict[str, Any], answered: List[Tuple[str, BaseModel]], instruction: str) -> str:
+    """Render the conversation so far, ending with the next stage's instruction."""
+    prompt = ANALYST_PREAMBLE + "Repository metrics:\n" + format_repo_facts(repo_data) + "\n"
+    for stage_instruction, answer in answered:
+        prompt += f"\n{stage_instruction}\nAnswer: {json.dumps(answer.model_dump())}\n"
+    return prompt + f"\n{instruction}\nAnswer: "
+
+@traced("insight.surface")
 def generate_surface_insights(llm, repo_data: Dict[str, Any]) -> SurfaceInsights:
-    surface_generator = generate.json(llm, SurfaceInsights)
-    surface_prompt = f"""
-    Analyze the following repository metrics and provide surface-level insights:
-    Repository: {repo_data['repo_name']}
-    Stars: {repo_data['stars']}
-    Forks: {repo_data['forks']}
-    Open Issues: {repo_data['open_issues']}
-    Watchers: {repo_data['watchers']}
-
-    Provide insights on popularity, community engagement, issue management, and a list of key observations.
-    """
-    logger.info(f"Surface prompt: {surface_prompt}")
-    surface_insights = surface_generator(surface_prompt)
+    surface_prompt = build_stage_prompt(repo_data, [], SURFACE_INSTRUCTION)
+    log_payload(logger, "Surface prompt", surface_prompt)
+    surface_insights = run_generation(llm, SurfaceInsights, surface_prompt)
     return surface_insights
 
+@traced("insight.intermediate")
 def generate_intermediate_insights(llm, repo_data: Dict[str, Any], surface_insights: SurfaceInsights) -> IntermediateInsights:
-    intermediate_generator = generate.json(llm, IntermediateInsights)
-    intermediate_prompt = f"""
-    Based on the surface insights and repo data, provide intermediate insights:
-    Surface Insights: {json.dumps(surface_insights.dict(), indent=2)}
-    Repo Data: {json.dumps(repo_data, indent=2)}
-
-    Calculate forks_to_stars_ratio and issues_resolution_rate.
-    Analyze community interest and provide a list of derived insights based on the surface observations.
-    """
-    logger.info(f"Intermediate prompt: {intermediate_prompt}")
-    intermediate_insights = intermediate_generator(intermediate_prompt)
+    intermediate_prompt = build_stage_prompt(
+        repo_data,
+        [(SURFACE_INSTRUCTION, surface_insights)],
+        INTERMEDIATE_INSTRUCTION
+    )
+    log_payload(logger, "Intermediate prompt", intermediate_prompt)
+    intermediate_insights = run_generation(llm, IntermediateInsights, intermediate_prompt)
     return intermediate_insights
 
+@traced("insight.deep")
 def generate_deep_insights(llm, repo_data: Dict[str, Any], surface_insights: SurfaceInsights, intermediate_insights: IntermediateInsights) -> DeepInsights:
-    deep_generator = generate.json(llm, DeepInsights)
-    deep_prompt = f"""
-    Based on all previous insights and repo data, provide deep insights:
-    Surface Insights: {json.dumps(surface_insights.model_dump(), indent=2)}
-    Intermediate Insights: {json.dumps(intermediate_insights.model_dump(), indent=2)}
-    Repo Data: {json.dumps(repo_data, indent=2)}
-
-    Evaluate project health, community vitality, and documentation quality.
-    Provide an overall score (0-100) and a list of key findings that synthesize all previous insights.
-    """
-    logger.info(f"Deep prompt: {deep_prompt}")
-    deep_insights = deep_generator(deep_prompt)
+    deep_prompt = build_stage_prompt(
+        repo_data,
+        [(SURFACE_INSTRUCTION, surface_insights), (INTERMEDIATE_INSTRUCTION, intermediate_insights)],
+        DEEP_INSTRUCTION
+    )
+    log_payload(logger, "Deep prompt", deep_prompt)
+    deep_insights = run_generation(llm, DeepInsights, deep_prompt)
     return deep_insights
 
+@traced("insight.narrative")
 def generate_narrative_summary(llm, repo_data: Dict[str, Any], surface_insights: SurfaceInsights, intermediate_insights: IntermediateInsights, deep_insights: DeepInsights) -> NarrativeSummary:
-    narrative_generator = generate.json(llm, NarrativeSummary)
-    narrative_prompt = f"""
-    Create a concise summary for the repository {repo_data['repo_name']} based on the following insights:
-    Surface Insights: {json.dumps(surface_insights.dict(), indent=2)}
-    Intermediate Insights: {json.dumps(intermediate_insights.dict(), indent=2)}
-    Deep Insights: {json.dumps(deep_insights.dict(), indent=2)}
-
-    Provide a summary with exactly four well-written, informative sentences:
-    1. One sentence on the repository's overall health and popularity.
-    2. One sentence on the community's involvement and interest in the project.
-    3. One sentence on the project's documentation quality and issue management.
-    4. One sentence with specific improvement suggestions based on the analysis.
-
-    Ensure each sentence is detailed, nuanced, and captures the essence of the insights provided.
-    """
-    logger.info(f"Narrative prompt: {narrative_prompt}")
-    narrative_summary = narrative_generator(narrative_prompt)
+    narrative_prompt = build_stage_prompt(
+        repo_data,
+        [(SURFACE_INSTRUCTION, surface_insights), (INTERMEDIATE_INSTRUCTION, intermediate_insights), (DEEP_INSTRUCTION, deep_insights)],
+        NARRATIVE_INSTRUCTION
+    )
+    log_payload(logger, "Narrative prompt", narrative_prompt)
+    narrative_summary = run_generation(llm, NarrativeSummary, narrative_prompt)
     return narrative_summary
 
-def analyze_repo(username: str, github_token: str, model, tokenizer) -> dict:
+@traced("insight.fused")
+def generate_fused_insights(llm, repo_data: Dict[str, Any]) -> FusedInsights:
+    # Same preamble and instructions as the chained stages, answered in a single pass
+    instructions = "\n\n".join([SURFACE_INSTRUCTION, INTERMEDIATE_INSTRUCTION, DEEP_INSTRUCTION, NARRATIVE_INSTRUCTION])
+    fused_prompt = build_stage_prompt(
+        repo_data,
+        [],
+        f"{instructions}\n\nAnswer all four stages at once, with one JSON key per stage: surface, intermediate, deep and narrative."
+    )
+    log_payload(logger, "Fused prompt", fused_prompt)
+    fused_insights = run_generation(llm, FusedInsights, fused_prompt)
+    return fused_insights
+
+def iter_repo_insights(username: str, github_token: str, model, tokenizer, repo_data: Optional[Dict[str, Any]] = None, llm=None, mode: str = "chained") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Run the analysis, yielding `(section, data)` as each insight tier completes.
+
+    Chained mode yields surface_insights, intermediate_insights, deep_insights and
+    narrative_summary in turn; fused mode yields them together once its single pass is
+    done. The last item is always `("repo_analysis", ...)` with the `analyze_repo` result.
+    `llm` is an `InferenceBackend` (GPU or CPU) or a scheduler over one; without it the
+    Transformers `model` and `tokenizer` are wrapped in a `TransformersBackend`.
+    `repo_data` that already carries the derived metrics, from one
+    `compute_derived_metrics` call over many repositories, is used as is.
+    """
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"mode must be one of {ANALYSIS_MODES}")
     try:
-        repo_data = fetch_repo_data(username, github_token)
-        logger.info(f"Fetched repo data: {json.dumps(repo_data, indent=2)}")
+        # Reuse metrics already fetched by the caller's GitHubGateway when provided
+        if repo_data is None:
+            repo_data = fetch_repo_data(username, github_token)
+        # Arithmetic is done here, so the model only writes the free-text fields
+        if "forks_to_stars_ratio" not in repo_data:
+            repo_data = {**repo_data, **compute_derived_metrics([repo_data])[0]}
+        log_payload(logger, "Fetched repo data", repo_data)
 
-        llm = models.Transformers(model, tokenizer)
+        if llm is None:
+            llm = TransformersBackend(model, tokenizer)
 
-        surface_insights = generate_surface_insights(llm, repo_data)
-        surface_insights_dict = surface_insights.dict()
-        logger.info(f"Surface insights: {surface_insights_dict}")
+        if mode == "fused":
+            # One constrained generation for all tiers; trades some depth for throughput
+            fused_insights = generate_fused_insights(llm, repo_data)
+            deep_insights_dict = fused_insights.deep.dict()
+            narrative_summary = fused_insights.narrative
+            log_payload(logger, "Fused insights", fused_insights.dict())
+            yield "surface_insights", fused_insights.surface.dict()
+            yield "intermediate_insights", fused_insights.intermediate.dict()
+            yield "deep_insights", deep_insights_dict
+            yield "narrative_summary", narrative_summary.dict()
+        else:
+            surface_insights = generate_surface_insights(llm, repo_data)
+            surface_insights_dict = surface_insights.dict()
+            log_payload(logger, "Surface insights", surface_insights_dict)
+            yield "surface_insights", surface_insights_dict
 
-        intermediate_insights = generate_intermediate_insights(llm, repo_data, surface_insights)
-        intermediate_insights_dict = intermediate_insights.dict()
-        logger.info(f"Intermediate insights: {intermediate_insights_dict}")
+            intermediate_insights = generate_intermediate_insights(llm, repo_data, surface_insights)
+            intermediate_insights_dict = intermediate_insights.dict()
+            log_payload(logger, "Intermediate insights", intermediate_insights_dict)
+            yield "intermediate_insights", intermediate_insights_dict
 
-        deep_insights = generate_deep_insights(llm, repo_data, surface_insights, intermediate_insights)
-        deep_insights_dict = deep_insights.dict()
-        logger.info(f"Deep insights: {deep_insights_dict}")
+            deep_insights = generate_deep_insights(llm, repo_data, surface_insights, intermediate_insights)
+            deep_insights_dict = deep_insights.dict()
+            log_payload(logger, "Deep insights", deep_insights_dict)
+            yield "deep_insights", deep_insights_dict
 
-        narrative_summary = generate_narrative_summary(llm, repo_data, surface_insights, intermediate_insights, deep_insights)
-        logger.info(f"Narrative summary: {narrative_summary}")
+            narrative_summary = generate_narrative_summary(llm, repo_data, surface_insights, intermediate_insights, deep_insights)
+            log_payload(logger, "Narrative summary", narrative_summary.dict())
+            yield "narrative_summary", narrative_summary.dict()
 
-        return {
+        yield "repo_analysis", {
             "repo_name": repo_data['repo_name'],
             "stars": repo_data['stars'],
             "forks": repo_data['forks'],
             "open_issues": repo_data['open_issues'],
             "watchers": repo_data['watchers'],
+            "forks_to_stars_ratio": repo_data['forks_to_stars_ratio'],
+            "issues_resolution_rate": repo_data['issues_resolution_rate'],
             "overall_score": deep_insights_dict['overall_score'],
             "narrative": narrative_summary.summary
         }
     except Exception as e:
         logger.error(f"Error in analyze_repo: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def analyze_repo(username: str, github_token: str, model, tokenizer, repo_data: Optional[Dict[str, Any]] = None, llm=None, mode: str = "chained") -> dict:
+    for section, data in iter_repo_insights(username, github_token, model, tokenizer, repo_data=repo_data, llm=llm, mode=mode):
+        if section == "repo_analysis":
+            return data
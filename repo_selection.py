@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import logging
+from itertools import count
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+
+from github_gateway import REPOSITORY_FRAGMENT
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Only the fields needed to filter and rank; the heavy history is fetched later, and
+# only for the repositories that make the cut.
+REPOSITORY_PAGE_QUERY = """
+query ($username: String!, $pageSize: Int!, $cursor: String) {
+  user(login: $username) {
+    login
+    avatarUrl
+    createdAt
+    bio
+    followers {
+      totalCount
+    }
+    following {
+      totalCount
+    }
+    repositories(first: $pageSize, after: $cursor, ownerAffiliations: OWNER, orderBy: {field: PUSHED_AT, direction: DESC}) {
+      totalCount
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        stargazerCount
+        forkCount
+        pushedAt
+        isArchived
+        isFork
+        defaultBranchRef {
+          target {
+            oid
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+REPOSITORY_DETAIL_QUERY = """
+query ($owner: String!, $name: String!, $withHistory: Boolean = true) {
+  repository(owner: $owner, name: $name) {
+    ...AnalysisRepository
+  }
+}
+""" + REPOSITORY_FRAGMENT
+
+SORT_KEYS = {
+    "stars": lambda repo: (repo["stargazerCount"], repo["forkCount"]),
+    "forks": lambda repo: (repo["forkCount"], repo["stargazerCount"]),
+    "pushed": lambda repo: (repo["pushedAt"] or "",),
+}
+
+async def iter_repositories(client, username: str, page_size: int = 100, profile: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield lightweight repository summaries page by page, following the cursor.
+
+    When `profile` is given it is filled with the user fields of the first page.
+    """
+    cursor = None
+    while True:
+        data = await client.graphql(REPOSITORY_PAGE_QUERY, {"username": username, "pageSize": page_size, "cursor": cursor})
+        user = data["data"]["user"]
+        if user is None:
+            raise ValueError(f"GitHub user {username} not found.")
+        repositories = user.pop("repositories")
+        if profile is not None and not profile:
+            profile.update(user)
+        for repo in repositories["nodes"]:
+            yield repo
+        if not repositories["pageInfo"]["hasNextPage"]:
+            break
+        cursor = repositories["pageInfo"]["endCursor"]
+
+def rank_key(repo: Dict[str, Any], sort_by: str) -> Tuple:
+    # Archived repositories rank after active ones whatever the metric
+    return (not repo["isArchived"],) + SORT_KEYS[sort_by](repo)
+
+async def select_repositories(
+    client,
+    username: str,
+    top_n: int = 5,
+    sort_by: str = "stars",
+    include_archived: bool = False,
+    include_forks: bool = False,
+    page_size: int = 100
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int]:
+    """Stream through every repository and keep only the best `top_n`.
+
+    Memory stays O(top_n) however many repositories the user owns. Returns the user
+    profile, the selected summaries (best first) and the number of repositories scanned.
+    """
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by must be one of {sorted(SORT_KEYS)}")
+
+    profile: Dict[str, Any] = {}
+    heap: List[Tuple[Tuple, int, Dict[str, Any]]] = []
+    tiebreak = count()
+    scanned = 0
+
+    async for repo in iter_repositories(client, username, page_size=page_size, profile=profile):
+        scanned += 1
+        if repo["isArchived"] and not include_archived:
+            continue
+        if repo["isFork"] and not include_forks:
+            continue
+        # Negated counter: among equal keys the earlier (more recently pushed) repo wins
+        item = (rank_key(repo, sort_by), -next(tiebreak), repo)
+        if len(heap) < top_n:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    selected = [repo for _, _, repo in sorted(heap, reverse=True)]
+    logger.info(f"Selected {len(selected)} of {scanned} repositories for {username}")
+    return profile, selected, scanned
+
+async def fetch_repository_async(client, owner: str, name: str, with_history: bool = True) -> Dict[str, Any]:
+    data = await client.graphql(REPOSITORY_DETAIL_QUERY, {"owner": owner, "name": name, "withHistory": with_history})
+    return data["data"]["repository"]
+
+def aggregate_repo_results(results: List[Dict[str, Any]], scanned: int) -> Dict[str, Any]:
+    """Roll per-repository results up into user-level totals."""
+    analyzed = [result for result in results if "error" not in result]
+    scores = [result["repo_analysis"]["overall_score"] for result in analyzed]
+    stars = [result["repo_analysis"]["stars"] for result in analyzed]
+    languages: Dict[str, int] = {}
+    for result in analyzed:
+        language = result["primary_language"]
+        languages[language] = languages.get(language, 0) + 1
+
+    return {
+        "repos_scanned": scanned,
+        "repos_analyzed": len(analyzed),
+        "repos_failed": len(results) - len(analyzed),
+        "total_stars": sum(stars),
+        "total_forks": sum(result["repo_analysis"]["forks"] for result in analyzed),
+        "total_commits": sum(result["commit_count"] for result in analyzed),
+        "average_score": sum(scores) / len(scores) if scores else 0,
+        # Popular repositories weigh more in the user's overall score
+        "star_weighted_score": sum(s * (w + 1) for s, w in zip(scores, stars)) / sum(w + 1 for w in stars) if scores else 0,
+        "languages": languages,
+    }
+
+async def gather_bounded(coroutines: List, max_parallel: int) -> List[Any]:
+    """`asyncio.gather` with at most `max_parallel` coroutines in flight."""
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from telemetry import CACHE_EVENTS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Container-local: SQLite in WAL mode is not safe on the shared network volume, and a
+# volume only shows other containers' writes after a commit and reload
+DEFAULT_STORE_DIR = os.path.expanduser("~/.cache/repo-analyzer")
+DEFAULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", os.path.join(DEFAULT_STORE_DIR, "analysis_results.sqlite"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", 512 * 1024 * 1024))
+# Followers, bio and avatar change independently of any commit, so they expire on their own
+DEFAULT_PROFILE_TTL_SECONDS = int(os.getenv("RESULT_STORE_PROFILE_TTL", 6 * 3600))
+
+# Bump when the shape of stored results changes, so older payloads are not served.
+# v3: `readme_analysis` is the raw README text again, and the structured extraction
+# is under `readme_summary`
+RESULT_VERSION = 3
+
+# Top-level profile fields refreshed on cached results once the stored profile expires
+PROFILE_FIELDS = ("login", "avatarUrl", "createdAt", "bio", "followers", "following")
+
+HEAD_QUERY = """
+query ($username: String!, $withProfile: Boolean!) {
+  user(login: $username) {
+    login @include(if: $withProfile)
+    avatarUrl @include(if: $withProfile)
+    createdAt @include(if: $withProfile)
+    bio @include(if: $withProfile)
+    followers @include(if: $withProfile) {
+      totalCount
+    }
+    following @include(if: $withProfile) {
+      totalCount
+    }
+    repositories(first: 1, orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes {
+        name
+        defaultBranchRef {
+          target {
+            oid
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+async def fetch_head_async(client, username: str, with_profile: bool) -> Dict[str, Any]:
+    """One cheap query for the analyzed repository's HEAD oid (and the profile, if stale)."""
+    # Never from the HTTP cache: a HEAD even minutes old would serve the previous commit's analysis
+    data = await client.graphql(HEAD_QUERY, {"username": username, "withProfile": with_profile}, use_cache=False)
+    user = data["data"]["user"]
+    if user is None:
+        raise ValueError(f"GitHub user {username} not found.")
+    nodes = user.pop("repositories")["nodes"]
+    if not nodes:
+        raise ValueError("No repositories found for the given user.")
+    repo = nodes[0]
+    return {
+        "repo": repo["name"],
+        "head_oid": repo["defaultBranchRef"]["target"]["oid"] if repo["defaultBranchRef"] else "",
+        "profile": user if with_profile else None
+    }
+
+# The persistent counters mirrored into the process metrics
+COUNTER_EVENTS = {
+    "hits": {"cache": "result", "event": "hit"},
+    "misses": {"cache": "result", "event": "miss"},
+    "evictions": {"cache": "result", "event": "eviction"},
+    "readme_hits": {"cache": "readme", "event": "hit"},
+    "readme_misses": {"cache": "readme", "event": "miss"},
+}
+
+class ResultStore:
+    """SQLite store of finished analyses keyed by (username, repo, HEAD oid, mode).
+
+    A new commit gives a new key, so cached results never need invalidating; stale ones
+    simply age out of the size-bounded LRU, which README extractions (keyed by blob
+    hash) share. Profiles are stored separately with a TTL.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_bytes: int = DEFAULT_MAX_BYTES, profile_ttl_seconds: int = DEFAULT_PROFILE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.profile_ttl_seconds = profile_ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    username TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    head_oid TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (username, repo, head_oid, mode)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    username TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # README extractions, shared by every user and repo with the same README blob.
+            # Stores from before they counted towards `max_bytes` are dropped: it is a cache
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(readme_extractions)")]
+            if columns and "size" not in columns:
+                conn.execute("DROP TABLE readme_extractions")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS readme_extractions (
+                    blob_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS readme_extractions_last_access ON readme_extractions (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, conn: sqlite3.Connection, name: str) -> None:
+        CACHE_EVENTS.inc(**COUNTER_EVENTS[name])
+        conn.execute(
+            "INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def get(self, username: str, repo: str, head_oid: str, mode: str) -> Optional[Dict[str, Any]]:
+        key = (username.lower(), repo, head_oid, f"{mode}@v{RESULT_VERSION}")
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM results WHERE username = ? AND repo = ? AND head_oid = ? AND mode = ?", key
+            ).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute(
+                "UPDATE results SET last_access = ? WHERE username = ? AND repo = ? AND head_oid = ? AND mode = ?",
+                (time.time(),) + key
+            )
+            self._count(conn, "hits")
+        return json.loads(row[0])
+
+    def put(self, username: str, repo: str, head_oid: str, mode: str, result: Dict[str, Any]) -> None:
+        payload = json.dumps(result)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (username.lower(), repo, head_oid, f"{mode}@v{RESULT_VERSION}", payload, len(payload), now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Results and README extractions share the byte budget
+        total = conn.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM results) + (SELECT COALESCE(SUM(size), 0) FROM readme_extractions)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries of either kind until the store fits again
+        entries = conn.execute("""
+            SELECT 'results', rowid, size, last_access FROM results
+            UNION ALL
+            SELECT 'readme_extractions', rowid, size, last_access FROM readme_extractions
+            ORDER BY last_access
+        """).fetchall()
+        for table, rowid, size, _ in entries:
+            conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+            self._count(conn, "evictions")
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def get_profile(self, username: str) -> Optional[Dict[str, Any]]:
+        """Return the stored profile, or None once it is older than the profile TTL."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT payload, fetched_at FROM profiles WHERE username = ?", (username.lower(),)).fetchone()
+        if row is None or time.time() - row[1] > self.profile_ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def put_profile(self, username: str, profile: Dict[str, Any]) -> None:
+        fields = {field: profile[field] for field in PROFILE_FIELDS if field in profile}
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)",
+                (username.lower(), json.dumps(fields), time.time())
+            )
+
+    def get_readme(self, blob_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT payload FROM readme_extractions WHERE blob_key = ?", (blob_key,)).fetchone()
+            self._count(conn, "readme_hits" if row is not None else "readme_misses")
+            if row is not None:
+                conn.execute("UPDATE readme_extractions SET last_access = ? WHERE blob_key = ?", (time.time(), blob_key))
+        return json.loads(row[0]) if row is not None else None
+
+    def put_readme(self, blob_key: str, extraction: Dict[str, Any]) -> None:
+        payload = json.dumps(extraction)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO readme_extractions VALUES (?, ?, ?, ?, ?)",
+                (blob_key, payload, len(payload), now, now)
+            )
+            self._evict(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock, self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            readme_entries, readme_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM readme_extractions").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "readme_hits": counters.get("readme_hits", 0),
+            "readme_misses": counters.get("readme_misses", 0),
+            "entries": entries,
+            "readme_entries": readme_entries,
+            "bytes": size + readme_size
+        }
@@ -0,0 +1,336 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Spans are appended here as JSON lines when set; TRACE_SAMPLE_RATE picks the traces kept
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+# Share of whole prompts and outputs logged at INFO; they are always logged at DEBUG
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", 0.0))
+
+# Seconds; GitHub calls and aggregation steps sit at the low end, generations at the top
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class MetricFamily:
+    """One Prometheus metric and its labelled series, updated under the registry lock."""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, kind: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = ()):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> value, or for histograms [count per bucket..., sum, count]
+        self.series: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def set(self, value: float, **labels) -> None:
+        """Gauges, and counters mirrored from totals kept elsewhere."""
+        with self.registry.lock:
+            self.series[self._key(labels)] = value
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            state = self.series.get(key)
+            if state is None:
+                state = self.series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+class MetricsRegistry:
+    """Process-local counters, gauges and histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families: Dict[str, MetricFamily] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _family(self, name: str, kind: str, help: str, labelnames: Sequence[str], buckets: Sequence[float] = ()) -> MetricFamily:
+        with self.lock:
+            if name not in self.families:
+                self.families[name] = MetricFamily(self, name, kind, help, labelnames, buckets)
+            return self.families[name]
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, "counter", help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, "gauge", help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> MetricFamily:
+        return self._family(name, "histogram", help, labelnames, buckets)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Run `collector` before every snapshot, to refresh values read from elsewhere (GPU memory, cache stats)."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """A picklable copy of every family, for rendering here or in another container."""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        with self.lock:
+            return {
+                name: {
+                    "kind": family.kind,
+                    "help": family.help,
+                    "labelnames": family.labelnames,
+                    "buckets": family.buckets,
+                    "series": {key: list(value) if isinstance(value, list) else value for key, value in family.series.items()}
+                }
+                for name, family in self.families.items()
+            }
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_prometheus(sources: List[Tuple[Dict[str, str], Dict[str, Any]]]) -> str:
+    """Render snapshots from several processes as one exposition.
+
+    Each source is `(constant labels, snapshot)`; the constant labels (e.g. the process
+    and container) keep the same metric from different processes apart.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for constant_labels, snapshot in sources:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {**family, "rows": []})
+            for key, value in family["series"].items():
+                target["rows"].append((tuple(constant_labels) + tuple(family["labelnames"]), tuple(constant_labels.values()) + tuple(key), value))
+
+    lines = []
+    for name, family in sorted(merged.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for names, values, value in family["rows"]:
+            if family["kind"] != "histogram":
+                lines.append(f"{name}{_label_text(names, values)} {value}")
+                continue
+            # Bucket counts are already cumulative; +Inf is the total count
+            for bound, count in zip(list(family["buckets"]) + ["+Inf"], value[:-2] + [value[-1]]):
+                lines.append(f"{name}_bucket{_label_text(names + ('le',), values + (str(bound),))} {count}")
+            lines.append(f"{name}_sum{_label_text(names, values)} {value[-2]}")
+            lines.append(f"{name}_count{_label_text(names, values)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram("analyzer_stage_seconds", "Wall time of each pipeline stage.", ("stage",))
+STAGE_ERRORS = METRICS.counter("analyzer_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+GITHUB_REQUESTS = METRICS.counter("analyzer_github_requests_total", "GitHub API requests by API and HTTP status.", ("api", "status"))
+GITHUB_RATE_LIMIT_REMAINING = METRICS.gauge("analyzer_github_rate_limit_remaining", "Requests (REST) or points (GraphQL) left in the current window.", ("resource",))
+GITHUB_RATE_LIMIT_LIMIT = METRICS.gauge("analyzer_github_rate_limit_limit", "Size of the current GitHub rate-limit window.", ("resource",))
+GITHUB_RATE_LIMIT_RESET = METRICS.gauge("analyzer_github_rate_limit_reset_timestamp", "Unix time the GitHub rate-limit window resets.", ("resource",))
+GITHUB_QUEUE_SECONDS = METRICS.histogram("analyzer_github_queue_seconds", "Time GitHub requests waited for a token with budget.", ("resource", "priority"))
+GITHUB_RATE_LIMITED = METRICS.counter("analyzer_github_rate_limited_total", "GitHub responses refused by a primary or secondary rate limit.", ("resource",))
+CACHE_EVENTS = METRICS.counter("analyzer_cache_events_total", "Cache lookups by cache and outcome (hit, miss, revalidated, eviction).", ("cache", "event"))
+LLM_PROMPT_TOKENS = METRICS.counter("analyzer_llm_prompt_tokens_total", "Prompt tokens sent to the model.", ("schema",))
+LLM_COMPLETION_TOKENS = METRICS.counter("analyzer_llm_completion_tokens_total", "Tokens generated by the model.", ("schema",))
+LLM_BATCH_SECONDS = METRICS.histogram("analyzer_llm_batch_seconds", "Wall time of one generation batch.", ("schema",))
+LLM_BATCH_SIZE = METRICS.histogram("analyzer_llm_batch_size", "Prompts per generation batch.", ("schema",), buckets=(1, 2, 4, 8, 16, 32))
+LLM_TOKENS_PER_SECOND = METRICS.gauge("analyzer_llm_tokens_per_second", "Generated tokens per second of the latest batch.", ("schema",))
+GPU_MEMORY_BYTES = METRICS.gauge("analyzer_gpu_memory_bytes", "CUDA memory of the inference process.", ("device", "kind"))
+
+def record_rate_limit(headers, api: str, status: int) -> None:
+    """Count a GitHub response and keep the headroom its X-RateLimit headers report."""
+    GITHUB_REQUESTS.inc(api=api, status=status)
+    # GitHub sends these lowercase; plain dicts of headers compare case-sensitively
+    headers = {name.lower(): value for name, value in headers.items()}
+    remaining = headers.get("x-ratelimit-remaining")
+    if remaining is None:
+        return
+    resource = headers.get("x-ratelimit-resource", api)
+    GITHUB_RATE_LIMIT_REMAINING.set(int(remaining), resource=resource)
+    if "x-ratelimit-limit" in headers:
+        GITHUB_RATE_LIMIT_LIMIT.set(int(headers["x-ratelimit-limit"]), resource=resource)
+    if "x-ratelimit-reset" in headers:
+        GITHUB_RATE_LIMIT_RESET.set(int(headers["x-ratelimit-reset"]), resource=resource)
+
+def record_generation(schema: str, prompt_tokens: int, completion_tokens: int, batch_size: int, seconds: float) -> None:
+    LLM_PROMPT_TOKENS.inc(prompt_tokens, schema=schema)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens, schema=schema)
+    LLM_BATCH_SECONDS.observe(seconds, schema=schema)
+    LLM_BATCH_SIZE.observe(batch_size, schema=schema)
+    if seconds > 0:
+        LLM_TOKENS_PER_SECOND.set(round(completion_tokens / seconds, 1), schema=schema)
+
+def collect_gpu_memory() -> None:
+    """Collector for the inference container; a no-op where torch was never imported."""
+    import sys
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return
+    for device in range(torch.cuda.device_count()):
+        GPU_MEMORY_BYTES.set(torch.cuda.memory_allocated(device), device=device, kind="allocated")
+        GPU_MEMORY_BYTES.set(torch.cuda.memory_reserved(device), device=device, kind="reserved")
+        GPU_MEMORY_BYTES.set(torch.cuda.max_memory_allocated(device), device=device, kind="max_allocated")
+
+class TraceExporter:
+    """Append finished spans to a JSON-lines file, one object per span."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+_exporter: Optional[TraceExporter] = TraceExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+# (trace id, span id, sampled) of the innermost open span; copied into asyncio.to_thread
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+def set_trace_exporter(exporter: Optional[TraceExporter]) -> None:
+    global _exporter
+    _exporter = exporter
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """Time a stage into `analyzer_stage_seconds` and, when tracing, export it as a span.
+
+    Yields the span's attribute dict, so callers can attach results (counts, sizes)
+    known only once the stage is done.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        trace_id, parent_id = uuid.uuid4().hex, None
+        sampled = _exporter is not None and random.random() < TRACE_SAMPLE_RATE
+    else:
+        trace_id, parent_id, sampled = parent[0], parent[1], parent[2]
+    span_id = uuid.uuid4().hex[:16]
+    token = _current_span.set((trace_id, span_id, sampled))
+    started_at = time.time()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        STAGE_SECONDS.observe(duration, stage=name)
+        if sampled and _exporter is not None:
+            _exporter.export({
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start": started_at,
+                "duration_ms": round(duration * 1000, 3),
+                "error": error,
+                "attributes": attributes
+            })
+
+def traced(name: str) -> Callable:
+    """Decorator form of `span` for plain and async functions."""
+    def decorate(fn: Callable) -> Callable:
+        import asyncio
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def log_payload(log: logging.Logger, message: str, payload: Any) -> None:
+    """Log a whole prompt or result at DEBUG, or at INFO for a sampled share of calls.
+
+    The payload is only serialized when it will actually be written.
+    """
+    if log.isEnabledFor(logging.DEBUG):
+        level = logging.DEBUG
+    elif PAYLOAD_LOG_SAMPLE_RATE > 0 and random.random() < PAYLOAD_LOG_SAMPLE_RATE and log.isEnabledFor(logging.INFO):
+        level = logging.INFO
+    else:
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, indent=2, default=str)
+    log.log(level, f"{message}: {text}")
+
+# Inference containers publish their snapshots into a shared key-value backend (normally
+# a `modal.Dict`), which the web tier reads when scraped, so a scrape never wakes a GPU
+METRICS_INSTANCES_KEY = "instances"
+METRICS_PUBLISH_SECONDS = 15
+# Snapshots of containers that stopped publishing this long ago are dropped from scrapes
+METRICS_STALE_SECONDS = 600
+
+def _prune_instances(backend, instances: List[str], stale: List[str]) -> List[str]:
+    """Delete the snapshots of `stale` instances; returns the instances left."""
+    for instance in stale:
+        try:
+            del backend[f"snapshot:{instance}"]
+        except KeyError:
+            # Already deleted by another reader
+            pass
+    return [instance for instance in instances if instance not in stale]
+
+def _is_stale(entry: Optional[Dict[str, Any]], now: float, max_age: float) -> bool:
+    return entry is None or now - entry["updated_at"] > max_age
+
+def publish_snapshot(backend, instance: str, snapshot: Dict[str, Any], max_age: float = METRICS_STALE_SECONDS) -> None:
+    instances = list(backend.get(METRICS_INSTANCES_KEY, []))
+    now = time.time()
+    backend[f"snapshot:{instance}"] = {"updated_at": now, "snapshot": snapshot}
+    if instance not in instances:
+        # A new container is the moment to forget the ones that stopped publishing
+        stale = [other for other in instances if _is_stale(backend.get(f"snapshot:{other}"), now, max_age)]
+        # Racing containers can drop each other here; both re-add themselves next time
+        backend[METRICS_INSTANCES_KEY] = _prune_instances(backend, instances, stale) + [instance]
+
+def published_snapshots(backend, max_age: float = METRICS_STALE_SECONDS) -> List[Tuple[str, Dict[str, Any]]]:
+    """`(instance, snapshot)` for every container that published within `max_age` seconds.
+
+    Older instances are deleted from the backend as they are found.
+    """
+    now = time.time()
+    instances = list(backend.get(METRICS_INSTANCES_KEY, []))
+    snapshots = []
+    stale = []
+    for instance in instances:
+        entry = backend.get(f"snapshot:{instance}")
+        if _is_stale(entry, now, max_age):
+            stale.append(instance)
+        else:
+            snapshots.append((instance, entry["snapshot"]))
+    if stale:
+        backend[METRICS_INSTANCES_KEY] = _prune_instances(backend, instances, stale)
+    return snapshots